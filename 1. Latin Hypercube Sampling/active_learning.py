@@ -0,0 +1,194 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from scipy.stats import qmc
+from sklearn.metrics import r2_score
+
+# The homogenization driver and the surrogate models live in the other project folders
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "2. Homogenization Scripts"))
+sys.path.insert(0, os.path.join(HERE, "..", "3. ANN , Plots & API"))
+import Fullscript
+from solver_cache import SolverCache
+from FinalANN import FEATURES, custom_scale, training_callbacks, build_k11_model, build_k33_model
+
+# Fullscript homogenizes a plain weave: (p, t, h) one-hot columns of data.csv
+PLAIN_WEAVE = (1, 0, 0)
+TARGETS = ['k11', 'k33']
+
+
+# Sequential design
+# -----------------
+# Instead of a fixed 8000 point Latin hypercube, the design starts from a small LHS seed
+# and grows in batches. Every round an ensemble of FinalANN models (bootstrap resamples
+# of the solved points) is trained, a fresh LHS of candidates is scored by how much the
+# ensemble members disagree, and the most disputed candidates are homogenized next.
+# The loop stops once the ensemble reaches the target R^2 on a fixed LHS validation set
+# or the sample budget is used up.
+#
+# All solved points are appended to the design CSV (data.csv columns plus 'set' and
+# 'round'), so an interrupted run resumes where it stopped and the file can be handed
+# to FinalANN as is.
+
+# Function to draw n points of a Latin hypercube in the unit cube (vf, width, thickness)
+def lhs_points(n, seed):
+    return qmc.LatinHypercube(d=3, seed=seed).random(n=n)
+
+# Function to add the weave columns to unit cube points
+def design_features(points):
+    return np.hstack([points, np.tile(PLAIN_WEAVE, (len(points), 1))]).astype(float)
+
+# Function to homogenize unit cube points and return the solved rows in data.csv format.
+# Points whose homogenization failed are dropped.
+def solve_points(points, n_workers=1, **row_options):
+    features = design_features(points)
+    physical = custom_scale(features)
+    df = pd.DataFrame(physical[:, :3], columns=['Vf', 'Width to Spacing', 'Thickness to Spacing'])
+
+    solved = pd.DataFrame(features, columns=FEATURES)
+    solved['k11'] = np.nan
+    solved['k33'] = np.nan
+    for index, k11, k33 in Fullscript.run_rows(df, n_workers, **row_options):
+        if k11 is not None and k33 is not None:
+            solved.loc[index, 'k11'] = k11
+            solved.loc[index, 'k33'] = k33
+    n_failed = int(solved['k11'].isna().sum())
+    if n_failed:
+        print(f"{n_failed} of {len(solved)} points failed and are left out of the design")
+    return solved.dropna(subset=TARGETS)
+
+# Function to append solved rows to the design file
+def append_design(design_file, solved, set_name, round_no):
+    solved = solved.assign(set=set_name, round=round_no)
+    columns = ['vf', 'width', 'thickness', 'k11', 'k33', 'p', 't', 'h', 'set', 'round']
+    write_header = not os.path.exists(design_file)
+    solved[columns].to_csv(design_file, mode='a', header=write_header, index=False)
+
+# Function to train an ensemble of FinalANN k11/k33 models on bootstrap resamples.
+# Each member uses the points left out of its resample for early stopping.
+def train_ensemble(train, n_members=5, epochs=150, seed=0):
+    X = custom_scale(train[FEATURES].values.astype(float))
+    y = train[TARGETS].values.astype(float)
+    rng = np.random.default_rng(seed)
+    members = []
+    for m in range(n_members):
+        tf.keras.utils.set_random_seed(seed + m)
+        sample = rng.integers(0, len(X), len(X))
+        held_out = np.setdiff1d(np.arange(len(X)), sample)
+        if len(held_out) == 0:
+            held_out = sample
+        models = []
+        for j, build in enumerate((build_k11_model, build_k33_model)):
+            model = build()
+            model.fit(X[sample], y[sample, j], epochs=epochs, batch_size=64,
+                      validation_data=(X[held_out], y[held_out, j]),
+                      callbacks=list(training_callbacks()), verbose=0)
+            models.append(model)
+        members.append(models)
+    return members
+
+# Function to predict (k11, k33) with every member; returns (n_members, n_points, 2)
+def ensemble_predict(members, points):
+    X = custom_scale(design_features(points))
+    return np.stack([np.column_stack([model.predict(X, verbose=0).ravel() for model in models])
+                     for models in members])
+
+# Disagreement of the ensemble: std over the members relative to the mean, worst of k11/k33
+def disagreement(predictions):
+    mean = np.abs(predictions.mean(axis=0))
+    return np.max(predictions.std(axis=0) / np.maximum(mean, 1e-12), axis=1)
+
+# Function to pick the batch_size highest scoring candidates, skipping candidates closer
+# than min_distance to an already picked one so a batch does not pile up in one spot
+def select_batch(candidates, scores, batch_size, min_distance):
+    chosen = []
+    for i in np.argsort(scores)[::-1]:
+        if chosen and np.min(np.linalg.norm(candidates[chosen] - candidates[i], axis=1)) < min_distance:
+            continue
+        chosen.append(i)
+        if len(chosen) == batch_size:
+            break
+    return candidates[chosen]
+
+# Function to score the ensemble mean on the validation set; returns the R^2 of k11 and k33
+def validation_r2(members, validation):
+    mean = ensemble_predict(members, validation[['vf', 'width', 'thickness']].values).mean(axis=0)
+    return [r2_score(validation[target].values, mean[:, j]) for j, target in enumerate(TARGETS)]
+
+def run(design_file, n_seed=200, n_validation=200, batch_size=100, n_candidates=5000,
+        max_samples=8000, target_r2=0.99, n_members=5, epochs=150, min_distance=None,
+        seed=0, n_workers=1, **row_options):
+    if min_distance is None:
+        min_distance = 0.5 * batch_size ** (-1.0 / 3.0)
+
+    # Seed design and validation set (skipped when resuming)
+    sets = set(pd.read_csv(design_file)['set']) if os.path.exists(design_file) else set()
+    if "train" not in sets:
+        print(f"Solving the LHS seed ({n_seed} points)")
+        append_design(design_file, solve_points(lhs_points(n_seed, seed), n_workers, **row_options), "train", 0)
+    if "validation" not in sets:
+        print(f"Solving the LHS validation set ({n_validation} points)")
+        append_design(design_file, solve_points(lhs_points(n_validation, seed + 1), n_workers, **row_options),
+                      "validation", 0)
+
+    while True:
+        design = pd.read_csv(design_file)
+        train = design[design['set'] == 'train']
+        validation = design[design['set'] == 'validation']
+        round_no = int(design['round'].max()) + 1
+
+        members = train_ensemble(train, n_members, epochs, seed + round_no)
+        r2 = validation_r2(members, validation)
+        print(f"Round {round_no}: {len(train)} training samples, "
+              f"validation R² k11={r2[0]:.4f}, k33={r2[1]:.4f}")
+        if min(r2) >= target_r2:
+            print(f"Target R² {target_r2} reached with {len(train)} training samples")
+            break
+        if len(train) >= max_samples:
+            print(f"Sample budget of {max_samples} used up before reaching R² {target_r2}")
+            break
+
+        candidates = lhs_points(n_candidates, seed + 1000 + round_no)
+        scores = disagreement(ensemble_predict(members, candidates))
+        batch = select_batch(candidates, scores, min(batch_size, max_samples - len(train)), min_distance)
+        print(f"Homogenizing {len(batch)} points (max disagreement {scores.max():.3E})")
+        append_design(design_file, solve_points(batch, n_workers, **row_options), "train", round_no)
+
+    print(f"Design saved in {design_file}")
+    return pd.read_csv(design_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Active-learning design of the homogenization samples")
+    parser.add_argument("--design", default="active_design.csv",
+                        help="CSV the solved samples are appended to; an existing file is resumed")
+    parser.add_argument("--seed-samples", type=int, default=200, help="Size of the initial LHS (default: 200)")
+    parser.add_argument("--validation-samples", type=int, default=200,
+                        help="Size of the LHS validation set (default: 200)")
+    parser.add_argument("--batch", type=int, default=100, help="Samples added per round (default: 100)")
+    parser.add_argument("--candidates", type=int, default=5000,
+                        help="LHS candidates scored per round (default: 5000)")
+    parser.add_argument("--max-samples", type=int, default=8000,
+                        help="Budget of training samples (default: 8000, the size of the fixed LHS)")
+    parser.add_argument("--target-r2", type=float, default=0.99,
+                        help="Stop once k11 and k33 reach this validation R² (default: 0.99)")
+    parser.add_argument("--members", type=int, default=5, help="Ensemble size (default: 5)")
+    parser.add_argument("--epochs", type=int, default=150, help="Maximum epochs per model (default: 150)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the design")
+    parser.add_argument("--workers", type=int, default=1, help="Rows homogenized in parallel (default: 1)")
+    parser.add_argument("--cache-dir", default="solver_cache", help="Solver result cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="Always run the external solvers")
+    parser.add_argument("--micro-table", default=None, help="Microscale table built with Fullscript.py")
+    args = parser.parse_args()
+
+    row_options = {}
+    if not args.no_cache:
+        row_options['cache'] = SolverCache(args.cache_dir)
+    if args.micro_table:
+        row_options['micro_table'] = Fullscript.load_micro_table(args.micro_table)
+    run(args.design, args.seed_samples, args.validation_samples, args.batch, args.candidates,
+        args.max_samples, args.target_r2, args.members, args.epochs, seed=args.seed,
+        n_workers=args.workers, **row_options)
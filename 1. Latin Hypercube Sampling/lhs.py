@@ -1,3 +1,4 @@
+import argparse
 import numpy as np
 import pandas as pd
 from scipy.stats import qmc
@@ -6,18 +7,48 @@ from scipy.stats import qmc
 num_samples = 8000
 num_dimensions = 3
 
-sampler = qmc.LatinHypercube(d=num_dimensions)
-lhs_samples = sampler.random(n=num_samples)
-
 # Continuous inputs: Vf, Wy/Sy, Ty/Sy
 param_lows = np.array([0, 0, 0])
 param_highs = np.array([1, 1, 1])
-scaled_samples = qmc.scale(lhs_samples, param_lows, param_highs)
 
-# Create DataFrame
-df = pd.DataFrame(scaled_samples, columns=['Vf', 'Width to Spacing', 'Thickness to Spacing'])
+# Physical ranges of the inputs (the same as FinalANN.custom_scale), as fed to the homogenization
+PHYSICAL_LOWS = np.array([0.2, 0.2, 0.008])
+PHYSICAL_HIGHS = np.array([0.8, 0.95, 0.5])
+
+# Samples drawn at a time by sample_stream
+CHUNK_SIZE = 10000
+
+
+# Function to stream a Latin hypercube design as (Vf, width, thickness, weave) tuples.
+# n_samples points are drawn per weave pattern, scaled to [lows, highs]. The design is
+# generated CHUNK_SIZE points at a time (each chunk is a Latin hypercube of its own), so
+# memory stays flat however large the campaign is. With the same seed the same tuples
+# come out in the same order.
+def sample_stream(n_samples=num_samples, seed=None, weaves=("plain",), lows=PHYSICAL_LOWS,
+                  highs=PHYSICAL_HIGHS, chunk_size=CHUNK_SIZE):
+    entropy = np.random.SeedSequence(seed).entropy
+    for chunk_no, start in enumerate(range(0, n_samples, chunk_size)):
+        n = min(chunk_size, n_samples - start)
+        for weave_no, weave in enumerate(weaves):
+            rng = np.random.default_rng(np.random.SeedSequence([entropy, weave_no, chunk_no]))
+            points = qmc.scale(qmc.LatinHypercube(d=num_dimensions, seed=rng).random(n=n), lows, highs)
+            for Vf, width, thickness in points.tolist():
+                yield Vf, width, thickness, weave
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latin hypercube sampling of the woven composite geometries")
+    parser.add_argument("--samples", type=int, default=num_samples, help="Samples per weave pattern (default: 8000)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed, for a reproducible design")
+    args = parser.parse_args()
+
+    scaled_samples = np.array([sample[:3] for sample in sample_stream(args.samples, args.seed,
+                                                                      lows=param_lows, highs=param_highs)])
+
+    # Create DataFrame
+    df = pd.DataFrame(scaled_samples, columns=['Vf', 'Width to Spacing', 'Thickness to Spacing'])
 
-# Save to CSV
-df.to_csv("Vf_data_updated.csv", index=False)
-print("File saved as Vf_data_updated.csv")
-print(df.head())
+    # Save to CSV
+    df.to_csv("Vf_data_updated.csv", index=False)
+    print("File saved as Vf_data_updated.csv")
+    print(df.head())
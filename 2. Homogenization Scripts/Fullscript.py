@@ -1,131 +1,160 @@
 import pandas as pd
+import numpy as np
 import math
 import os
-import subprocess
-from texgen_utils import create_weave_voxel_mesh
+import time
+import shutil
+import tempfile
+import argparse
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from statistics import median
+import sys
+try:
+    from texgen_utils import create_weave_voxel_mesh, create_plain_weave, weave_domain_box, voxel_point_information
+except ImportError:  # TexGen is only needed for voxelizer="texgen" and texgen_export
+    create_weave_voxel_mesh = create_plain_weave = weave_domain_box = voxel_point_information = None
+import Meso
+from sc_writer import write_rows
+from msh_reader import read_msh
+from micro_mesh import hex_cell_mesh
+from weave_voxels import weave_pattern, domain_box, voxel_yarns
+from solver_cache import SolverCache
+from result_journal import ResultJournal
+from micro_table import MicroTable
+from telemetry import SampleMetrics, MetricsLog, run_tool
+from functools import partial
+
+# The sampler lives in the Latin Hypercube Sampling folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1. Latin Hypercube Sampling"))
+from lhs import sample_stream
 import contextlib
 import io
 
+# Fixed voxel grid of the mesoscale model used before the resolution policy (meso_resolution)
+MESO_VOXELS = (40, 40, 20)
+
+# Scale factors of the voxel grids tried by a mesoscale convergence study (converge_meso)
+MESO_LADDER = (0.5, 0.75, 1.0, 1.5, 2.0)
+
+# How the yarn at each voxel centre is found: weave_voxels.voxel_yarns (all weaves in WEAVES)
+# or a TexGen point query (plain weave only)
+MESO_VOXELIZERS = ("numpy", "texgen")
+
+# Time budget in seconds of each external tool run (None: no limit). A run over budget
+# is killed and started again up to TOOL_RETRIES times before the row fails.
+TOOL_TIMEOUTS = {"gmsh": 600, "micro_swiftcomp": 1800, "meso_swiftcomp": 3600}
+TOOL_RETRIES = 1
+
+# Near the end of a parallel run, a row running longer than SPECULATE_AFTER times the
+# median row time gets a second copy on an idle worker; the first copy to finish is kept.
+SPECULATE_AFTER = 2.0
+
+# gmsh output options of the microscale mesh; the binary formats are read with NumPy
+GMSH_FORMATS = {
+    "ascii": ["-format", "msh2"],
+    "msh2": ["-format", "msh2", "-bin"],
+    "msh4": ["-format", "msh4", "-bin"],
+}
+
+# msh_format "structured" skips gmsh and meshes the cell in-process (micro_mesh.hex_cell_mesh)
+# with MICRO_MESH_DENSITY segments per 30 degrees of fiber surface
+STRUCTURED = "structured"
+MICRO_MESH_DENSITY = 4
+MICRO_MESH_ROUTES = sorted(GMSH_FORMATS) + [STRUCTURED]
+
+# Material blocks and SG volume closing every microscale .sc file.
+# They are part of the microscale cache key, so editing a constant here
+# invalidates the cached results.
+MICRO_MATERIALS = (
+    "1 1 1 \t # mat_type isotropy ntemp (This if for fiber)\n"
+    "0 0 # T and Rho\n"
+    "10.2 1.256 1.256 # k11 k22 k33\n\n"
+    "2 0 1 \t # mat_type isotropy ntemp (This if for matrix)\n"
+    "0 0 # T and Rho\n"
+    "0.180 #k\n\n"
+    "1.732 \t #Homogenized SG volume"
+)
+
 
 # Function to calculate Radius of Hex Packed cell
 def calculate_R(Vf):
     return math.sqrt(math.sqrt(3) * Vf / (2 * math.pi))
 
+# Function to read the effective conductivity matrix from a SwiftComp .k file
+def read_k_matrix(k_file):
+    with open(k_file, "r") as f:
+        lines = f.readlines()
+
+    stiffness_matrix = []
+    recording = False
+
+    for line in lines:
+        if "Effective Stiffness Matrix" in line:
+            recording = True
+            continue
+        elif "Effective Compliance Matrix" in line:
+            break
+
+        if recording and line.strip():
+            values = []
+            for part in line.split():
+                try:
+                    values.append(float(part))
+                except ValueError:
+                    continue
+            if values:
+                stiffness_matrix.append(values)
+
+    if len(stiffness_matrix) != 3 or any(len(row) != 3 for row in stiffness_matrix):
+        raise ValueError("Could not parse complete 3x3 stiffness matrix")
+
+    return stiffness_matrix
+
 # Function to extract k values
-def extract_k_values():
+def extract_k_values(k_file="Output.sc.k"):
     try:
-        with open("Output.sc.k", "r") as f:
-            lines = f.readlines()
-        
-        stiffness_matrix = []
-        recording = False
-        
-        for line in lines:
-            if "Effective Stiffness Matrix" in line:
-                recording = True
-                continue
-            elif "Effective Compliance Matrix" in line:
-                break
-                
-            if recording and line.strip():
-                values = []
-                for part in line.split():
-                    try:
-                        values.append(float(part))
-                    except ValueError:
-                        continue
-                if values:
-                    stiffness_matrix.append(values)
-        
-        if len(stiffness_matrix) != 3 or any(len(row) != 3 for row in stiffness_matrix):
-            raise ValueError("Could not parse complete 3x3 stiffness matrix")
-        
+        stiffness_matrix = read_k_matrix(k_file)
         return stiffness_matrix[0][0], stiffness_matrix[2][2]  # k11, k33
-        
+
     except Exception as e:
         print(f"Error extracting k values: {e}")
         return None, None
 
-# Function to read .msh file and create .sc file
-def create_sc_file(msh_file, sc_file):
-    def read_msh_file(msh_file):
-        nodes = []
-        elements = []
-        with open(msh_file, 'r') as file:
-            lines = file.readlines()
-            i = 0
-            while i < len(lines):
-                if lines[i].strip() == "$Nodes":
-                    i += 1
-                    n_node = int(lines[i].strip())
-                    i += 1
-                    for _ in range(n_node):
-                        node_info = lines[i].strip().split()
-                        nodes.append((int(node_info[0]), float(node_info[1]), float(node_info[2])))
-                        i += 1
-                elif lines[i].strip() == "$Elements":
-                    i += 1
-                    n_elem = int(lines[i].strip())
-                    i += 1
-                    for _ in range(n_elem):
-                        elem_info = lines[i].strip().split()
-                        if elem_info[1] == '2':  # 3-node triangle
-                            elements.append((int(elem_info[0]), int(elem_info[3]), int(elem_info[5]), int(elem_info[6]), int(elem_info[7]), 0, 0, 0, 0, 0, 0))
-                        elif elem_info[1] == '3':  # 4-node quadrilateral
-                            elements.append((int(elem_info[0]), int(elem_info[3]), int(elem_info[5]), int(elem_info[6]), int(elem_info[7]), int(elem_info[8]), 0, 0, 0, 0, 0))
-                        i += 1
-                else:
-                    i += 1
-        return nodes, elements, n_node, n_elem
+# Function to write the microscale .sc file from node and element arrays
+def write_micro_sc(sc_file, node_ids, coords, elements, n_node, n_elem):
+    with open(sc_file, 'w') as file:
+        file.write("2 0 0 0 \t # Analysis_type  elem_type trans_flag temp_flag\n\n")
+        file.write(f"2 {n_node} {n_elem} 2 0 0 \t # nSG nNode nElem nMat nSlave nLayer\n\n")
+
+        write_rows(file, "%s %s %s \t # node_no  x  y\n", [node_ids, coords])
+        file.write("\n")
+
+        write_rows(file, "%s %s %s %s %s %s %s %s %s %s %s\t # elem_no  mat_type  node1 node2  .... node 9\n",
+                   [elements])
+        file.write("\n")
+
+        file.write(MICRO_MATERIALS)
 
+# Function to read .msh file (ASCII or binary, msh2 or msh4) and create .sc file
+def create_sc_file(msh_file, sc_file):
     try:
-        nodes, elements, n_node, n_elem = read_msh_file(msh_file)
-        
-        with open(sc_file, 'w') as file:
-            file.write("2 0 0 0 \t # Analysis_type  elem_type trans_flag temp_flag\n\n")
-            file.write(f"2 {n_node} {n_elem} 2 0 0 \t # nSG nNode nElem nMat nSlave nLayer\n\n")
-            
-            for node in nodes:
-                file.write(f"{node[0]} {node[1]} {node[2]} \t # node_no  x  y\n")
-            file.write("\n")
-            
-            for elem in elements:
-                file.write(f"{elem[0]} {elem[1]} {elem[2]} {elem[3]} {elem[4]} {elem[5]} {elem[6]} {elem[7]} {elem[8]} {elem[9]} {elem[10]}\t # elem_no  mat_type  node1 node2  .... node 9\n")
-            file.write("\n")
-            
-            file.write("1 1 1 \t # mat_type isotropy ntemp (This if for fiber)\n")
-            file.write("0 0 # T and Rho\n")
-            file.write("10.2 1.256 1.256 # k11 k22 k33\n\n")
-            
-            file.write("2 0 1 \t # mat_type isotropy ntemp (This if for matrix)\n")
-            file.write("0 0 # T and Rho\n")
-            file.write("0.180 #k\n\n")
-
-            file.write("1.732 \t #Homogenized SG volume")
+        write_micro_sc(sc_file, *read_msh(msh_file))
 
     except Exception as e:
         print(f"An error occurred while writing the .sc file: {e}")
         raise
 
-# Processing of each row
-def process_row(row, index):
-    try:
-        Vf = row['Vf']
-        width_ratio = row['Width to Spacing']
-        thickness_ratio = row['Thickness to Spacing']
-        
-        print(f"\nProcessing Row {index + 1}: Vf={Vf}, Width={width_ratio}, Thickness={thickness_ratio}")
-
-        # Calculate R and generate .geo file
-        R = calculate_R(Vf)
-        sqrt3 = math.sqrt(3)
-        half_sqrt3 = sqrt3 / 2
-        half_sqrt3_minus_R = half_sqrt3 - R
-        neg_half_sqrt3_plus_R = -half_sqrt3 + R
+# Function to build the .geo file of the hex packed microscale cell
+def geo_text(Vf):
+    R = calculate_R(Vf)
+    sqrt3 = math.sqrt(3)
+    half_sqrt3 = sqrt3 / 2
+    half_sqrt3_minus_R = half_sqrt3 - R
+    neg_half_sqrt3_plus_R = -half_sqrt3 + R
 
-        # Write the .geo file
-        with open('Trial.geo', 'w') as file:
-            file.write(f"""// ##1, orthotropic material
+    return f"""// ##1, orthotropic material
 // Material name: 1 -- fiber
 Physical Point("1 1 1 0 0 10.2 1.256 1.256") = {{}}; 
 
@@ -217,45 +246,499 @@ Mesh.ColorCarousel = 2;
 
 Mesh.CharacteristicLengthFactor = 1; // Default is 1, lower values make finer mesh
 
-""")
+"""
+
+# Microscale step: fiber tow conductivity matrix for a given Vf.
+# The result only depends on the .geo file (or the structured mesh) and the material
+# constants, so it is looked up in the cache before meshing and running SwiftComp.
+# Stage timings, tool memory and file sizes are recorded in metrics (a SampleMetrics).
+# timeouts maps a tool stage to its time budget (default TOOL_TIMEOUTS).
+def run_micro(Vf, workdir=".", cache=None, msh_format="msh2", metrics=None, timeouts=None, retries=TOOL_RETRIES):
+    metrics = metrics or SampleMetrics()
+    timeouts = TOOL_TIMEOUTS if timeouts is None else timeouts
+    k_file = os.path.join(workdir, "Trial.sc.k")
+    if msh_format == STRUCTURED:
+        mesh_inputs = (STRUCTURED, repr(calculate_R(Vf)), str(MICRO_MESH_DENSITY))
+    else:
+        mesh_inputs = (geo_text(Vf),)
+
+    key = None
+    if cache is not None:
+        key = cache.make_key("micro", *mesh_inputs, MICRO_MATERIALS)
+        matrix = cache.get(key)
+        if matrix is not None:
+            metrics.mark("micro_source", "cache")
+            return matrix
+    metrics.mark("micro_source", "solver")
+
+    if msh_format == STRUCTURED:
+        # Mesh the cell in-process and write the .sc file from the arrays
+        with metrics.stage("micro_mesh"):
+            mesh = hex_cell_mesh(calculate_R(Vf), MICRO_MESH_DENSITY)
+        with metrics.stage("micro_sc"):
+            write_micro_sc(os.path.join(workdir, "Trial.sc"), *mesh)
+    else:
+        # Write the .geo file
+        geo_file = os.path.abspath(os.path.join(workdir, "Trial.geo"))
+        msh_file = os.path.abspath(os.path.join(workdir, "Trial.msh"))
+        with metrics.stage("geo_write"):
+            with open(geo_file, 'w') as file:
+                file.write(mesh_inputs[0])
+        metrics.file_size(geo_file)
 
         # Run GMSH
-        geo_file = os.path.abspath("Trial.geo")
-        msh_file = os.path.abspath("Trial.msh")
-        subprocess.run(["gmsh", "-2", geo_file, "-format", "msh", "-o", msh_file],check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        run_tool(["gmsh", "-2", geo_file, *GMSH_FORMATS[msh_format], "-o", msh_file], workdir, metrics, "gmsh",
+                 timeouts.get("gmsh"), retries)
+        metrics.file_size(msh_file)
 
         # Create .sc file
-        create_sc_file("Trial.msh", "Trial.sc")
-
-        # Run SwiftComp
-        subprocess.run(["Swiftcomp", "Trial.sc", "3D", "H"], 
-                      check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
+        with metrics.stage("micro_sc"):
+            create_sc_file(msh_file, os.path.join(workdir, "Trial.sc"))
+    metrics.file_size(os.path.join(workdir, "Trial.sc"))
+
+    # Run SwiftComp
+    run_tool(["Swiftcomp", "Trial.sc", "3D", "H"], workdir, metrics, "micro_swiftcomp",
+             timeouts.get("micro_swiftcomp"), retries)
+
+    with metrics.stage("k_extract"):
+        matrix = read_k_matrix(k_file)
+    if cache is not None:
+        cache.put(key, matrix)
+    return matrix
+
+# Function to choose the mesoscale voxel grid from the geometry ratios (spacing = 1, so the
+# unit cell of a weave with an n x n repeat spans n x n x thickness; n = 2 for the plain weave).
+# In-plane, the narrower of the yarn width and the gap between yarns gets at least
+# cells_per_feature voxels, and the yarn direction may turn by at most about max_turn_deg
+# across one voxel. The crimp curvature grows with the thickness, so thin laminates can be
+# coarse in-plane while thick ones need finer voxels.
+# Through the thickness each yarn layer (height thickness / 2) gets cells_per_layer voxels;
+# the whole cross-section scales with the thickness, so this count does not depend on it.
+# The in-plane count is rounded up to a multiple of 8 so that few distinct grids share the
+# cached voxel topologies.
+# in_plane_limits are given for the 2 x 2 cell and grow with the repeat.
+def meso_resolution(width_ratio, thickness_ratio, cells_per_feature=4, max_turn_deg=3.0,
+                    cells_per_layer=8, in_plane_limits=(16, 96), repeat=2):
+    feature = max(min(width_ratio, 1.0 - width_ratio), 1e-3)
+    n_feature = repeat * cells_per_feature / feature
+    curvature = math.pi ** 2 * thickness_ratio / 4  # largest d(angle)/dx of the crimped centre line
+    n_crimp = repeat * curvature / math.radians(max_turn_deg)
+    limits = [limit * repeat / 2 for limit in in_plane_limits]
+    n_xy = int(np.clip(8 * math.ceil(max(n_feature, n_crimp) / 8 - 1e-9), *limits))
+    return n_xy, n_xy, 2 * cells_per_layer
+
+# Function to scale a voxel grid, keeping even counts
+def scaled_voxels(voxels, factor):
+    return tuple(max(4, 2 * round(n * factor / 2)) for n in voxels)
+
+# Function to build the mesoscale voxel mesh of a weave (a name in weave_voxels.WEAVES).
+# The voxel connectivity only depends on the resolution and is cached by Meso.voxel_topology;
+# per sample, only the yarn (and orientation) at each voxel centre is computed, analytically
+# by weave_voxels.voxel_yarns or, with voxelizer="texgen", by querying TexGen.
+# With texgen_export=True the mesh goes through TexGen's .inp/.ori export instead.
+# The TexGen routes only model the plain weave. voxels = (nx, ny, nz) is the grid resolution.
+def build_meso_mesh(width_ratio, thickness_ratio, workdir=".", texgen_export=False, metrics=None,
+                    voxels=MESO_VOXELS, weave="plain", voxelizer="numpy"):
+    metrics = metrics or SampleMetrics()
+    if (texgen_export or voxelizer == "texgen") and str(weave).lower() != "plain":
+        raise ValueError(f"The TexGen mesh only models the plain weave, not '{weave}'")
+    if texgen_export:
         # Run TexGen
-        with contextlib.redirect_stdout(io.StringIO()):
-            with contextlib.redirect_stderr(io.StringIO()):
-                create_weave_voxel_mesh(width_ratio, thickness_ratio)
-
-
-        # Run Meso.py
-        subprocess.run(["python", "Meso.py"], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with metrics.stage("texgen"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    create_weave_voxel_mesh(width_ratio, thickness_ratio,
+                                            output_prefix=os.path.join(workdir, "PlainWeave"), voxels=voxels)
+        metrics.file_size(os.path.join(workdir, "PlainWeave.inp"))
+        metrics.file_size(os.path.join(workdir, "PlainWeave.ori"))
+        with metrics.stage("meso_mesh"):
+            return Meso.load_mesh(os.path.join(workdir, "PlainWeave.inp"),
+                                  os.path.join(workdir, "PlainWeave.ori"))
+
+    topology = Meso.voxel_topology(*voxels)
+    if voxelizer == "texgen":
+        with metrics.stage("texgen"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    textile = create_plain_weave(width_ratio, thickness_ratio)
+                    box_min, box_max = weave_domain_box(textile)
+                    yarn_index, yarn_orientations = voxel_point_information(
+                        textile, Meso.voxel_centers(topology, box_min, box_max))
+    else:
+        with metrics.stage("voxelize"):
+            box_min, box_max = domain_box(weave, thickness_ratio)
+            yarn_index, yarn_orientations = voxel_yarns(weave, width_ratio, thickness_ratio,
+                                                        Meso.voxel_centers(topology, box_min, box_max))
+    with metrics.stage("meso_mesh"):
+        mat_ids, orientations = Meso.voxel_materials(yarn_index, yarn_orientations)
+        return Meso.voxel_mesh(topology, box_min, box_max, mat_ids, orientations)
+
+# Mesoscale step: conductivity matrix of the woven unit cell, with
+# k_tow = (k11, k22, k33) the fiber tow conductivities from the microscale step.
+# The cache key is the generated Output.sc, which holds the voxel mesh,
+# the orientations and all material constants.
+def run_meso(width_ratio, thickness_ratio, k_tow, workdir=".", cache=None, texgen_export=False, metrics=None,
+             voxels=MESO_VOXELS, timeouts=None, retries=TOOL_RETRIES, weave="plain", voxelizer="numpy"):
+    metrics = metrics or SampleMetrics()
+    timeouts = TOOL_TIMEOUTS if timeouts is None else timeouts
+    # Convert the voxel mesh into the SwiftComp input
+    mesh = build_meso_mesh(width_ratio, thickness_ratio, workdir, texgen_export, metrics, voxels, weave, voxelizer)
+    with metrics.stage("meso_sc"):
+        Meso.write_mesh_sc(os.path.join(workdir, "Output.sc"), mesh, k_tow)
+    metrics.file_size(os.path.join(workdir, "Output.sc"))
+
+    key = None
+    if cache is not None:
+        with open(os.path.join(workdir, "Output.sc"), "rb") as f:
+            key = cache.make_key("meso", f.read())
+        matrix = cache.get(key)
+        if matrix is not None:
+            metrics.mark("meso_source", "cache")
+            return matrix
+    metrics.mark("meso_source", "solver")
+
+    # Run final SwiftComp
+    run_tool(["Swiftcomp", "Output.sc", "3D", "H"], workdir, metrics, "meso_swiftcomp",
+             timeouts.get("meso_swiftcomp"), retries)
+
+    with metrics.stage("k_extract"):
+        matrix = read_k_matrix(os.path.join(workdir, "Output.sc.k"))
+    if cache is not None:
+        cache.put(key, matrix)
+    return matrix
+
+# Mesoscale convergence study: solve the sample on the grids of MESO_LADDER (scaled from voxels),
+# coarse to fine, until refining changes k11 and k33 by less than tolerance (relative).
+# The cheapest grid within tolerance, the coarser one of that pair, is recorded as meso_voxels
+# and every level in meso_convergence; the finer, already computed result is returned.
+def converge_meso(width_ratio, thickness_ratio, k_tow, voxels, tolerance, workdir=".", cache=None,
+                  texgen_export=False, metrics=None, ladder=MESO_LADDER, timeouts=None, retries=TOOL_RETRIES,
+                  weave="plain", voxelizer="numpy"):
+    metrics = metrics or SampleMetrics()
+    levels = []
+    matrix = previous = None
+    for factor in ladder:
+        grid = scaled_voxels(voxels, factor)
+        if levels and list(grid) == levels[-1]["voxels"]:
+            continue
+        start = time.perf_counter()
+        matrix = run_meso(width_ratio, thickness_ratio, k_tow, workdir, cache, texgen_export, metrics, grid,
+                          timeouts, retries, weave, voxelizer)
+        level = {"voxels": list(grid), "k11": float(matrix[0][0]), "k33": float(matrix[2][2]),
+                 "seconds": time.perf_counter() - start}
+        levels.append(level)
+        metrics.mark("meso_convergence", levels)
+        if previous is not None:
+            level["change"] = max(abs(matrix[0][0] - previous[0][0]) / abs(matrix[0][0]),
+                                  abs(matrix[2][2] - previous[2][2]) / abs(matrix[2][2]))
+            if level["change"] < tolerance:
+                metrics.mark("meso_voxels", levels[-2]["voxels"])
+                metrics.mark("meso_converged", True)
+                return matrix
+        previous = matrix
+
+    print(f"Mesoscale results did not converge to {tolerance} up to {levels[-1]['voxels']} voxels")
+    metrics.mark("meso_voxels", levels[-1]["voxels"])
+    metrics.mark("meso_converged", False)
+    return matrix
+
+# Key of the solver inputs a microscale table is built from (.geo template or structured
+# mesh density, and materials). All gmsh output formats give the same mesh.
+def micro_table_key(msh_format="msh2"):
+    if msh_format == STRUCTURED:
+        return SolverCache.make_key("micro-table", STRUCTURED, str(MICRO_MESH_DENSITY), MICRO_MATERIALS)
+    return SolverCache.make_key("micro-table", geo_text(0.5), MICRO_MATERIALS)
+
+# Run the microscale step for one Vf inside its own scratch directory
+def _run_micro_in_scratch(Vf, root, cache, msh_format):
+    workdir = tempfile.mkdtemp(prefix="micro_", dir=root)
+    try:
+        return run_micro(Vf, workdir, cache, msh_format)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# Build the microscale table over vf_range, or refine table_file if it already holds one
+# built from the same inputs, and save it. Grid points are solved n_workers at a time.
+def build_micro_table(table_file, vf_range=(0.05, 0.9), n_points=17, tolerance=1e-3, max_rounds=5,
+                      n_workers=1, cache=None, msh_format="msh2"):
+    solve = partial(_run_micro_in_scratch, root=scratch_root(), cache=cache, msh_format=msh_format)
+    with ProcessPoolExecutor(max_workers=max(n_workers, 1), initializer=_init_worker) as pool:
+        if os.path.exists(table_file) and MicroTable.load(table_file).key == micro_table_key(msh_format):
+            table = MicroTable.load(table_file)
+            table.tolerance = tolerance
+            table = table.refine(solve, max_rounds, pool.map)
+        else:
+            table = MicroTable.build(solve, np.linspace(vf_range[0], vf_range[1], n_points), tolerance,
+                                     max_rounds, micro_table_key(msh_format), pool.map)
+    table.save(table_file)
+    print(f"Micro table {table_file}: {len(table.vf)} points over Vf [{table.vf[0]}, {table.vf[-1]}], "
+          f"max error estimate {table.error.max():.2E}")
+    return table
+
+# Load the microscale table, or return None if it was built from other solver inputs
+def load_micro_table(table_file, msh_format="msh2"):
+    table = MicroTable.load(table_file)
+    if table.key != micro_table_key(msh_format):
+        print(f"Ignoring {table_file}: it was built for another microscale mesh or other materials")
+        return None
+    return table
 
+# Processing of each row
+# With a micro_table the tow conductivities are interpolated from it whenever it covers Vf.
+# All intermediate files are written inside workdir, so rows given separate
+# directories can be solved at the same time.
+# With a metrics_file, the stage timings, tool memory, file sizes and the failure
+# reason of the row are appended to it (see telemetry.py).
+# meso_voxels is "auto" (meso_resolution of the row's geometry) or a fixed (nx, ny, nz) grid.
+# With meso_converge = tolerance, a convergence study (converge_meso) starts from that grid.
+# timeouts / retries bound the external tool runs (see TOOL_TIMEOUTS); speculative marks a
+# second copy of a straggling row in the metrics.
+# The optional 'Weave' column names a pattern of weave_voxels.WEAVES (plain if missing);
+# voxelizer picks how the mesoscale voxels are filled (see MESO_VOXELIZERS).
+def process_row(row, index, workdir=".", cache=None, texgen_export=False, msh_format="msh2",
+                micro_table=None, metrics_file=None, meso_voxels="auto", meso_converge=None,
+                timeouts=None, retries=TOOL_RETRIES, speculative=False, voxelizer="numpy"):
+    metrics = SampleMetrics(index)
+    if speculative:
+        metrics.mark("speculative", True)
+    try:
+        Vf = row['Vf']
+        width_ratio = row['Width to Spacing']
+        thickness_ratio = row['Thickness to Spacing']
+        weave = row.get('Weave', 'plain')
+        metrics.record.update(Vf=Vf, width=width_ratio, thickness=thickness_ratio, weave=weave)
+        repeat, _ = weave_pattern(weave)
+        
+        print(f"\nProcessing Row {index + 1}: Vf={Vf}, Width={width_ratio}, Thickness={thickness_ratio}")
 
-        # Run final SwiftComp
-        subprocess.run(["Swiftcomp", "Output.sc", "3D", "H"], 
-                      check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if micro_table is not None and micro_table.covers(Vf):
+            with metrics.stage("micro_table"):
+                k_tow = micro_table(Vf)
+            metrics.mark("micro_source", "table")
+        else:
+            micro = run_micro(Vf, workdir, cache, msh_format, metrics, timeouts, retries)
+            k_tow = (micro[0][0], micro[1][1], micro[2][2])
+
+        if meso_voxels == "auto":
+            voxels = meso_resolution(width_ratio, thickness_ratio, repeat=repeat)
+        else:
+            voxels = tuple(meso_voxels)
+        if meso_converge:
+            matrix = converge_meso(width_ratio, thickness_ratio, k_tow, voxels, meso_converge, workdir, cache,
+                                   texgen_export, metrics, timeouts=timeouts, retries=retries,
+                                   weave=weave, voxelizer=voxelizer)
+        else:
+            metrics.mark("meso_voxels", list(voxels))
+            matrix = run_meso(width_ratio, thickness_ratio, k_tow, workdir, cache, texgen_export, metrics, voxels,
+                              timeouts, retries, weave, voxelizer)
 
         # Extract and return k values
-        return extract_k_values()
+        return matrix[0][0], matrix[2][2]  # k11, k33
         
     except Exception as e:
+        metrics.fail(e)
         print(f"Error processing row {index + 1}: {e}")
         return None, None
 
+    finally:
+        if metrics_file is not None:
+            MetricsLog(metrics_file).append(metrics.finish())
+
+# Pick the parent directory for per-task scratch directories.
+# /dev/shm is a tmpfs on most Linux boxes, so the solver files never hit the disk.
+def scratch_root():
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return None  # tempfile falls back to the system temp directory
+
+# Keep each worker single threaded so N workers use N cores and not more
+_start_times = None  # queue of the pool, receives (index, time.time()) when a row starts running
+
+def _init_worker(start_times=None):
+    global _start_times
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    _start_times = start_times
+
+# Run one row inside its own scratch directory and clean it up afterwards.
+# Returns the result of process_row and the seconds it ran (not counting its wait in the pool queue).
+def _process_row_in_scratch(index, row, root, row_options):
+    started = time.time()
+    if _start_times is not None:
+        _start_times.put((index, started))
+    workdir = tempfile.mkdtemp(prefix=f"homog_{index + 1}_", dir=root)
+    try:
+        return process_row(row, index, workdir=workdir, **row_options), time.time() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# Record a row whose worker process died, so it is not lost from the metrics
+def _record_lost_row(index, error, row_options):
+    print(f"Error processing row {index + 1}: its worker was lost ({error})")
+    if row_options.get("metrics_file") is not None:
+        metrics = SampleMetrics(index)
+        metrics.fail(error)
+        MetricsLog(row_options["metrics_file"]).append(metrics.finish())
+
+# Solve the rows of df and yield (index, k11, k33) as they finish.
+# With n_workers == 1 the rows are solved one by one in the current directory,
+# otherwise they are spread over a process pool with one scratch directory per task
+# (see run_stream, which also re-launches stragglers at the end of the batch).
+# row_options (cache, texgen_export, msh_format, micro_table, metrics_file, meso_voxels,
+# meso_converge, timeouts, retries, voxelizer) are passed on to process_row.
+def run_rows(df, n_workers=1, speculate_after=SPECULATE_AFTER, **row_options):
+    if n_workers <= 1:
+        rows = df.iterrows()
+    else:
+        rows = ((index, row.to_dict()) for index, row in df.iterrows())
+    for index, row, k11, k33 in run_stream(rows, n_workers, None, speculate_after, **row_options):
+        yield index, k11, k33
+
+# Solve the rows of an iterator of (index, row) as they come and yield (index, row, k11, k33)
+# in the order they finish. At most queue_size rows are drawn ahead of the workers
+# (default: twice the number of workers), so the iterator can be an endless sampler.
+# Once the iterator is exhausted and workers go idle, the rows running longer than
+# speculate_after times the median row time are started again on the idle workers,
+# oldest first; the first copy to succeed is kept (0 or None disables this).
+# Row times and ages count from when a worker starts the row, reported by the worker,
+# not from when it was queued.
+def run_stream(samples, n_workers=1, queue_size=None, speculate_after=SPECULATE_AFTER, **row_options):
+    if n_workers <= 1:
+        for index, row in samples:
+            k11, k33 = process_row(row, index, **row_options)
+            yield index, row, k11, k33
+        return
+
+    samples = iter(samples)
+    queue_size = max(queue_size or 2 * n_workers, n_workers)
+    root = scratch_root()
+    speculative_options = dict(row_options, speculative=True)
+    start_times = multiprocessing.Queue()
+    pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(start_times,))
+    try:
+        pending = {}    # future -> (index, row)
+        copies = {}     # index -> futures still running for the row
+        started = {}    # index -> time.time() when a worker started the first copy
+        delivered = set()
+        durations = []  # seconds the delivered rows ran
+        exhausted = False
+
+        def collect_start_times():
+            while True:
+                try:
+                    index, start = start_times.get_nowait()
+                except queue.Empty:
+                    return
+                if index in copies:
+                    started.setdefault(index, start)
+
+        while True:
+            while not exhausted and len(pending) < queue_size:
+                try:
+                    index, row = next(samples)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = pool.submit(_process_row_in_scratch, index, row, root, row_options)
+                pending[future] = (index, row)
+                copies[index] = [future]
+            if all(pending[future][0] in delivered for future in pending):
+                return  # only copies that lost the race are left
+
+            # Tail of the batch: give the stragglers a second copy on the idle workers
+            speculating = exhausted and bool(speculate_after) and bool(durations)
+            if speculating and len(pending) < n_workers:
+                collect_start_times()
+                now = time.time()
+                budget = speculate_after * median(durations)
+                for index in sorted(started, key=started.get):
+                    if len(pending) >= n_workers:
+                        break
+                    if len(copies[index]) == 1 and index not in delivered and now - started[index] > budget:
+                        row = pending[copies[index][0]][1]
+                        print(f"Row {index + 1} is running {now - started[index]:.0f}s, starting a second copy")
+                        future = pool.submit(_process_row_in_scratch, index, row, root, speculative_options)
+                        pending[future] = (index, row)
+                        copies[index].append(future)
+
+            done, _ = wait(pending, timeout=1.0 if speculating else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, row = pending.pop(future)
+                copies[index].remove(future)
+                seconds = None
+                try:
+                    (k11, k33), seconds = future.result()
+                except Exception as e:
+                    _record_lost_row(index, e, row_options)
+                    k11 = k33 = None
+                if index not in delivered and (k11 is not None and k33 is not None or not copies[index]):
+                    # First successful copy, or the last copy of a row that failed everywhere
+                    delivered.add(index)
+                    if seconds is not None:
+                        durations.append(seconds)
+                    for twin in copies[index]:
+                        twin.cancel()
+                    yield index, row, k11, k33
+                if not copies[index]:
+                    del copies[index]
+                    started.pop(index, None)
+                    delivered.discard(index)
+    finally:
+        # Return without waiting for the copies that lost the race. concurrent.futures still joins
+        # the workers at interpreter exit, so the process ends once they finish or hit their tool timeouts.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Streaming campaign: samples come straight from lhs.sample_stream (n_samples per weave)
+# into the workers, without an input spreadsheet. The realized design is exported to
+# design_file as it is drawn and results go to the journal as rows finish; a restart with
+# the same seed regenerates the same design and skips the rows already done.
+# The final table (design + k11/k33) is written to output_file once at the end.
+def main_stream(n_samples, seed=0, weaves=("plain",), output_file="stream_results.csv", n_workers=1,
+                queue_size=None, design_file=None, journal_file=None, speculate_after=SPECULATE_AFTER,
+                **row_options):
+    stem = os.path.splitext(output_file)[0]
+    design_file = design_file or stem + "_design.csv"
+    journal = ResultJournal(journal_file or stem + ".journal.jsonl")
+    done = journal.completed()
+    if done:
+        print(f"Resuming: {len(done)} rows already done")
+
+    def samples():
+        with open(design_file, "w") as f:
+            f.write("index,Vf,Width to Spacing,Thickness to Spacing,Weave\n")
+            for index, (Vf, width, thickness, weave) in enumerate(sample_stream(n_samples, seed, weaves)):
+                f.write(f"{index},{Vf!r},{width!r},{thickness!r},{weave}\n")
+                if index not in done:
+                    yield index, {'Vf': Vf, 'Width to Spacing': width, 'Thickness to Spacing': thickness,
+                                  'Weave': weave}
+
+    try:
+        for index, row, k11, k33 in run_stream(samples(), n_workers, queue_size, speculate_after, **row_options):
+            journal.append(index, k11, k33)
+            if k11 is not None and k33 is not None:
+                print(f"Row {index + 1} completed: k11={k11:.4E}, k33={k33:.4E}")
+        journal.close()
+
+        # Write the final table once
+        df = pd.read_csv(design_file, index_col="index")
+        df['k11'] = None
+        df['k33'] = None
+        journal.compact(df, output_file)
+        print(f"\nAll rows processed, results in {output_file} (design in {design_file})")
+    finally:
+        journal.close()
+
 # Main script
-def main():
-    input_file = 'Vf_data_updated.xlsx'
-    
+# Results are appended to a journal (<input>.journal.jsonl) as rows finish.
+# Rows already in the journal are skipped on restart, and the Excel file is
+# written once at the end.
+def main(input_file='Vf_data_updated.xlsx', n_workers=1, cache=None, journal_file=None,
+         texgen_export=False, msh_format="msh2", micro_table=None, metrics_file=None,
+         meso_voxels="auto", meso_converge=None, timeouts=None, retries=TOOL_RETRIES,
+         speculate_after=SPECULATE_AFTER, voxelizer="numpy"):
+    if journal_file is None:
+        journal_file = os.path.splitext(input_file)[0] + ".journal.jsonl"
+    journal = ResultJournal(journal_file)
+
     try:
         # Load the Excel file
         df = pd.read_excel(input_file)
@@ -266,21 +749,132 @@ def main():
         if 'k33' not in df.columns:
             df['k33'] = None
         
+        # Skip rows finished by an earlier run
+        done = journal.completed()
+        pending = df[~df.index.isin(done)]
+        if done:
+            print(f"Resuming from {journal_file}: {len(done)} rows already done, {len(pending)} to go")
+
         # Process each row
-        for index, row in df.iterrows():
-            k11, k33 = process_row(row, index)
+        for index, k11, k33 in run_rows(pending, n_workers, cache=cache, texgen_export=texgen_export,
+                                           msh_format=msh_format, micro_table=micro_table,
+                                           metrics_file=metrics_file, meso_voxels=meso_voxels,
+                                           meso_converge=meso_converge, timeouts=timeouts, retries=retries,
+                                           speculate_after=speculate_after, voxelizer=voxelizer):
+            journal.append(index, k11, k33)
             if k11 is not None and k33 is not None:
-                df.at[index, 'k11'] = k11
-                df.at[index, 'k33'] = k33
                 print(f"Row {index + 1} completed: k11={k11:.4E}, k33={k33:.4E}")
-            
-            # Save progress after each row
-            df.to_excel(input_file, index=False)
-        
-        print("\nAll rows processed successfully!")
+        journal.close()
+
+        # Write the final table once
+        journal.compact(df, input_file)
+        n_failed = len(df) - len(journal.completed())
+        if n_failed:
+            print(f"\n{n_failed} rows failed, see {journal_file} and the metrics file; re-run to retry them")
+        else:
+            print("\nAll rows processed successfully!")
         
     except Exception as e:
         print(f"Script failed: {e}")
+    finally:
+        journal.close()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Two-step MSG homogenization of 2D woven composites")
+    parser.add_argument("--input", default="Vf_data_updated.xlsx", help="Excel file with the sampled geometries")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of rows solved in parallel (default: 1, serial in the current directory)")
+    parser.add_argument("--cache-dir", default="solver_cache",
+                        help="Directory of the solver result cache (default: solver_cache)")
+    parser.add_argument("--cache-max-mb", type=float, default=512,
+                        help="Size cap of the solver result cache in MB (default: 512)")
+    parser.add_argument("--no-cache", action="store_true", help="Always run the external solvers")
+    parser.add_argument("--journal", default=None,
+                        help="Checkpoint journal used to resume a run (default: <input>.journal.jsonl)")
+    parser.add_argument("--texgen-export", action="store_true",
+                        help="Build the mesoscale mesh through TexGen's .inp/.ori export instead of the cached voxel topology")
+    parser.add_argument("--voxelizer", choices=MESO_VOXELIZERS, default="numpy",
+                        help="Fill the mesoscale voxels with the NumPy weave model (default, plain, twill and 5hs) "
+                             "or by querying TexGen (plain weave only)")
+    parser.add_argument("--msh-format", choices=MICRO_MESH_ROUTES, default="msh2",
+                        help="gmsh output format of the microscale mesh (default: msh2, binary msh 2.2), "
+                             "or structured to mesh the cell in-process without gmsh")
+    parser.add_argument("--micro-table", default=None,
+                        help="JSON table of the microscale conductivities over Vf, interpolated instead of solving each row")
+    parser.add_argument("--build-micro-table", action="store_true",
+                        help="Build (or refine) the --micro-table file and exit")
+    parser.add_argument("--micro-vf-range", type=float, nargs=2, default=(0.05, 0.9), metavar=("MIN", "MAX"),
+                        help="Vf range of a new microscale table (default: 0.05 0.9)")
+    parser.add_argument("--micro-points", type=int, default=17,
+                        help="Initial number of Vf grid points of a new microscale table (default: 17)")
+    parser.add_argument("--micro-tol", type=float, default=1e-3,
+                        help="Relative interpolation error the table is refined to (default: 1e-3)")
+    parser.add_argument("--micro-max-rounds", type=int, default=5,
+                        help="Maximum number of refinement rounds (default: 5)")
+    parser.add_argument("--stream", type=int, default=None, metavar="N",
+                        help="Stream N Latin hypercube samples per weave into the workers instead of reading --input")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the streamed design (default: 0)")
+    parser.add_argument("--weaves", nargs="+", default=["plain"], help="Weave patterns of the streamed design")
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="Streamed samples drawn ahead of the workers (default: 2 x workers)")
+    parser.add_argument("--output", default="stream_results.csv",
+                        help="Result table of a streamed run (default: stream_results.csv)")
+    parser.add_argument("--metrics", default=None,
+                        help="Per-sample telemetry file (default: <input or output>.metrics.jsonl), "
+                             "summarize it with python telemetry.py FILE")
+    parser.add_argument("--no-metrics", action="store_true", help="Do not write per-sample telemetry")
+    parser.add_argument("--meso-voxels", nargs="+", default=["auto"], metavar="N",
+                        help="Mesoscale voxel grid: auto (chosen from the width and thickness ratios, default) "
+                             "or NX NY NZ, e.g. 40 40 20")
+    parser.add_argument("--meso-converge", type=float, default=None, metavar="TOL",
+                        help="Refine the voxel grid of every row until k11 and k33 change by less than TOL "
+                             "(relative); the chosen grids are recorded in the metrics file")
+    parser.add_argument("--timeouts", nargs="+", default=[], metavar="STAGE=SECONDS",
+                        help="Time budgets of the tool runs, e.g. gmsh=300 meso_swiftcomp=7200 (0: no limit; "
+                             f"default: {' '.join(f'{k}={v}' for k, v in TOOL_TIMEOUTS.items())})")
+    parser.add_argument("--retries", type=int, default=TOOL_RETRIES,
+                        help=f"Restarts of a tool run killed on its time budget (default: {TOOL_RETRIES})")
+    parser.add_argument("--speculate-after", type=float, default=SPECULATE_AFTER,
+                        help="At the end of a parallel run, start a second copy of rows running longer than this "
+                             f"many median row times (0: never; default: {SPECULATE_AFTER})")
+    args = parser.parse_args()
+    timeouts = dict(TOOL_TIMEOUTS)
+    for budget in args.timeouts:
+        stage, _, seconds = budget.partition("=")
+        if stage not in TOOL_TIMEOUTS:
+            parser.error(f"--timeouts stages are {', '.join(TOOL_TIMEOUTS)}")
+        try:
+            timeouts[stage] = float(seconds) or None
+        except ValueError:
+            parser.error(f"--timeouts {budget}: seconds must be a number")
+    if args.meso_voxels == ["auto"]:
+        meso_voxels = "auto"
+    elif len(args.meso_voxels) == 3 and all(n.isdigit() for n in args.meso_voxels):
+        meso_voxels = tuple(int(n) for n in args.meso_voxels)
+    else:
+        parser.error("--meso-voxels takes auto or three voxel counts NX NY NZ")
+
+    cache = None
+    if not args.no_cache:
+        cache = SolverCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+    if args.build_micro_table:
+        if args.micro_table is None:
+            parser.error("--build-micro-table needs --micro-table FILE")
+        build_micro_table(args.micro_table, args.micro_vf_range, args.micro_points, args.micro_tol,
+                          args.micro_max_rounds, args.workers, cache, args.msh_format)
+    else:
+        micro_table = load_micro_table(args.micro_table, args.msh_format) if args.micro_table else None
+        run_file = args.output if args.stream is not None else args.input
+        metrics_file = None
+        if not args.no_metrics:
+            metrics_file = args.metrics or os.path.splitext(run_file)[0] + ".metrics.jsonl"
+        if args.stream is not None:
+            main_stream(args.stream, args.seed, args.weaves, args.output, args.workers, args.queue_size,
+                        journal_file=args.journal, cache=cache, texgen_export=args.texgen_export,
+                        msh_format=args.msh_format, micro_table=micro_table, metrics_file=metrics_file,
+                        meso_voxels=meso_voxels, meso_converge=args.meso_converge, timeouts=timeouts,
+                        retries=args.retries, speculate_after=args.speculate_after, voxelizer=args.voxelizer)
+        else:
+            main(args.input, args.workers, cache, args.journal, args.texgen_export, args.msh_format, micro_table,
+                 metrics_file, meso_voxels, args.meso_converge, timeouts, args.retries, args.speculate_after,
+                 args.voxelizer)
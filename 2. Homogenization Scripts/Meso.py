@@ -1,115 +1,112 @@
 import os
+from functools import lru_cache
+from collections import namedtuple
+import numpy as np
+from sc_writer import write_rows, format_mixed_rows
 
-def merge_continuation_lines(lines):
+# Arrays read from an Abaqus .inp voxel mesh by parse_inp.
+InpMesh = namedtuple("InpMesh", ["node_ids", "coords", "elem_ids", "connectivity", "elsets"])
+
+# Parsed mesoscale voxel mesh, as passed between parse_inp/read_ori and write_sc.
+MesoMesh = namedtuple("MesoMesh", ["node_ids", "coords", "elem_ids", "connectivity",
+                                   "mat_ids", "orientations"])
+
+# Sample independent part of a rectangular voxel mesh, see voxel_topology.
+VoxelTopology = namedtuple("VoxelTopology", ["shape", "node_ids", "node_index", "elem_ids",
+                                             "connectivity", "elem_index"])
+
+# Orientation written for matrix voxels (a = x axis, b = y axis), as TexGen does.
+MATRIX_ORIENTATION = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+def _section_values(text, dtype):
+    """Read every number of an .inp data block (comma and/or space separated) into a flat array."""
+    text = text.replace(",", " ")
+    if not text.strip():
+        return np.empty(0, dtype=dtype)
+    return np.fromstring(text, dtype=dtype, sep=" ")
+
+def _element_positions(elem_ids, ids):
     """
-    Merge lines that are continued with a trailing comma.
-    Returns a new list of lines with continuations merged.
+    Positions in elem_ids of the given element ids. Returns (positions, found) where
+    found marks which of ids exist; unknown ids get no position.
     """
-    merged = []
-    accumulator = ""
-    for line in lines:
-        stripped = line.rstrip("\n").strip()
-        if not stripped:
-            continue
-        if accumulator:
-            accumulator += " " + stripped
-        else:
-            accumulator = stripped
-        if accumulator.endswith(','):
-            accumulator = accumulator.rstrip(',')
-            continue
-        else:
-            merged.append(accumulator)
-            accumulator = ""
-    if accumulator:
-        merged.append(accumulator)
-    return merged
+    order = np.argsort(elem_ids, kind="stable")
+    sorted_ids = elem_ids[order]
+    if not len(sorted_ids):
+        return np.empty(0, dtype=np.int64), np.zeros(len(ids), dtype=bool)
+    pos = np.searchsorted(sorted_ids, ids)
+    pos[pos == len(sorted_ids)] = 0
+    found = sorted_ids[pos] == ids
+    return order[pos[found]], found
 
 def parse_inp(inp_filename):
     """
     Parse the .inp file to extract nodes, element connectivity, and element set definitions.
-    Assumes nodes are defined after a "*Node" header and elements after a "*Element" header.
-    Handles continuation lines and element set definitions (from "*ElSet" lines).
-    Elements in sets with "Yarn" (case-insensitive) get material id 1; those with "Matrix" get 2.
+    Assumes nodes are defined after a "*Node" header and 8-node elements after a "*Element" header.
+    Each data block is converted in one go with NumPy, so continuation lines need no special handling.
+    Returns an InpMesh of typed arrays:
+        node_ids (N,), coords (N, 3), elem_ids (E,), connectivity (E, 8)
+    and elsets, a dict mapping each "*ElSet" name (in file order) to the positions of
+    its elements in elem_ids.
     """
     with open(inp_filename, 'r') as f:
-        raw_lines = f.readlines()
-    lines = merge_continuation_lines(raw_lines)
-    
-    nodes = []
-    elements = []
-    elem_to_mat = {}  # key: element id (as string), value: material id
-    current_set = None
-    in_set_block = False
-    node_section = False
-    element_section = False
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-
-        # Check for element set header.
-        if line.lower().startswith("*elset"):
-            parts = [p.strip() for p in line.split(',') if p.strip()]
+        text = f.read()
+
+    node_blocks = []
+    element_blocks = []
+    set_blocks = []
+
+    # Every line starting with "*" is a keyword line, the text up to the next one is its data.
+    for section in ("\n" + text).split("\n*")[1:]:
+        header, _, data = section.partition("\n")
+        keyword = header.strip().lower()
+        if keyword.startswith("elset"):
             set_name = None
-            for part in parts:
+            for part in header.split(","):
                 if "elset=" in part.lower():
-                    set_name = part.split('=')[1].strip()
+                    set_name = part.split("=")[1].strip()
                     break
             if set_name:
-                current_set = set_name
-                in_set_block = True
-            else:
-                current_set = None
-                in_set_block = False
-            continue
-
-        # New header resets section flags.
-        if line.startswith("*"):
-            in_set_block = False
-            if line.lower().startswith("*node"):
-                node_section = True
-                element_section = False
-            elif line.lower().startswith("*element"):
-                element_section = True
-                node_section = False
-            else:
-                node_section = False
-                element_section = False
-            continue
-
-        # Process element-set block lines.
-        if in_set_block and current_set:
-            nums = line.replace(',', ' ').split()
-            for num in nums:
-                if "yarn" in current_set.lower():
-                    elem_to_mat[num] = 1
-                elif "matrix" in current_set.lower():
-                    elem_to_mat[num] = 2
-            continue
-
-        if node_section:
-            parts = [p.strip() for p in line.split(',') if p.strip()]
-            if len(parts) >= 4:
-                node_id = parts[0]
-                x = parts[1]
-                y = parts[2]
-                z = parts[3]
-                nodes.append((node_id, x, y, z))
-        elif element_section:
-            parts = [p.strip() for p in line.split(',') if p.strip()]
-            if len(parts) < 9:
-                parts = line.split()
-            if not parts[0][0].isdigit():
-                continue
-            if len(parts) >= 9:
-                elem_id = parts[0]
-                node_ids = parts[1:9]
-                elements.append((elem_id, node_ids))
-            else:
-                raise ValueError("Element line does not have at least 9 entries: " + line)
-    return nodes, elements, elem_to_mat
+                set_blocks.append((set_name, data))
+        elif keyword.startswith("node"):
+            node_blocks.append(data)
+        elif keyword.startswith("element"):
+            element_blocks.append(data)
+
+    nodes = np.concatenate([_section_values(d, np.float64) for d in node_blocks] or [np.empty(0)])
+    if nodes.size % 4:
+        raise ValueError("Node block does not hold 4 entries (id, x, y, z) per node.")
+    nodes = nodes.reshape(-1, 4)
+
+    elements = np.concatenate([_section_values(d, np.int64) for d in element_blocks]
+                              or [np.empty(0, dtype=np.int64)])
+    if elements.size % 9:
+        raise ValueError("Element block does not hold 9 entries (id + 8 nodes) per element.")
+    elements = elements.reshape(-1, 9)
+    elem_ids = elements[:, 0].copy()
+
+    # Element sets are stored as positions into elem_ids; ids of unknown elements are dropped.
+    elsets = {}
+    for set_name, data in set_blocks:
+        positions, _ = _element_positions(elem_ids, _section_values(data, np.int64))
+        elsets[set_name] = positions
+
+    return InpMesh(nodes[:, 0].astype(np.int64), nodes[:, 1:].copy(),
+                   elem_ids, np.ascontiguousarray(elements[:, 1:]), elsets)
+
+def element_materials(inp_mesh):
+    """
+    Material id of every element: elements in sets with "Yarn" (case-insensitive) in their
+    name get material id 1, those in "Matrix" sets and all others get 2.
+    Sets are applied in file order, so a later set overrides an earlier one.
+    """
+    mat_ids = np.full(len(inp_mesh.elem_ids), 2, dtype=np.int64)
+    for set_name, positions in inp_mesh.elsets.items():
+        if "yarn" in set_name.lower():
+            mat_ids[positions] = 1
+        elif "matrix" in set_name.lower():
+            mat_ids[positions] = 2
+    return mat_ids
 
 def read_trial_k(trial_k_filename):
     """
@@ -155,40 +152,123 @@ def read_trial_k(trial_k_filename):
 
 def read_ori(ori_filename):
     """
-    Reads the orientation (.ori) file and returns a dictionary mapping element id (as a string)
-    to a list of 6 orientation numbers [a1, a2, a3, b1, b2, b3].
+    Reads the orientation (.ori) file and returns (ori_ids, ori_values): the element ids
+    as an int array and their 6 orientation numbers [a1, a2, a3, b1, b2, b3] as an (M, 6) array.
     Data lines are expected to be in one of the following forms (ignoring any header):
        1, 1.0, 0.0, 0.0, 0.0, 1.0, 0.0
     or
        1 1.0 0.0 0.0 0.0 1.0 0.0
-    Lines not starting with a digit are skipped.
+    Lines not starting with a digit (after any leading '#' or '*') are skipped.
     """
-    ori_data = {}
     with open(ori_filename, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            # Remove any leading '#' or '*' characters.
-            while line and line[0] in "#*":
-                line = line[1:].strip()
-            tokens = line.replace(",", " ").split()
-            if not tokens:
-                continue
-            if not tokens[0].isdigit():
-                continue
-            if len(tokens) < 7:
-                continue
-            elem_id = tokens[0]
-            try:
-                # Simply take the first six values as provided.
-                values = [tokens[i] for i in range(1, 7)]
-            except Exception:
-                continue
-            ori_data[elem_id] = values
-    return ori_data
+        lines = [line.lstrip("#* \t") for line in f.read().splitlines()]
+    data = [line.replace(",", " ") for line in lines if line[:1].isdigit()]
+    values = _section_values(" ".join(data), np.float64)
+    if values.size != 7 * len(data):
+        # Some lines carry extra or missing fields: take the first seven of the complete ones.
+        rows = [line.split()[:7] for line in data]
+        values = np.array([row for row in rows if len(row) == 7], dtype=np.float64)
+    values = values.reshape(-1, 7)
+    return values[:, 0].astype(np.int64), values[:, 1:].copy()
 
-def write_sc(sc_filename, nodes, elements, elem_to_mat, k11, k22, k33, orientation_data=None):
+def element_orientations(elem_ids, ori_ids, ori_values):
+    """
+    Orientation of every element as an (E, 6) array aligned with elem_ids.
+    Rows of elements missing from the .ori data are NaN.
+    """
+    orientations = np.full((len(elem_ids), 6), np.nan)
+    positions, found = _element_positions(elem_ids, ori_ids)
+    orientations[positions] = ori_values[found]
+    return orientations
+
+def load_mesh(inp_filename, ori_filename=None):
+    """
+    Parse the TexGen voxel mesh (.inp) and, when present, its orientation file (.ori)
+    into a MesoMesh that can be handed straight to write_sc.
+    Raises ValueError if the .inp file holds no nodes or no elements.
+    """
+    inp_mesh = parse_inp(inp_filename)
+    if not len(inp_mesh.node_ids):
+        raise ValueError("No nodes were found in the inp file.")
+    if not len(inp_mesh.elem_ids):
+        raise ValueError("No elements were found in the inp file.")
+    orientations = np.full((len(inp_mesh.elem_ids), 6), np.nan)
+    if ori_filename is not None and os.path.exists(ori_filename):
+        orientations = element_orientations(inp_mesh.elem_ids, *read_ori(ori_filename))
+    return MesoMesh(inp_mesh.node_ids, inp_mesh.coords, inp_mesh.elem_ids, inp_mesh.connectivity,
+                    element_materials(inp_mesh), orientations)
+
+@lru_cache(maxsize=16)
+def voxel_topology(nx, ny, nz):
+    """
+    Node and element numbering of an nx*ny*nz rectangular voxel grid, laid out like
+    TexGen's CRectangularVoxelMesh export: nodes and elements run x fastest, then y,
+    then z, and hex nodes go counter-clockwise on the bottom face, then the top face.
+    node_index / elem_index hold the integer (i, j, k) grid position of every node and
+    of the lower corner of every voxel. The result is cached per resolution and its
+    arrays are read-only, since every sample with the same resolution shares them.
+    """
+    k, j, i = np.meshgrid(np.arange(nz + 1), np.arange(ny + 1), np.arange(nx + 1), indexing="ij")
+    node_index = np.column_stack([i.ravel(), j.ravel(), k.ravel()])
+    node_ids = np.arange(1, len(node_index) + 1)
+
+    k, j, i = np.meshgrid(np.arange(nz), np.arange(ny), np.arange(nx), indexing="ij")
+    elem_index = np.column_stack([i.ravel(), j.ravel(), k.ravel()])
+    first = elem_index[:, 0] + elem_index[:, 1] * (nx + 1) + elem_index[:, 2] * (nx + 1) * (ny + 1) + 1
+    bottom = np.column_stack([first, first + 1, first + nx + 2, first + nx + 1])
+    connectivity = np.hstack([bottom, bottom + (nx + 1) * (ny + 1)])
+    elem_ids = np.arange(1, len(elem_index) + 1)
+
+    for array in (node_index, node_ids, elem_index, connectivity, elem_ids):
+        array.setflags(write=False)
+    return VoxelTopology((nx, ny, nz), node_ids, node_index, elem_ids, connectivity, elem_index)
+
+def voxel_size(topology, box_min, box_max):
+    """Edge lengths of one voxel when the grid spans the box [box_min, box_max]."""
+    return (np.asarray(box_max, dtype=np.float64) - np.asarray(box_min, dtype=np.float64)) / topology.shape
+
+def voxel_centers(topology, box_min, box_max):
+    """(nElem, 3) centre points of the voxels, e.g. to query yarn membership."""
+    return np.asarray(box_min, dtype=np.float64) + (topology.elem_index + 0.5) * voxel_size(topology, box_min, box_max)
+
+def voxel_materials(yarn_index, yarn_orientations):
+    """
+    Material ids and orientations of voxels from the yarn found at their centre
+    (yarn_index -1 = matrix): yarn voxels get material id 1 and their yarn orientation,
+    matrix voxels get material id 2 and MATRIX_ORIENTATION.
+    """
+    in_yarn = np.asarray(yarn_index) >= 0
+    mat_ids = np.where(in_yarn, 1, 2)
+    orientations = np.array(yarn_orientations, dtype=np.float64)
+    orientations[~in_yarn] = MATRIX_ORIENTATION
+    return mat_ids, orientations
+
+def voxel_mesh(topology, box_min, box_max, mat_ids, orientations):
+    """
+    MesoMesh of one sample from a cached voxel_topology: only the node coordinates
+    (from the box spanned by the grid), the per-voxel material ids and the per-voxel
+    orientations are computed here.
+    """
+    coords = np.asarray(box_min, dtype=np.float64) + topology.node_index * voxel_size(topology, box_min, box_max)
+    return MesoMesh(topology.node_ids, coords, topology.elem_ids, topology.connectivity,
+                    np.asarray(mat_ids), np.asarray(orientations, dtype=np.float64))
+
+def mesh_volume(coords):
+    """Volume of the box spanned by the node coordinates, i.e. of the voxelized unit cell."""
+    coords = np.asarray(coords, dtype=np.float64)
+    return float(np.prod(coords.max(axis=0) - coords.min(axis=0)))
+
+def write_mesh_sc(sc_filename, mesh, k_values, volume=None):
+    """
+    Write the mesoscale Swiftcomp file for a MesoMesh, with k_values = (k11, k22, k33)
+    the fiber tow conductivities from the microscale step.
+    """
+    k11, k22, k33 = k_values
+    write_sc(sc_filename, mesh.node_ids, mesh.coords, mesh.elem_ids, mesh.connectivity,
+             mesh.mat_ids, k11, k22, k33, mesh.orientations, volume)
+
+def write_sc(sc_filename, node_ids, coords, elem_ids, connectivity, mat_ids,
+             k11, k22, k33, orientations=None, volume=None):
     """
     Writes the Swiftcomp (.sc) file in the following sections:
 
@@ -197,62 +277,53 @@ def write_sc(sc_filename, nodes, elements, elem_to_mat, k11, k22, k33, orientati
          2 nNode nElem 2 0 0   # nSG nNode nElem nMat nSlave nLayer
 
     (2) Node Data:
-         node_no  x  y  z
+         node_no  x  y  z   (coordinates in shortest round-trip form)
 
     (3) Element Connectivity:
          For each element: elem_no, Mat Id, Node1,..., Node8, then 12 zeros (22 entries total)
 
-    (4) Orientation Block (if orientation_data is provided):
+    (4) Orientation Block (if orientations is provided):
          For each element: elem_no, a1, a2, a3, b1, b2, b3, 0, 0, 0
-         Here, the first 6 entries after the element id are taken directly from the .ori file.
-         (The last 3 entries are zeros.)
+         orientations is an (nElem, 6) array of the .ori values; elements with a NaN row
+         get an all-zero line.
     
     (5) Material Property Blocks:
          For fiber (mat id = 1): uses stiffness values read from Trial.sc.k
          For matrix (mat id = 2): uses a hardcoded k of 0.180
 
-    (6) Homogenized SG Volume
+    (6) Homogenized SG Volume: volume, by default the mesh_volume of the nodes
+         (the n x n x t cell of the weave, so twill and 5HS cells get their own volume)
+
+    Every block is formatted column-wise with sc_writer.write_rows and written in large chunks.
     """
-    N_node = len(nodes)
-    N_elem = len(elements)
+    N_node = len(node_ids)
+    N_elem = len(elem_ids)
+    if connectivity.shape != (N_elem, 8):
+        raise ValueError("Element connectivity must have 8 nodes per element.")
+    if volume is None:
+        volume = mesh_volume(coords)
     with open(sc_filename, 'w') as f:
         # Write header.
         f.write("2 0 1 0 \t # Analysis_type  elem_type trans_flag temp_flag\n\n")
         f.write("3 {} {} 2 0 0 \t # nSG nNode nElem nMat nSlave nLayer\n".format(N_node, N_elem))
         # Write nodes.
-        for node in nodes:
-            node_id, x, y, z = node
-            f.write("{} {} {} {}\n".format(node_id, x, y, z))
+        write_rows(f, "%s %s %s %s\n", [node_ids, coords])
         f.write("\n")
-        # Write element connectivity.
-        for elem in elements:
-            elem_id, node_ids = elem
-            mat_id = elem_to_mat.get(elem_id, 2)
-            if len(node_ids) != 8:
-                raise ValueError("Element {} does not have 8 nodes.".format(elem_id))
-            line = "{} {} {} {} {} {} {} {} {} {}".format(
-                elem_id, mat_id,
-                node_ids[0], node_ids[1], node_ids[2], node_ids[3],
-                node_ids[4], node_ids[5], node_ids[6], node_ids[7]
-            )
-            zeros_str = " ".join(["0"] * 12)
-            f.write(line + " " + zeros_str + "\n")
+        # Write element connectivity, followed by 12 zeros.
+        write_rows(f, "%s %s %s %s %s %s %s %s %s %s" + " 0" * 12 + "\n",
+                   [elem_ids, mat_ids, connectivity])
         f.write("\n")
-        # Write orientation block if available.
-        if orientation_data is not None:
-            for elem in elements:
-                elem_id, _ = elem
-                if elem_id in orientation_data:
-                    oris = orientation_data[elem_id]
-                    # Write the six orientation values as they appear in the .ori file,
-                    # followed by three zeros.
-                    ori_line = "{}  {}  {}  {}    {}  {}  {}  0 0 0".format(
-                        elem_id, oris[0], oris[1], oris[2],
-                        oris[3], oris[4], oris[5]
-                    )
-                else:
-                    ori_line = "{} 0 0 0 0 0 0 0 0 0".format(elem_id)
-                f.write(ori_line + "\n")
+        # Write orientation block if available: the six .ori values followed by three zeros.
+        if orientations is not None:
+            has_ori = ~np.isnan(orientations).any(axis=1)
+            with_ori = np.flatnonzero(has_ori)
+            without_ori = np.flatnonzero(~has_ori)
+            text = format_mixed_rows([
+                (with_ori, "%s  %s  %s  %s    %s  %s  %s  0 0 0\n",
+                 [elem_ids[with_ori], orientations[with_ori]]),
+                (without_ori, "%s 0 0 0 0 0 0 0 0 0\n", [elem_ids[without_ori]]),
+            ], N_elem)
+            f.write(text.tobytes().decode("ascii"))
             f.write("\n")
         # Write material properties block for fiber (mat id = 1)
         f.write("1 1 1 \t # mat_type isotropy ntemp (This is for fiber)\n")
@@ -263,7 +334,7 @@ def write_sc(sc_filename, nodes, elements, elem_to_mat, k11, k22, k33, orientati
         f.write("0 0 # T and Rho\n")
         f.write("0.180 # k\n\n")
         # Write homogenized SG Volume.
-        f.write("0.44 \t #Homogenized SG Volume")
+        f.write("{} \t #Homogenized SG Volume".format(volume))
 
 if __name__ == "__main__":
     inp_filename = "PlainWeave.inp"     # Abaqus .inp file
@@ -275,16 +346,8 @@ if __name__ == "__main__":
     if not os.path.exists(trial_k_filename):
         raise FileNotFoundError(f"Stiffness file '{trial_k_filename}' does not exist.")
     try:
-        nodes, elements, elem_to_mat = parse_inp(inp_filename)
-        if not nodes:
-            raise ValueError("No nodes were found in the inp file.")
-        if not elements:
-            raise ValueError("No elements were found in the inp file.")
-        k11, k22, k33 = read_trial_k(trial_k_filename)
-        orientation_data = {}
-        if os.path.exists(ori_filename):
-            orientation_data = read_ori(ori_filename)
-        write_sc(sc_filename, nodes, elements, elem_to_mat, k11, k22, k33, orientation_data)
+        mesh = load_mesh(inp_filename, ori_filename)
+        write_mesh_sc(sc_filename, mesh, read_trial_k(trial_k_filename))
         print("Conversion complete. Swiftcomp file written to", os.path.abspath(sc_filename))
     except Exception as e:
         print("Error processing:", e)
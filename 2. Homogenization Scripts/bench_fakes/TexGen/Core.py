@@ -0,0 +1,181 @@
+"""
+Stand-in for the parts of TexGen's Python API used by texgen_utils (bench_pipeline.py).
+
+CTextileWeave2D models a plain weave analytically: warp yarns run along x and weft
+yarns along y, with elliptic cross sections whose centre lines follow a cosine over
+and under the crossing yarns (SwapPosition is recorded but not used). That is enough
+to classify points like TexGen does, so GetPointInformation and the rectangular voxel
+export produce meshes of the real size with a realistic yarn/matrix split. Environment:
+    BENCH_TEXGEN_LATENCY   seconds to sleep per GetPointInformation / SaveVoxelMesh call (default 0)
+"""
+import os
+import time
+import numpy as np
+
+INP_EXPORT = 0
+
+_textiles = {}
+
+
+def _latency():
+    time.sleep(float(os.environ.get("BENCH_TEXGEN_LATENCY", "0")))
+
+
+class XYZ:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = x, y, z
+
+
+class XYZVector(list):
+    def push_back(self, value):
+        self.append(value)
+
+
+class PointInfo:
+    def __init__(self, yarn_index, tangent, up):
+        self.iYarnIndex = yarn_index
+        self.YarnTangent = tangent
+        self.Up = up
+
+
+class PointInfoVector(list):
+    def push_back(self, value):
+        self.append(value)
+
+
+class _Mesh:
+    def __init__(self, box_min, box_max):
+        self._box = (box_min, box_max)
+
+    def GetAABB(self):
+        return self._box
+
+
+class _Domain:
+    def __init__(self, box_min, box_max):
+        self._mesh = _Mesh(box_min, box_max)
+
+    def GetMesh(self):
+        return self._mesh
+
+
+class CTextileWeave2D:
+    def __init__(self, n_warp, n_weft, spacing, thickness, refine=False):
+        self.n_warp, self.n_weft = n_warp, n_weft
+        self.spacing, self.thickness = spacing, thickness
+        self.width = spacing
+        self.height = thickness / 2
+        self.swapped = set()
+        self._domain = None
+
+    def SetGapSize(self, gap):
+        pass
+
+    def SwapPosition(self, i, j):
+        self.swapped.symmetric_difference_update({(i, j)})
+
+    def SetYarnWidths(self, width):
+        self.width = width
+
+    def SetYarnHeights(self, height):
+        self.height = height
+
+    def AssignDefaultDomain(self):
+        self._domain = _Domain(XYZ(0.0, 0.0, -self.thickness / 2),
+                               XYZ(self.n_weft * self.spacing, self.n_warp * self.spacing, self.thickness / 2))
+
+    def GetDomain(self):
+        return self._domain
+
+    def _centre_line(self, s, index, over_sign):
+        """Height and slope of a yarn centre line at position s along the yarn."""
+        amplitude = over_sign * self.thickness / 4
+        phase = np.pi * (s / self.spacing - 0.5 + index)
+        return amplitude * np.cos(phase), -amplitude * np.pi / self.spacing * np.sin(phase)
+
+    def classify(self, points):
+        """Yarn index (-1 for matrix) and (n, 6) tangent/up orientations of (n, 3) points."""
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+        yarn_index = np.full(len(points), -1, dtype=np.int64)
+        orientations = np.full((len(points), 6), np.nan)
+        half_w, half_h = self.width / 2, self.height / 2
+        # Warp yarn i (along x) at y = (i + 0.5) * spacing, weft yarn j (along y) at x = (j + 0.5) * spacing
+        for direction, count, offset in ((0, self.n_warp, 0), (1, self.n_weft, self.n_warp)):
+            along, across = (x, y) if direction == 0 else (y, x)
+            sign = 1.0 if direction == 0 else -1.0  # weft goes under where warp goes over
+            for i in range(count):
+                zc, slope = self._centre_line(along, i, sign)
+                inside = ((across - (i + 0.5) * self.spacing) / half_w) ** 2 + ((z - zc) / half_h) ** 2 <= 1
+                inside &= yarn_index < 0
+                yarn_index[inside] = offset + i
+                norm = np.sqrt(1 + slope[inside] ** 2)
+                zero = np.zeros_like(norm)
+                tangent = [1 / norm, zero, slope[inside] / norm]
+                up = [-slope[inside] / norm, zero, 1 / norm]
+                if direction == 1:
+                    tangent[0], tangent[1] = tangent[1], tangent[0]
+                    up[0], up[1] = up[1], up[0]
+                orientations[inside] = np.column_stack(tangent + up)
+        return yarn_index, orientations
+
+    def GetPointInformation(self, xyz_points, info):
+        _latency()
+        points = np.array([(p.x, p.y, p.z) for p in xyz_points], dtype=float).reshape(-1, 3)
+        yarn_index, orientations = self.classify(points)
+        for index, row in zip(yarn_index.tolist(), orientations.tolist()):
+            info.push_back(PointInfo(index, XYZ(*row[:3]), XYZ(*row[3:])))
+
+
+def AddTextile(name, textile):
+    _textiles[name] = textile
+
+
+def SaveToXML(filename):
+    with open(filename, "w") as f:
+        f.write('<?xml version="1.0"?>\n<TexGenModel>\n')
+        for name in _textiles:
+            f.write(f'  <Textile name="{name}"/>\n')
+        f.write("</TexGenModel>\n")
+
+
+class CRectangularVoxelMesh:
+    def SaveVoxelMesh(self, textile, filename, nx, ny, nz, output_matrix, output_yarns,
+                      boundary_conditions, element_type, file_type):
+        """Write filename (.inp) and the matching .ori the way TexGen's voxel export lays them out."""
+        _latency()
+        box_min, box_max = textile.GetDomain().GetMesh().GetAABB()
+        lo = np.array([box_min.x, box_min.y, box_min.z])
+        size = (np.array([box_max.x, box_max.y, box_max.z]) - lo) / (nx, ny, nz)
+
+        zz, yy, xx = np.meshgrid(*(lo[d] + np.arange(n + 1) * size[d] for d, n in ((2, nz), (1, ny), (0, nx))),
+                                 indexing="ij")
+        k, j, i = np.meshgrid(np.arange(nz), np.arange(ny), np.arange(nx), indexing="ij")
+        base = (i + j * (nx + 1) + k * (nx + 1) * (ny + 1)).ravel() + 1
+        layer = (nx + 1) * (ny + 1)
+        bottom = np.stack([base, base + 1, base + nx + 2, base + nx + 1], axis=1)
+        connectivity = np.hstack([bottom, bottom + layer])
+        elem_ids = np.arange(1, len(base) + 1)
+        centres = np.column_stack([(i.ravel() + 0.5) * size[0], (j.ravel() + 0.5) * size[1],
+                                   (k.ravel() + 0.5) * size[2]]) + lo
+        yarn_index, orientations = textile.classify(centres)
+
+        with open(filename, "w") as f:
+            f.write("*Heading\nFile generated by the TexGen stand-in of bench_pipeline.py\n*Node\n")
+            nodes = np.column_stack([np.arange(1, xx.size + 1), xx.ravel(), yy.ravel(), zz.ravel()])
+            np.savetxt(f, nodes, fmt=["%d", "%.6f", "%.6f", "%.6f"], delimiter=", ")
+            f.write("*Element, Type=C3D8R\n")
+            np.savetxt(f, np.column_stack([elem_ids, connectivity]), fmt="%d", delimiter=", ")
+            sets = [("Matrix", elem_ids[yarn_index < 0])]
+            sets += [(f"Yarn{y}", elem_ids[yarn_index == y]) for y in np.unique(yarn_index[yarn_index >= 0])]
+            for name, ids in sets:
+                f.write(f"*ElSet, ElSet={name}\n")
+                ids = ids.tolist()
+                for start in range(0, len(ids), 16):
+                    chunk = ", ".join(map(str, ids[start:start + 16]))
+                    f.write(chunk + ("," if start + 16 < len(ids) else "") + "\n")
+
+        with open(os.path.splitext(filename)[0] + ".ori", "w") as f:
+            f.write("********************\n*** ORIENTATIONS ***\n********************\n")
+            in_yarn = yarn_index >= 0
+            np.savetxt(f, np.column_stack([elem_ids[in_yarn], orientations[in_yarn]]),
+                       fmt=["%d"] + ["%.6f"] * 6, delimiter=", ")
@@ -0,0 +1 @@
+from TexGen.Core import INP_EXPORT
@@ -0,0 +1,343 @@
+"""
+Benchmark of the Meso.py mesh handling on synthetic TexGen-style voxel meshes.
+
+Writes a rectangular voxel mesh (.inp with Yarn/Matrix element sets and a .ori file)
+at several resolutions, checks that Meso.parse_inp reads the same mesh as the original
+line-by-line parser and that Meso.write_sc writes the same bytes as the original
+writer, and reports the time of both. The "mesh" stage compares re-reading the
+exported .inp/.ori files (Meso.load_mesh) with rebuilding the same mesh from the
+cached Meso.voxel_topology. The parse and write checks are also run on a small mesh
+whose coordinates are written like TexGen writes them ("%.6f" and "%e" text, with
+-0.0 values). The original writer copies that text through while write_sc prints the
+repr() of the parsed value, so there the .sc files must hold the same numbers (down to
+the sign of zero) in the same layout rather than the same bytes.
+
+    python bench_meso.py                       # 20x20x10, 40x40x20, 80x80x40
+    python bench_meso.py --sizes 40x40x20 --repeat 5
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+import Meso
+
+
+def write_synthetic_mesh(prefix, nx, ny, nz, seed=0, coord_format="%r"):
+    """
+    Write prefix.inp / prefix.ori for an nx*ny*nz voxel grid over a 2 x 2 x 0.2 box,
+    numbered like TexGen's rectangular voxel mesh (x fastest, then y, then z).
+    Roughly half of the voxels go to a "Yarn0" set, the rest to "Matrix".
+    With a coord_format other than "%r" the box is centred on the origin and the
+    coordinates get a little noise, so the text has rounded and "-0.000000" values.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.arange(nx + 1) * (2.0 / nx)
+    y = np.arange(ny + 1) * (2.0 / ny)
+    z = np.arange(nz + 1) * (0.2 / nz)
+    zz, yy, xx = np.meshgrid(z, y, x, indexing="ij")
+    if coord_format != "%r":
+        xx, yy = xx - 1.0, yy - 1.0
+        xx, yy, zz = (v + rng.normal(scale=1e-9, size=v.shape) for v in (xx, yy, zz))
+    n_node = xx.size
+    node_ids = np.arange(1, n_node + 1)
+
+    k, j, i = np.meshgrid(np.arange(nz), np.arange(ny), np.arange(nx), indexing="ij")
+    base = (i + j * (nx + 1) + k * (nx + 1) * (ny + 1)).ravel() + 1
+    layer = (nx + 1) * (ny + 1)
+    bottom = np.stack([base, base + 1, base + nx + 2, base + nx + 1], axis=1)
+    connectivity = np.hstack([bottom, bottom + layer])
+    elem_ids = np.arange(1, len(base) + 1)
+    is_yarn = rng.random(len(elem_ids)) < 0.5
+
+    with open(prefix + ".inp", "w") as f:
+        f.write("*Heading\nFile generated by bench_meso.py\n*Node\n")
+        rows = zip(node_ids.tolist(), xx.ravel().tolist(), yy.ravel().tolist(), zz.ravel().tolist())
+        row_format = "%d, {0}, {0}, {0}\n".format(coord_format)
+        f.writelines(row_format % row for row in rows)
+        f.write("*Element, Type=C3D8R\n")
+        rows = np.column_stack([elem_ids, connectivity]).tolist()
+        f.writelines(", ".join(map(str, row)) + "\n" for row in rows)
+        for name, ids in (("Yarn0", elem_ids[is_yarn]), ("Matrix", elem_ids[~is_yarn])):
+            f.write("*ElSet, ElSet=%s\n" % name)
+            ids = ids.tolist()
+            for start in range(0, len(ids), 16):
+                chunk = ", ".join(map(str, ids[start:start + 16]))
+                f.write(chunk + ("," if start + 16 < len(ids) else "") + "\n")
+
+    with open(prefix + ".ori", "w") as f:
+        f.write("********************\n*** ORIENTATIONS ***\n********************\n")
+        for elem_id in elem_ids[is_yarn].tolist():
+            f.write("%d, 0.9, 0.1, 0.0, -0.1, 0.9, 0.2\n" % elem_id)
+
+
+# ---------------------------------------------------------------------------
+# Original line-by-line parser and writer, kept as the reference implementation
+# ---------------------------------------------------------------------------
+
+def legacy_merge_continuation_lines(lines):
+    merged = []
+    accumulator = ""
+    for line in lines:
+        stripped = line.rstrip("\n").strip()
+        if not stripped:
+            continue
+        if accumulator:
+            accumulator += " " + stripped
+        else:
+            accumulator = stripped
+        if accumulator.endswith(','):
+            accumulator = accumulator.rstrip(',')
+            continue
+        else:
+            merged.append(accumulator)
+            accumulator = ""
+    if accumulator:
+        merged.append(accumulator)
+    return merged
+
+def legacy_parse_inp(inp_filename):
+    with open(inp_filename, 'r') as f:
+        raw_lines = f.readlines()
+    lines = legacy_merge_continuation_lines(raw_lines)
+
+    nodes = []
+    elements = []
+    elem_to_mat = {}
+    current_set = None
+    in_set_block = False
+    node_section = False
+    element_section = False
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.lower().startswith("*elset"):
+            parts = [p.strip() for p in line.split(',') if p.strip()]
+            set_name = None
+            for part in parts:
+                if "elset=" in part.lower():
+                    set_name = part.split('=')[1].strip()
+                    break
+            if set_name:
+                current_set = set_name
+                in_set_block = True
+            else:
+                current_set = None
+                in_set_block = False
+            continue
+        if line.startswith("*"):
+            in_set_block = False
+            if line.lower().startswith("*node"):
+                node_section = True
+                element_section = False
+            elif line.lower().startswith("*element"):
+                element_section = True
+                node_section = False
+            else:
+                node_section = False
+                element_section = False
+            continue
+        if in_set_block and current_set:
+            nums = line.replace(',', ' ').split()
+            for num in nums:
+                if "yarn" in current_set.lower():
+                    elem_to_mat[num] = 1
+                elif "matrix" in current_set.lower():
+                    elem_to_mat[num] = 2
+            continue
+        if node_section:
+            parts = [p.strip() for p in line.split(',') if p.strip()]
+            if len(parts) >= 4:
+                nodes.append((parts[0], parts[1], parts[2], parts[3]))
+        elif element_section:
+            parts = [p.strip() for p in line.split(',') if p.strip()]
+            if len(parts) < 9:
+                parts = line.split()
+            if not parts[0][0].isdigit():
+                continue
+            if len(parts) >= 9:
+                elements.append((parts[0], parts[1:9]))
+            else:
+                raise ValueError("Element line does not have at least 9 entries: " + line)
+    return nodes, elements, elem_to_mat
+
+def legacy_read_ori(ori_filename):
+    ori_data = {}
+    with open(ori_filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            while line and line[0] in "#*":
+                line = line[1:].strip()
+            tokens = line.replace(",", " ").split()
+            if not tokens:
+                continue
+            if not tokens[0].isdigit():
+                continue
+            if len(tokens) < 7:
+                continue
+            ori_data[tokens[0]] = [tokens[i] for i in range(1, 7)]
+    return ori_data
+
+def legacy_write_sc(sc_filename, nodes, elements, elem_to_mat, k11, k22, k33, orientation_data=None,
+                    volume=0.44):
+    N_node = len(nodes)
+    N_elem = len(elements)
+    with open(sc_filename, 'w') as f:
+        f.write("2 0 1 0 \t # Analysis_type  elem_type trans_flag temp_flag\n\n")
+        f.write("3 {} {} 2 0 0 \t # nSG nNode nElem nMat nSlave nLayer\n".format(N_node, N_elem))
+        for node in nodes:
+            node_id, x, y, z = node
+            f.write("{} {} {} {}\n".format(node_id, x, y, z))
+        f.write("\n")
+        for elem in elements:
+            elem_id, node_ids = elem
+            mat_id = elem_to_mat.get(elem_id, 2)
+            if len(node_ids) != 8:
+                raise ValueError("Element {} does not have 8 nodes.".format(elem_id))
+            line = "{} {} {} {} {} {} {} {} {} {}".format(
+                elem_id, mat_id,
+                node_ids[0], node_ids[1], node_ids[2], node_ids[3],
+                node_ids[4], node_ids[5], node_ids[6], node_ids[7]
+            )
+            zeros_str = " ".join(["0"] * 12)
+            f.write(line + " " + zeros_str + "\n")
+        f.write("\n")
+        if orientation_data is not None:
+            for elem in elements:
+                elem_id, _ = elem
+                if elem_id in orientation_data:
+                    oris = orientation_data[elem_id]
+                    ori_line = "{}  {}  {}  {}    {}  {}  {}  0 0 0".format(
+                        elem_id, oris[0], oris[1], oris[2],
+                        oris[3], oris[4], oris[5]
+                    )
+                else:
+                    ori_line = "{} 0 0 0 0 0 0 0 0 0".format(elem_id)
+                f.write(ori_line + "\n")
+            f.write("\n")
+        f.write("1 1 1 \t # mat_type isotropy ntemp (This is for fiber)\n")
+        f.write("0 0 # T and Rho\n")
+        f.write("{} {} {} # k11 k22 k33\n\n".format(k11, k22, k33))
+        f.write("2 0 1 \t # mat_type isotropy ntemp (This is for matrix)\n")
+        f.write("0 0 # T and Rho\n")
+        f.write("0.180 # k\n\n")
+        f.write("{} \t #Homogenized SG Volume".format(volume))  # was the constant 0.44
+
+
+# ---------------------------------------------------------------------------
+
+def check_parse(inp_filename):
+    """Assert that Meso.parse_inp and the legacy parser read the same mesh."""
+    nodes, elements, elem_to_mat = legacy_parse_inp(inp_filename)
+    mesh = Meso.parse_inp(inp_filename)
+    assert np.array_equal(mesh.node_ids, [int(n[0]) for n in nodes])
+    assert np.array_equal(mesh.coords, [[float(v) for v in n[1:]] for n in nodes])
+    assert np.array_equal(mesh.elem_ids, [int(e[0]) for e in elements])
+    assert np.array_equal(mesh.connectivity, [[int(v) for v in e[1]] for e in elements])
+    assert np.array_equal(Meso.element_materials(mesh), [elem_to_mat.get(e[0], 2) for e in elements])
+
+def same_numbers(text_a, text_b):
+    """True if two texts have the same tokens on the same lines, numbers compared by their float64 bits."""
+    lines_a, lines_b = text_a.splitlines(), text_b.splitlines()
+    if len(lines_a) != len(lines_b):
+        return False
+    for line_a, line_b in zip(lines_a, lines_b):
+        tokens_a, tokens_b = line_a.split(), line_b.split()
+        if len(tokens_a) != len(tokens_b):
+            return False
+        for a, b in zip(tokens_a, tokens_b):
+            if a == b:
+                continue
+            try:
+                if np.float64(a).tobytes() != np.float64(b).tobytes():
+                    return False
+            except ValueError:
+                return False
+    return True
+
+def check_write(prefix, k_values=(2.5, 0.75, 0.75), exact=True):
+    """
+    Assert that Meso.write_mesh_sc writes the same bytes as the original writer,
+    or with exact=False the same numbers in the same layout.
+    """
+    nodes, elements, elem_to_mat = legacy_parse_inp(prefix + ".inp")
+    mesh = Meso.load_mesh(prefix + ".inp", prefix + ".ori")
+    legacy_write_sc(prefix + "_legacy.sc", nodes, elements, elem_to_mat, *k_values,
+                    legacy_read_ori(prefix + ".ori"), Meso.mesh_volume(mesh.coords))
+    Meso.write_mesh_sc(prefix + ".sc", mesh, k_values)
+    with open(prefix + "_legacy.sc", "rb") as f_legacy, open(prefix + ".sc", "rb") as f_new:
+        legacy, new = f_legacy.read(), f_new.read()
+    if exact:
+        assert legacy == new, "write_sc output differs from the original writer"
+    else:
+        assert same_numbers(legacy.decode(), new.decode()), "write_sc numbers differ from the original writer"
+
+def check_topology(prefix, nx, ny, nz):
+    """Assert that a cached voxel_topology rebuilds the mesh read from the .inp/.ori files."""
+    mesh = Meso.load_mesh(prefix + ".inp", prefix + ".ori")
+    rebuilt = Meso.voxel_mesh(Meso.voxel_topology(nx, ny, nz), (0.0, 0.0, 0.0), (2.0, 2.0, 0.2),
+                              mesh.mat_ids, mesh.orientations)
+    for name in Meso.MesoMesh._fields:
+        assert np.array_equal(getattr(mesh, name), getattr(rebuilt, name), equal_nan=True), name
+
+def best_time(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Meso.py mesh handling")
+    parser.add_argument("--sizes", nargs="+", default=["20x20x10", "40x40x20", "80x80x40"],
+                        help="Voxel grids as NXxNYxNZ")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repeats, the best one is reported")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_meso_")
+    try:
+        print(f"{'grid':>12} {'elements':>9} {'stage':>6} {'legacy':>9} {'new':>9} {'speedup':>8}")
+        for size in args.sizes:
+            nx, ny, nz = (int(v) for v in size.lower().split("x"))
+            prefix = os.path.join(workdir, f"mesh_{size}")
+            write_synthetic_mesh(prefix, nx, ny, nz)
+            check_parse(prefix + ".inp")
+            check_write(prefix)
+            check_topology(prefix, nx, ny, nz)
+            if size == args.sizes[0]:
+                for coord_format in ("%.6f", "%e"):
+                    write_synthetic_mesh(prefix + "_text", nx, ny, nz, coord_format=coord_format)
+                    check_parse(prefix + "_text.inp")
+                    check_write(prefix + "_text", exact=False)
+
+            t_legacy = best_time(legacy_parse_inp, prefix + ".inp", repeat=args.repeat)
+            t_new = best_time(Meso.parse_inp, prefix + ".inp", repeat=args.repeat)
+            print(f"{size:>12} {nx * ny * nz:>9} {'parse':>6} {t_legacy:>8.3f}s {t_new:>8.3f}s {t_legacy / t_new:>7.1f}x")
+
+            nodes, elements, elem_to_mat = legacy_parse_inp(prefix + ".inp")
+            ori_data = legacy_read_ori(prefix + ".ori")
+            mesh = Meso.load_mesh(prefix + ".inp", prefix + ".ori")
+            t_legacy = best_time(legacy_write_sc, prefix + "_legacy.sc", nodes, elements, elem_to_mat,
+                                 2.5, 0.75, 0.75, ori_data, repeat=args.repeat)
+            t_new = best_time(Meso.write_mesh_sc, prefix + ".sc", mesh, (2.5, 0.75, 0.75), repeat=args.repeat)
+            print(f"{size:>12} {nx * ny * nz:>9} {'write':>6} {t_legacy:>8.3f}s {t_new:>8.3f}s {t_legacy / t_new:>7.1f}x")
+
+            # Per-sample mesh handling: re-reading the exported files vs. reusing the cached topology
+            Meso.voxel_topology(nx, ny, nz)
+            t_legacy = best_time(Meso.load_mesh, prefix + ".inp", prefix + ".ori", repeat=args.repeat)
+            t_new = best_time(lambda: Meso.voxel_mesh(Meso.voxel_topology(nx, ny, nz), (0.0, 0.0, 0.0),
+                                                      (2.0, 2.0, 0.2), mesh.mat_ids, mesh.orientations),
+                              repeat=args.repeat)
+            print(f"{size:>12} {nx * ny * nz:>9} {'mesh':>6} {t_legacy:>8.3f}s {t_new:>8.3f}s {t_legacy / t_new:>7.1f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+End-to-end benchmark of the homogenization pipeline with local stand-ins for the tools.
+
+bench_fakes/ holds fake gmsh and Swiftcomp executables and a fake TexGen package that
+write outputs of the real size (.msh, .inp/.ori, .sc.k) after a configurable latency.
+They are put first on PATH / sys.path, a spreadsheet of random samples is run through
+Fullscript.main serially and with a process pool, and every stage of process_row is
+timed:
+
+    geo              .geo templating (geo_text)
+    gmsh             gmsh run
+    micro_mesh       in-process cell mesh (hex_cell_mesh, --msh-format structured)
+    micro_sc         .msh -> Trial.sc (read_msh and write_micro_sc)
+    micro_swiftcomp  SwiftComp on Trial.sc
+    voxelize         NumPy weave voxelizer (weave_voxels.voxel_yarns, the default)
+    texgen           TexGen calls (weave, domain, point queries or voxel export)
+    meso_mesh        voxel mesh assembly (Meso.voxel_mesh / Meso.load_mesh)
+    meso_sc          Output.sc writing (Meso.write_mesh_sc)
+    meso_swiftcomp   SwiftComp on Output.sc
+    k_extract        .k parsing (read_k_matrix)
+    journal          result journal appends
+    excel            final table write (ResultJournal.compact)
+
+Before the runs, read_msh is checked to reject truncated binary meshes and unknown element
+types with a ValueError (check_malformed_msh).
+
+With zero latency the solver stages are pure process start-up, so the report shows how
+much of a row is Python glue; with realistic latencies it shows the end-to-end rate.
+
+    python bench_pipeline.py                             # 20 rows, serial and 4 workers
+    python bench_pipeline.py --rows 200 --workers 1 8 --swiftcomp-latency 0.5
+    python bench_pipeline.py --json bench.json           # also save the numbers
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+FAKES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fakes")
+
+STAGES = ["geo", "gmsh", "micro_mesh", "micro_sc", "micro_swiftcomp", "voxelize", "texgen", "meso_mesh", "meso_sc",
+          "meso_swiftcomp", "k_extract", "journal", "excel"]
+SOLVER_STAGES = {"gmsh", "micro_swiftcomp", "meso_swiftcomp", "texgen"}
+
+
+def install_fakes(gmsh_latency=0.0, swiftcomp_latency=0.0, texgen_latency=0.0, msh_elements=2000):
+    """Put the stand-ins first on PATH and the import path (also for worker processes)."""
+    os.environ["PATH"] = FAKES + os.pathsep + os.environ.get("PATH", "")
+    os.environ["PYTHONPATH"] = FAKES + os.pathsep + os.environ.get("PYTHONPATH", "")
+    os.environ["BENCH_GMSH_LATENCY"] = str(gmsh_latency)
+    os.environ["BENCH_SWIFTCOMP_LATENCY"] = str(swiftcomp_latency)
+    os.environ["BENCH_TEXGEN_LATENCY"] = str(texgen_latency)
+    os.environ["BENCH_MSH_ELEMENTS"] = str(msh_elements)
+    sys.path.insert(0, FAKES)
+
+
+class StageTimer:
+    """
+    Wraps pipeline functions so that each call appends {"stage", "seconds"} to a JSONL file.
+    Appending from every process keeps the timings of pool workers too (they are forked
+    with the wrapped functions in place).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def record(self, stage, seconds):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"stage": stage, "seconds": seconds}) + "\n")
+
+    def wrap(self, owner, name, stage):
+        func = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(stage if isinstance(stage, str) else stage(*args), time.perf_counter() - start)
+        setattr(owner, name, timed)
+
+    def totals(self):
+        calls = defaultdict(int)
+        seconds = defaultdict(float)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    calls[record["stage"]] += 1
+                    seconds[record["stage"]] += record["seconds"]
+        return calls, seconds
+
+
+def _subprocess_stage(cmd, *args):
+    if os.path.basename(cmd[0]) == "gmsh":
+        return "gmsh"
+    return "micro_swiftcomp" if cmd[1].startswith("Trial") else "meso_swiftcomp"
+
+
+def instrument(timer):
+    """Wrap the pipeline stages of Fullscript and Meso with timer."""
+    import Fullscript
+    import Meso
+    from result_journal import ResultJournal
+
+    timer.wrap(Fullscript, "geo_text", "geo")
+    timer.wrap(Fullscript, "hex_cell_mesh", "micro_mesh")
+    timer.wrap(Fullscript, "read_msh", "micro_sc")
+    timer.wrap(Fullscript, "write_micro_sc", "micro_sc")
+    timer.wrap(Fullscript, "voxel_yarns", "voxelize")
+    for name in ("create_plain_weave", "weave_domain_box", "voxel_point_information", "create_weave_voxel_mesh"):
+        timer.wrap(Fullscript, name, "texgen")
+    timer.wrap(Meso, "voxel_mesh", "meso_mesh")
+    timer.wrap(Meso, "load_mesh", "meso_mesh")
+    timer.wrap(Meso, "write_mesh_sc", "meso_sc")
+    timer.wrap(Fullscript, "read_k_matrix", "k_extract")
+    timer.wrap(Fullscript, "run_tool", _subprocess_stage)
+    timer.wrap(ResultJournal, "append", "journal")
+    timer.wrap(ResultJournal, "compact", "excel")
+
+
+def check_malformed_msh(workdir):
+    """Assert that read_msh gives a clear ValueError for truncated and unknown-element binary meshes."""
+    from msh_reader import read_msh
+    with open(os.path.join(workdir, "Trial.geo"), "w") as f:
+        f.write("volume fraction = 0.5;\n")
+    for file_format in ("msh2", "msh4"):
+        msh_file = os.path.join(workdir, f"{file_format}.msh")
+        subprocess.run([sys.executable, os.path.join(FAKES, "gmsh"), "-2", os.path.join(workdir, "Trial.geo"),
+                        "-format", file_format, "-bin", "-o", msh_file], check=True)
+        with open(msh_file, "rb") as f:
+            data = f.read()
+        start = data.index(b"$Elements\n") + len(b"$Elements\n")
+        if file_format == "msh2":
+            type_offset = data.index(b"\n", start) + 1  # after the element count line
+        else:
+            type_offset = start + 4 * 8 + 8  # after the section counts, entity dim and tag
+        broken = {"truncated": (data[:type_offset + 100], "truncated"),
+                  "unknown_type": (data[:type_offset] + struct.pack("<i", 99) + data[type_offset + 4:],
+                                   "Unsupported element type 99")}
+        for name, (content, message) in broken.items():
+            path = os.path.join(workdir, f"{file_format}_{name}.msh")
+            with open(path, "wb") as f:
+                f.write(content)
+            try:
+                read_msh(path)
+            except ValueError as e:
+                assert message in str(e), f"{file_format} {name}: {e}"
+            else:
+                raise AssertionError(f"{file_format} {name}: read_msh did not fail")
+
+def write_samples(path, n_rows, seed=0):
+    """Random plain weave samples over the physical ranges of the ANN inputs."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"Vf": rng.uniform(0.2, 0.8, n_rows),
+                       "Width to Spacing": rng.uniform(0.2, 0.95, n_rows),
+                       "Thickness to Spacing": rng.uniform(0.008, 0.5, n_rows)})
+    df.to_excel(path, index=False)
+
+
+def run_mode(timer, n_rows, n_workers, row_options, seed=0):
+    """Run Fullscript.main on n_rows samples in a scratch directory; returns the measurements."""
+    import Fullscript
+    from result_journal import ResultJournal
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    cwd = os.getcwd()
+    try:
+        os.chdir(workdir)
+        write_samples("samples.xlsx", n_rows, seed)
+        timer.path = os.path.join(workdir, "timings.jsonl")
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            Fullscript.main("samples.xlsx", n_workers, journal_file="samples.journal.jsonl", **row_options)
+        wall = time.perf_counter() - start
+        n_ok = len(ResultJournal("samples.journal.jsonl").completed())
+        calls, seconds = timer.totals()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"workers": n_workers, "rows": n_rows, "ok": n_ok, "wall": wall,
+            "rows_per_s": n_rows / wall, "calls": dict(calls), "seconds": dict(seconds)}
+
+
+def report(result):
+    print(f"\n{result['workers']} worker(s): {result['ok']}/{result['rows']} rows in {result['wall']:.2f}s "
+          f"-> {result['rows_per_s']:.2f} rows/s")
+    total = sum(result["seconds"].values())
+    print(f"  {'stage':<16} {'calls':>6} {'total':>9} {'per row':>9} {'share':>6}")
+    for stage in STAGES:
+        if stage not in result["calls"]:
+            continue
+        seconds = result["seconds"][stage]
+        print(f"  {stage:<16} {result['calls'][stage]:>6} {seconds:>8.3f}s "
+              f"{1000 * seconds / result['rows']:>7.1f}ms {100 * seconds / total:>5.1f}%")
+    glue = sum(v for k, v in result["seconds"].items() if k not in SOLVER_STAGES)
+    print(f"  Python glue: {glue:.3f}s of {total:.3f}s timed "
+          f"({1000 * glue / result['rows']:.1f}ms per row)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the homogenization pipeline with fake tools")
+    parser.add_argument("--rows", type=int, default=20, help="Samples per run (default: 20)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4],
+                        help="Worker counts to run, 1 is the serial path (default: 1 4)")
+    parser.add_argument("--gmsh-latency", type=float, default=0.0, help="Seconds per fake gmsh run")
+    parser.add_argument("--swiftcomp-latency", type=float, default=0.0, help="Seconds per fake SwiftComp run")
+    parser.add_argument("--texgen-latency", type=float, default=0.0, help="Seconds per fake TexGen query/export")
+    parser.add_argument("--msh-elements", type=int, default=2000, help="Elements of the fake microscale mesh")
+    parser.add_argument("--msh-format", default="msh2", help="gmsh output format passed to Fullscript")
+    parser.add_argument("--texgen-export", action="store_true", help="Use the TexGen .inp/.ori export path")
+    parser.add_argument("--voxelizer", default="numpy", help="Mesoscale voxelizer passed to Fullscript")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random samples")
+    parser.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    install_fakes(args.gmsh_latency, args.swiftcomp_latency, args.texgen_latency, args.msh_elements)
+    row_options = {"cache": None, "texgen_export": args.texgen_export, "msh_format": args.msh_format,
+                   "voxelizer": args.voxelizer}
+
+    workdir = tempfile.mkdtemp(prefix="bench_msh_")
+    try:
+        check_malformed_msh(workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    timer = StageTimer(None)
+    instrument(timer)
+    results = []
+    for n_workers in args.workers:
+        result = run_mode(timer, args.rows, n_workers, row_options, args.seed)
+        report(result)
+        results.append(result)
+    if len(results) > 1:
+        base = results[0]["rows_per_s"]
+        print("\nSpeedup over the first run: " + ", ".join(
+            f"{r['workers']} worker(s) {r['rows_per_s'] / base:.2f}x" for r in results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"options": vars(args), "results": results}, f, indent=1)
+
+if __name__ == "__main__":
+    main()
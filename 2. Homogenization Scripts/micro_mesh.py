@@ -0,0 +1,140 @@
+"""
+Structured quad mesh of the hex packed microscale cell, built in-process with NumPy.
+
+The cell is the one of Fullscript.geo_text: the rectangle [-1/2, 1/2] x [-sqrt(3)/2, sqrt(3)/2]
+with a fiber of radius R at the centre and a quarter fiber at each corner. Its quarter
+[0, 1/2] x [0, sqrt(3)/2] is cut along the bisector between the fibers at (0, 0) and
+(1/2, sqrt(3)/2), which gives two halves that map onto each other by a half turn about
+(1/4, sqrt(3)/4). Each half is an O-grid around its quarter fiber:
+    - a square core of the fiber, side R / 2,
+    - a fiber ring from the core to the fiber surface,
+    - a matrix ring from the fiber surface to the cell edge and the bisector,
+with the nodes of the rings on rays of equal angle from the fiber centre; the fiber surface
+nodes sit on a circle chosen so that the fiber polygon has the area of the fiber, so the
+mesh holds the requested Vf. Seen from either
+centre the bisector spans 30..90 degrees, symmetric about its midpoint, so both halves put
+the same nodes on it. The quarter is then mirrored about x = 0 and y = 0.
+
+hex_cell_mesh returns the same (node_ids, coords, elements, n_node, n_elem) arrays as
+msh_reader.read_msh, so the mesh goes straight to the .sc writer:
+
+    write_micro_sc("Trial.sc", *hex_cell_mesh(calculate_R(Vf)))
+"""
+import numpy as np
+
+HALF_WIDTH = 0.5
+HALF_HEIGHT = np.sqrt(3) / 2
+FIBER, MATRIX = 1, 2  # physical groups of the .geo template
+
+# Node coordinates closer than this are merged where the pieces of the cell meet
+MERGE_DECIMALS = 9
+
+
+def _grid_quads(n_i, n_j, offset=0):
+    """CCW quads of a node grid stored as [i][j] with i along the first and j along the second axis."""
+    idx = offset + np.arange((n_i + 1) * (n_j + 1)).reshape(n_i + 1, n_j + 1)
+    return np.column_stack([idx[:-1, :-1].ravel(), idx[1:, :-1].ravel(),
+                            idx[1:, 1:].ravel(), idx[:-1, 1:].ravel()])
+
+
+def _half_cell(R, density, core=0.5):
+    """
+    Nodes and quads (with materials) of the half of the quarter cell around the fiber at the
+    origin: the fiber ring and the matrix ring have density layers, the quarter arc 3 * density
+    segments.
+    """
+    m = 3 * density
+    h = m // 2
+    theta = np.linspace(0.0, np.pi / 2, m + 1)
+    # Fiber surface nodes on a slightly larger circle, so that the polygon holds the area of the fiber
+    delta = theta[1]
+    R = min(R * np.sqrt(delta / np.sin(delta)), 0.5 * (HALF_WIDTH + R))
+    ray = np.column_stack([np.cos(theta), np.sin(theta)])
+    ray[0], ray[h], ray[-1] = (1.0, 0.0), (np.sqrt(0.5), np.sqrt(0.5)), (0.0, 1.0)
+
+    # Cell edge x = 1/2 up to 30 degrees, then the bisector at distance 1/2 from the centre
+    outer_r = np.where(theta <= np.pi / 6 + 1e-12, HALF_WIDTH / np.cos(theta), 0.5 / np.cos(theta - np.pi / 3))
+    outer = outer_r[:, None] * ray
+
+    # Core square [0, c]^2 with its edge nodes on the same rays as the rings
+    c = core * R
+    s = np.tan(theta[:h + 1])
+    s[-1] = 1.0
+    core_edge = c * np.column_stack([np.r_[np.ones(h), s[::-1]], np.r_[s, np.ones(h)]])
+    core_nodes = c * np.stack(np.meshgrid(s, s, indexing="ij"), axis=-1).reshape(-1, 2)
+
+    fraction = np.linspace(0.0, 1.0, density + 1)[:, None, None]
+    fiber_ring = core_edge + fraction * (R * ray - core_edge)
+    matrix_ring = R * ray + fraction * (outer - R * ray)
+
+    coords = [core_nodes, fiber_ring.reshape(-1, 2), matrix_ring.reshape(-1, 2)]
+    n_core = len(core_nodes)
+    n_ring = (density + 1) * (m + 1)
+    quads = [_grid_quads(h, h), _grid_quads(density, m, n_core), _grid_quads(density, m, n_core + n_ring)]
+    mats = [np.full(h * h, FIBER), np.full(density * m, FIBER), np.full(density * m, MATRIX)]
+    return np.vstack(coords), np.vstack(quads), np.concatenate(mats)
+
+
+def hex_cell_mesh(R, density=4):
+    """
+    Quad mesh of the hex packed cell with fibers of radius R (0 < R < 1/2).
+
+    Args:
+        R (float): Fiber radius, Fullscript.calculate_R(Vf).
+        density (int): Segments per 30 degrees of fiber surface (even); the fiber and the
+            matrix rings get as many layers. density = 4 gives 1056 quads.
+
+    Returns:
+        node_ids, coords (n, 2), elements (e, 11) as elem_no, mat_type, node1 ... node9
+        (unused nodes 0), n_node, n_elem.
+    """
+    if not 0 < R < HALF_WIDTH:
+        raise ValueError(f"Fiber radius {R} does not fit in the hex packed cell (0 < R < 0.5)")
+    if density < 2 or density % 2:
+        raise ValueError("density must be an even number of at least 2")
+
+    coords, quads, mats = _half_cell(R, density)
+    # Other half of the quarter cell: half turn about the midpoint between the fibers
+    n_half = len(coords)
+    coords = np.vstack([coords, (HALF_WIDTH, HALF_HEIGHT) - coords])
+    quads = np.vstack([quads, quads + n_half])
+    mats = np.concatenate([mats, mats])
+
+    # Mirror the quarter about x = 0 and y = 0; a mirror image runs clockwise, so its quads are reversed
+    all_coords, all_quads = [], []
+    for k, (sx, sy) in enumerate(((1, 1), (-1, 1), (-1, -1), (1, -1))):
+        all_coords.append(coords * (sx, sy))
+        all_quads.append(k * len(coords) + (quads if sx * sy > 0 else quads[:, ::-1]))
+    coords = np.vstack(all_coords)
+    quads = np.vstack(all_quads)
+    mats = np.tile(mats, 4)
+
+    # Merge the nodes shared by the pieces (+ 0.0 turns -0.0 into 0.0)
+    unique, node_of = np.unique(np.round(coords, MERGE_DECIMALS) + 0.0, axis=0, return_inverse=True)
+    node_of = node_of.ravel()
+    first = np.full(len(unique), len(coords))
+    np.minimum.at(first, node_of, np.arange(len(coords)))
+    coords = coords[first]
+    quads = node_of[quads] + 1
+
+    n_node, n_elem = len(coords), len(quads)
+    elements = np.zeros((n_elem, 11), dtype=np.int64)
+    elements[:, 0] = np.arange(1, n_elem + 1)
+    elements[:, 1] = mats
+    elements[:, 2:6] = quads
+    return np.arange(1, n_node + 1), coords, elements, n_node, n_elem
+
+
+def element_areas(coords, elements):
+    """Signed areas (positive when CCW) of the linear triangles and quads of a mesh with node ids 1..n."""
+    corners = elements[:, 2:6].copy()
+    triangle = corners[:, 3] == 0
+    corners[triangle, 3] = corners[triangle, 2]
+    x, y = coords[corners - 1, 0], coords[corners - 1, 1]
+    return 0.5 * np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1)
+
+
+def mesh_fiber_fraction(coords, elements):
+    """Area fraction of the fiber elements, to compare with the Vf the mesh was built for."""
+    area = np.abs(element_areas(coords, elements))
+    return area[elements[:, 1] == FIBER].sum() / area.sum()
@@ -0,0 +1,117 @@
+import os
+import json
+import tempfile
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+
+
+class MicroTable:
+    """
+    Table of the microscale fiber tow conductivities (k11, k22, k33) over Vf.
+
+    The tow conductivities only depend on Vf, so instead of running gmsh and
+    SwiftComp for every sample they are solved once on a grid of Vf values and
+    interpolated with monotone (PCHIP) splines, one per conductivity.
+
+    The error of the table is estimated by leave-one-out: every interior grid
+    point is predicted from the spline through the other points and compared
+    with its solved value. This overestimates the error of the full table (the
+    spacing is doubled around the left out point), so it is a safe bound to
+    refine against. refine() adds the midpoints of the intervals next to every
+    point whose estimate is above the tolerance.
+
+    The table is stored as JSON:
+
+        {"key": ..., "tolerance": 1e-3, "vf": [...], "k": [[k11, k22, k33], ...], "error": [...]}
+
+    key identifies the solver inputs the table was built from, so a table built
+    for other material constants can be detected and ignored.
+    """
+
+    def __init__(self, vf, k, tolerance=1e-3, key=None):
+        order = np.argsort(vf)
+        self.vf = np.asarray(vf, dtype=float)[order]
+        self.k = np.asarray(k, dtype=float).reshape(-1, 3)[order]
+        if len(self.vf) < 3 or np.any(np.diff(self.vf) <= 0):
+            raise ValueError("A microscale table needs at least 3 distinct Vf values")
+        self.tolerance = tolerance
+        self.key = key
+        self._spline = PchipInterpolator(self.vf, self.k, axis=0, extrapolate=False)
+        self.error = self.leave_one_out_error()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data["vf"], data["k"], data.get("tolerance", 1e-3), data.get("key"))
+
+    def save(self, path):
+        """Write the table atomically (temporary file renamed into place)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"key": self.key, "tolerance": self.tolerance,
+                       "vf": self.vf.tolist(), "k": self.k.tolist(),
+                       "error": self.error.tolist()}, f, indent=1)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def build(cls, solve, vf_grid, tolerance=1e-3, max_rounds=5, key=None, map_fn=map):
+        """
+        Solve the microscale cell on vf_grid and refine the table until the error
+        estimate is below tolerance (or max_rounds refinements were made).
+        solve(Vf) returns the 3x3 conductivity matrix; map_fn can be a pool's map.
+        """
+        vf_grid = np.unique(np.asarray(vf_grid, dtype=float))
+        k = [_diagonal(matrix) for matrix in map_fn(solve, vf_grid.tolist())]
+        table = cls(vf_grid, k, tolerance, key)
+        return table.refine(solve, max_rounds, map_fn)
+
+    def refine(self, solve, max_rounds=5, map_fn=map):
+        """Add grid points where the error estimate is above the tolerance; returns the refined table."""
+        table = self
+        for round_no in range(max_rounds):
+            new_vf = table.refinement_points()
+            if len(new_vf) == 0:
+                break
+            print(f"Micro table refinement {round_no + 1}: max error {table.error.max():.2E}, "
+                  f"adding {len(new_vf)} points")
+            new_k = [_diagonal(matrix) for matrix in map_fn(solve, new_vf.tolist())]
+            table = MicroTable(np.concatenate([table.vf, new_vf]),
+                               np.concatenate([table.k, np.reshape(new_k, (-1, 3))]),
+                               table.tolerance, table.key)
+        return table
+
+    def leave_one_out_error(self):
+        """Relative error (max over k11, k22, k33) of predicting each grid point from the others."""
+        error = np.zeros(len(self.vf))
+        for i in range(1, len(self.vf) - 1):
+            keep = np.arange(len(self.vf)) != i
+            predicted = PchipInterpolator(self.vf[keep], self.k[keep], axis=0)(self.vf[i])
+            error[i] = np.max(np.abs(predicted - self.k[i]) / np.abs(self.k[i]))
+        return error
+
+    def refinement_points(self):
+        """Midpoints of the intervals next to every grid point with an error above the tolerance."""
+        bad = np.flatnonzero(self.error > self.tolerance)
+        intervals = np.unique(np.concatenate([bad - 1, bad]))
+        intervals = intervals[(intervals >= 0) & (intervals < len(self.vf) - 1)]
+        return 0.5 * (self.vf[intervals] + self.vf[intervals + 1])
+
+    def covers(self, Vf):
+        return self.vf[0] <= Vf <= self.vf[-1]
+
+    def error_at(self, Vf):
+        """Error estimate of the interval holding Vf (the larger of its two end points)."""
+        i = min(max(np.searchsorted(self.vf, Vf) - 1, 0), len(self.vf) - 2)
+        return max(self.error[i], self.error[i + 1])
+
+    def __call__(self, Vf):
+        """Interpolated (k11, k22, k33) at Vf; raises ValueError outside the table."""
+        if not self.covers(Vf):
+            raise ValueError(f"Vf={Vf} is outside the microscale table [{self.vf[0]}, {self.vf[-1]}]")
+        return tuple(float(v) for v in self._spline(Vf))
+
+
+def _diagonal(matrix):
+    return [matrix[0][0], matrix[1][1], matrix[2][2]]
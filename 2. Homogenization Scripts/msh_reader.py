@@ -0,0 +1,261 @@
+"""
+Readers for the gmsh .msh files of the microscale cell.
+
+read_msh looks at the $MeshFormat header and dispatches to
+    - read_msh_ascii:    ASCII msh 2.2 (line by line, the original reader)
+    - read_msh2_binary:  binary msh 2.2
+    - read_msh4_binary:  binary msh 4.1
+The binary readers memory-map the file and pull the node and element blocks
+out with np.frombuffer, so finer meshes are not dominated by parsing time.
+
+All readers return (node_ids, coords, elements, n_node, n_elem) where coords
+holds the x, y of every node and elements has one row per triangle/quad:
+    elem_no, mat_type, node1 ... node9   (unused nodes set to 0)
+with mat_type the physical group of the element.
+"""
+import os
+import mmap
+import numpy as np
+
+# Number of nodes of the gmsh element types
+ELEMENT_NODES = {1: 2, 2: 3, 3: 4, 4: 4, 5: 8, 6: 6, 7: 5, 8: 3, 9: 6, 10: 9,
+                 11: 10, 12: 27, 13: 18, 14: 14, 15: 1, 16: 8, 17: 20}
+TRIANGLE = 2
+QUAD = 3
+
+
+def _read_line(data, pos):
+    """Return the line starting at pos (without its newline) and the position after it."""
+    end = data.find(b"\n", pos)
+    if end < 0:
+        end = len(data)
+    return data[pos:end].decode("ascii").strip(), end + 1
+
+def _skip_section(data, pos, name):
+    """Skip to just after the $End<name> line of the section whose header was just read."""
+    end = data.find(b"$End" + name.encode("ascii"), pos)
+    if end < 0:
+        raise ValueError("Section ${} is not terminated".format(name))
+    return _read_line(data, end)[1]
+
+def _frombuffer(data, dtype, count, offset):
+    """np.frombuffer of the mapped file, with a ValueError if the block runs past its end."""
+    dtype = np.dtype(dtype)
+    if count < 0 or offset + count * dtype.itemsize > len(data):
+        raise ValueError("Mesh file is truncated: a block of {} bytes at offset {} runs past its end ({} bytes)"
+                         .format(count * dtype.itemsize, offset, len(data)))
+    return np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+
+def _element_nodes(element_type):
+    """Number of nodes of a gmsh element type."""
+    if element_type not in ELEMENT_NODES:
+        raise ValueError("Unsupported element type {} in the mesh file".format(element_type))
+    return ELEMENT_NODES[element_type]
+
+def _surface_elements(elem_ids, mat_types, element_type, node_tags):
+    """Rows (elem_no, mat_type, node1 ... node9) for triangles and quads, None for other types."""
+    if element_type not in (TRIANGLE, QUAD):
+        return None
+    rows = np.zeros((len(elem_ids), 11), dtype=np.int64)
+    rows[:, 0] = elem_ids
+    rows[:, 1] = mat_types
+    rows[:, 2:2 + node_tags.shape[1]] = node_tags
+    return rows
+
+def _stack_elements(blocks):
+    if not blocks:
+        return np.empty((0, 11), dtype=np.int64)
+    return np.concatenate(blocks)
+
+def read_msh_ascii(msh_file):
+    """ASCII msh 2.2 reader (the original line-by-line parser)."""
+    nodes = []
+    elements = []
+    with open(msh_file, 'r') as file:
+        lines = file.readlines()
+        i = 0
+        while i < len(lines):
+            if lines[i].strip() == "$Nodes":
+                i += 1
+                n_node = int(lines[i].strip())
+                i += 1
+                for _ in range(n_node):
+                    node_info = lines[i].strip().split()
+                    nodes.append((int(node_info[0]), float(node_info[1]), float(node_info[2])))
+                    i += 1
+            elif lines[i].strip() == "$Elements":
+                i += 1
+                n_elem = int(lines[i].strip())
+                i += 1
+                for _ in range(n_elem):
+                    elem_info = lines[i].strip().split()
+                    if elem_info[1] == '2':  # 3-node triangle
+                        elements.append((int(elem_info[0]), int(elem_info[3]), int(elem_info[5]), int(elem_info[6]), int(elem_info[7]), 0, 0, 0, 0, 0, 0))
+                    elif elem_info[1] == '3':  # 4-node quadrilateral
+                        elements.append((int(elem_info[0]), int(elem_info[3]), int(elem_info[5]), int(elem_info[6]), int(elem_info[7]), int(elem_info[8]), 0, 0, 0, 0, 0))
+                    i += 1
+            else:
+                i += 1
+    node_ids = np.array([node[0] for node in nodes], dtype=np.int64)
+    coords = np.array([node[1:] for node in nodes], dtype=np.float64).reshape(-1, 2)
+    elements = np.array(elements, dtype=np.int64).reshape(-1, 11)
+    return node_ids, coords, elements, n_node, n_elem
+
+def read_msh2_binary(data, pos):
+    """Binary msh 2.2 reader; data is the mapped file and pos the offset after $EndMeshFormat."""
+    node_ids = coords = elements = None
+    n_node = n_elem = 0
+    while pos < len(data):
+        header, pos = _read_line(data, pos)
+        if header == "$Nodes":
+            count, pos = _read_line(data, pos)
+            n_node = int(count)
+            node_dtype = np.dtype([("id", "<i4"), ("xyz", "<f8", 3)])
+            nodes = _frombuffer(data, dtype=node_dtype, count=n_node, offset=pos)
+            node_ids = nodes["id"].astype(np.int64)
+            coords = nodes["xyz"][:, :2].copy()
+            pos = _skip_section(data, pos + n_node * node_dtype.itemsize, "Nodes")
+        elif header == "$Elements":
+            count, pos = _read_line(data, pos)
+            n_elem = int(count)
+            blocks = []
+            read = 0
+            while read < n_elem:
+                element_type, n_in_block, n_tags = _frombuffer(data, dtype="<i4", count=3, offset=pos)
+                pos += 12
+                n_nodes = _element_nodes(int(element_type))
+                width = 1 + int(n_tags) + n_nodes
+                block = _frombuffer(data, dtype="<i4", count=int(n_in_block) * width, offset=pos)
+                block = block.reshape(-1, width).astype(np.int64)
+                pos += block.size * 4
+                read += int(n_in_block)
+                # The first tag is the physical group
+                mat_types = block[:, 1] if n_tags > 0 else np.zeros(len(block), dtype=np.int64)
+                rows = _surface_elements(block[:, 0], mat_types, int(element_type), block[:, 1 + int(n_tags):])
+                if rows is not None:
+                    blocks.append(rows)
+            elements = _stack_elements(blocks)
+            pos = _skip_section(data, pos, "Elements")
+        elif header.startswith("$"):
+            pos = _skip_section(data, pos, header[1:])
+    if node_ids is None or elements is None:
+        raise ValueError("Mesh file has no $Nodes or no $Elements section")
+    return node_ids, coords, elements, n_node, n_elem
+
+def read_msh4_binary(data, pos, size_t):
+    """
+    Binary msh 4.1 reader; data is the mapped file, pos the offset after $EndMeshFormat
+    and size_t the data size from the header. Elements only carry their entity tag in
+    msh4, so the physical group comes from the surface entities in $Entities.
+    """
+    size_dtype = "<u{}".format(size_t)
+    physical = {}  # (dim, entity tag) -> first physical tag
+    node_ids = coords = elements = None
+    n_node = n_elem = 0
+
+    def sizes(count, offset):
+        return _frombuffer(data, dtype=size_dtype, count=count, offset=offset).astype(np.int64)
+
+    def ints(count, offset):
+        return _frombuffer(data, dtype="<i4", count=count, offset=offset).astype(np.int64)
+
+    while pos < len(data):
+        header, pos = _read_line(data, pos)
+        if header == "$Entities":
+            counts = sizes(4, pos)
+            pos += 4 * size_t
+            for dim, n_entities in enumerate(counts):
+                for _ in range(int(n_entities)):
+                    tag = int(ints(1, pos)[0])
+                    pos += 4 + (3 if dim == 0 else 6) * 8  # point coordinates or bounding box
+                    n_physical = int(sizes(1, pos)[0])
+                    pos += size_t
+                    tags = ints(n_physical, pos)
+                    pos += 4 * n_physical
+                    if n_physical:
+                        physical[(dim, tag)] = int(tags[0])
+                    if dim > 0:
+                        n_bounding = int(sizes(1, pos)[0])
+                        pos += size_t + 4 * n_bounding
+            pos = _skip_section(data, pos, "Entities")
+        elif header == "$Nodes":
+            n_blocks, n_node = (int(v) for v in sizes(2, pos))
+            pos += 4 * size_t
+            id_blocks = []
+            xyz_blocks = []
+            for _ in range(n_blocks):
+                entity_dim, _, parametric = (int(v) for v in ints(3, pos))
+                n_in_block = int(sizes(1, pos + 12)[0])
+                pos += 12 + size_t
+                id_blocks.append(sizes(n_in_block, pos))
+                pos += n_in_block * size_t
+                width = 3 + (entity_dim if parametric else 0)
+                block = _frombuffer(data, dtype="<f8", count=n_in_block * width, offset=pos)
+                xyz_blocks.append(block.reshape(-1, width)[:, :2])
+                pos += block.size * 8
+            node_ids = np.concatenate(id_blocks) if id_blocks else np.empty(0, dtype=np.int64)
+            coords = np.concatenate(xyz_blocks) if xyz_blocks else np.empty((0, 2))
+            pos = _skip_section(data, pos, "Nodes")
+        elif header == "$Elements":
+            n_blocks, n_elem = (int(v) for v in sizes(2, pos))
+            pos += 4 * size_t
+            blocks = []
+            for _ in range(n_blocks):
+                entity_dim, entity_tag, element_type = (int(v) for v in ints(3, pos))
+                n_in_block = int(sizes(1, pos + 12)[0])
+                pos += 12 + size_t
+                width = 1 + _element_nodes(element_type)
+                block = sizes(n_in_block * width, pos).reshape(-1, width)
+                pos += block.size * size_t
+                mat_types = np.full(n_in_block, physical.get((entity_dim, entity_tag), 0), dtype=np.int64)
+                rows = _surface_elements(block[:, 0], mat_types, element_type, block[:, 1:])
+                if rows is not None:
+                    blocks.append(rows)
+            elements = _stack_elements(blocks)
+            pos = _skip_section(data, pos, "Elements")
+        elif header.startswith("$"):
+            pos = _skip_section(data, pos, header[1:])
+    if node_ids is None or elements is None:
+        raise ValueError("Mesh file has no $Nodes or no $Elements section")
+    return node_ids, coords, elements, n_node, n_elem
+
+def read_msh(msh_file):
+    """Read a gmsh .msh file of the microscale cell in any of the supported formats."""
+    if os.path.getsize(msh_file) == 0:
+        raise ValueError("{} is empty, not a gmsh mesh file".format(msh_file))
+    error = None
+    with open(msh_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        try:
+            result = _read_mapped(data, msh_file)
+        except Exception as e:
+            # The frames of the traceback hold views of the mapping, which then could not be closed
+            error = e.with_traceback(None)
+        else:
+            # Copy the arrays out of the mapping, which is closed on leaving the block
+            result = tuple(np.array(v) if isinstance(v, np.ndarray) else v for v in result)
+    if error is not None:
+        raise error
+    return result
+
+def _read_mapped(data, msh_file):
+    header, pos = _read_line(data, 0)
+    if header != "$MeshFormat":
+        raise ValueError("{} is not a gmsh mesh file".format(msh_file))
+    fields = _read_line(data, pos)[0].split()
+    if len(fields) < 3:
+        raise ValueError("{} has an invalid $MeshFormat section".format(msh_file))
+    version, file_type, data_size = fields[:3]
+    if file_type == "0":
+        if not version.startswith("2"):
+            raise ValueError("ASCII msh {} is not supported, use msh2 or a binary format".format(version))
+        return read_msh_ascii(msh_file)
+
+    _, pos = _read_line(data, pos)
+    if pos + 4 > len(data) or _frombuffer(data, dtype="<i4", count=1, offset=pos)[0] != 1:
+        raise ValueError("Big-endian binary mesh files are not supported")
+    pos = _skip_section(data, pos + 4, "MeshFormat")
+    if version.startswith("2"):
+        return read_msh2_binary(data, pos)
+    if version.startswith("4.1"):
+        return read_msh4_binary(data, pos, int(data_size))
+    raise ValueError("Binary msh {} is not supported".format(version))
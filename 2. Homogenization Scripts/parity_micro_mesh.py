@@ -0,0 +1,86 @@
+"""
+Parity check of the in-process structured microscale mesh (micro_mesh.py) against gmsh.
+
+For every Vf the microscale step is run twice without the cache: once through the .geo
+template, gmsh and the .msh reader, once with hex_cell_mesh, both followed by SwiftComp.
+The report lists the fiber fraction each mesh really holds, its size and the relative
+difference of the homogenized k11, k22, k33; the exit status is 1 if any difference is
+above --tol.
+
+    python parity_micro_mesh.py                          # Vf 0.2 .. 0.8, structured density 4
+    python parity_micro_mesh.py --vf 0.05 0.5 0.9 --density 8 --tol 0.002
+    python parity_micro_mesh.py --fakes                  # plumbing only, with bench_fakes/
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+from msh_reader import read_msh
+from micro_mesh import hex_cell_mesh, mesh_fiber_fraction
+
+
+def gmsh_route(Vf, workdir):
+    """k matrix, fiber fraction and element count of the gmsh route."""
+    import Fullscript
+    matrix = Fullscript.run_micro(Vf, workdir, msh_format="msh2")
+    _, coords, elements, _, n_elem = read_msh(os.path.join(workdir, "Trial.msh"))
+    return np.array(matrix), mesh_fiber_fraction(coords, elements), n_elem
+
+
+def structured_route(Vf, workdir):
+    """k matrix, fiber fraction and element count of the structured mesh."""
+    import Fullscript
+    matrix = Fullscript.run_micro(Vf, workdir, msh_format=Fullscript.STRUCTURED)
+    _, coords, elements, _, n_elem = hex_cell_mesh(Fullscript.calculate_R(Vf), Fullscript.MICRO_MESH_DENSITY)
+    return np.array(matrix), mesh_fiber_fraction(coords, elements), n_elem
+
+
+def compare(vf_values, tol):
+    worst = 0.0
+    print(f"{'Vf':>6} {'Vf gmsh':>8} {'Vf struct':>9} {'elems':>11}   "
+          f"{'dk11':>9} {'dk22':>9} {'dk33':>9}")
+    for Vf in vf_values:
+        results = []
+        for route in (gmsh_route, structured_route):
+            workdir = tempfile.mkdtemp(prefix="parity_")
+            try:
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    results.append(route(Vf, workdir))
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+        (k_gmsh, vf_gmsh, n_gmsh), (k_struct, vf_struct, n_struct) = results
+        diff = [abs(k_struct[i][i] - k_gmsh[i][i]) / abs(k_gmsh[i][i]) for i in range(3)]
+        worst = max(worst, *diff)
+        flag = "  <-- above tolerance" if max(diff) > tol else ""
+        print(f"{Vf:>6.3f} {vf_gmsh:>8.4f} {vf_struct:>9.4f} {n_gmsh:>5}/{n_struct:<5}   "
+              + " ".join(f"{d:>9.2E}" for d in diff) + flag)
+    print(f"\nLargest relative difference {worst:.2E} (tolerance {tol:.0E})")
+    return worst <= tol
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the structured microscale mesh with the gmsh route")
+    parser.add_argument("--vf", type=float, nargs="+", default=[0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8],
+                        help="Fiber volume fractions to compare (default: 0.2 .. 0.8)")
+    parser.add_argument("--density", type=int, default=None,
+                        help="Structured mesh density (default: Fullscript.MICRO_MESH_DENSITY)")
+    parser.add_argument("--tol", type=float, default=5e-3,
+                        help="Largest accepted relative difference of k11, k22, k33 (default: 5e-3)")
+    parser.add_argument("--fakes", action="store_true",
+                        help="Use the gmsh/SwiftComp stand-ins of bench_fakes/ (checks the plumbing, not the physics)")
+    args = parser.parse_args()
+
+    if args.fakes:
+        from bench_pipeline import install_fakes
+        install_fakes()
+    import Fullscript
+    if args.density is not None:
+        Fullscript.MICRO_MESH_DENSITY = args.density
+    sys.exit(0 if compare(args.vf, args.tol) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import json
+
+
+class ResultJournal:
+    """
+    Append-only JSONL checkpoint of a homogenization campaign.
+
+    Every finished sample adds one line such as
+
+        {"index": 12, "status": "ok", "k11": 1.2, "k33": 0.31}
+
+    which is flushed and fsync'ed right away, so an interrupted run loses at
+    most the sample that was being written. A truncated last line is ignored
+    when the journal is read back. When a row appears several times (e.g. a
+    failure followed by a successful retry) the last record wins.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def records(self):
+        """Return {index: record} for every row in the journal."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    records[record["index"]] = record
+                except (ValueError, KeyError, TypeError):
+                    continue  # partial line left by an interrupted run
+        return records
+
+    def completed(self):
+        """Return the set of row indices that finished successfully."""
+        return {index for index, record in self.records().items() if record.get("status") == "ok"}
+
+    def append(self, index, k11, k33, **extra):
+        """Record the result of one row; k11/k33 of None marks a failure."""
+        if self._file is None:
+            self._open()
+        status = "ok" if k11 is not None and k33 is not None else "failed"
+        record = {"index": int(index), "status": status, "k11": k11, "k33": k33}
+        record.update(extra)
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _open(self):
+        needs_newline = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        self._file = open(self.path, "a")
+        if needs_newline:
+            self._file.write("\n")  # start clean after a truncated record
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def compact(self, df, output_file):
+        """Fill the k11/k33 columns of df from the journal and write the final table (.xlsx or .csv) once."""
+        for index, record in self.records().items():
+            if record.get("status") == "ok" and index in df.index:
+                df.at[index, "k11"] = record["k11"]
+                df.at[index, "k33"] = record["k33"]
+        if output_file.endswith(".csv"):
+            df.to_csv(output_file)
+        else:
+            df.to_excel(output_file, index=False)
+        return df
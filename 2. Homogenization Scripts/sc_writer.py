@@ -0,0 +1,139 @@
+import numpy as np
+
+# Rows formatted per write call; bounds the size of the temporary byte buffers.
+CHUNK_ROWS = 200000
+
+_ZERO = ord("0")
+
+
+def _int_field(values):
+    """
+    Slot filler for the decimal text of an int column (same text as str()).
+    Returns (width, fill) with fill(chars, valid) writing the right-aligned text
+    into (width, n) slot tables.
+    """
+    values = values.astype(np.int64)
+    negative = values < 0
+    magnitude = np.abs(values)
+    n_digits = np.ones(len(values), dtype=np.int64)
+    power = 10
+    while len(values) and power <= magnitude.max():
+        n_digits += magnitude >= power
+        power *= 10
+    max_digits = int(n_digits.max(initial=1))
+    width = max_digits + int(negative.any())
+
+    def fill(chars, valid):
+        rest = magnitude
+        for d in range(max_digits):
+            quotient = rest // 10
+            chars[width - 1 - d] = _ZERO + (rest - quotient * 10)
+            np.greater(n_digits, d, out=valid[width - 1 - d])
+            rest = quotient
+        if width > max_digits:
+            valid[0] = False
+            rows = np.flatnonzero(negative)
+            sign_slot = width - 1 - n_digits[rows]
+            chars[sign_slot, rows] = ord("-")
+            valid[sign_slot, rows] = True
+    return width, fill
+
+def _float_field(values):
+    """
+    Slot filler for the repr() text of a float column, left-aligned in its slot.
+    Each distinct value is formatted once and gathered to every row holding it;
+    voxel coordinates and orientations repeat the same few values over and over.
+    Values are told apart by their bit pattern, so -0.0 keeps its own text.
+    """
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.int64)
+    distinct_bits, inverse = np.unique(bits, return_inverse=True)
+    distinct = distinct_bits.view(np.float64)
+    inverse = inverse.ravel()
+    texts = [repr(v).encode("ascii") for v in distinct.tolist()]
+    width = max((len(t) for t in texts), default=1)
+    table = np.frombuffer(b"".join(t.ljust(width) for t in texts), dtype=np.uint8).reshape(-1, width)
+    text_lengths = np.array([len(t) for t in texts], dtype=np.int64)
+
+    def fill(chars, valid):
+        chars[:] = table.T[:, inverse]
+        lengths = text_lengths[inverse]
+        for k in range(width):
+            np.greater(lengths, k, out=valid[k])
+    return width, fill
+
+def _field(values):
+    if values.dtype.kind in "iub":
+        return _int_field(values)
+    return _float_field(values)
+
+def _row_table(row_format, columns):
+    """
+    Lay the rows of a "%s" template out as (chars, valid) tables of shape (n_rows, width):
+    every field gets a fixed-width slot and valid marks the characters in use.
+    The tables are built transposed so that each slot column is filled contiguously.
+    """
+    fields = []
+    for column in columns:
+        column = np.asarray(column)
+        if column.ndim == 2:
+            fields.extend(column[:, j] for j in range(column.shape[1]))
+        else:
+            fields.append(column)
+    literals = [piece.encode("ascii") for piece in row_format.split("%s")]
+    if len(literals) != len(fields) + 1:
+        raise ValueError("row_format has {} fields but {} columns were given".format(
+            len(literals) - 1, len(fields)))
+    n_rows = len(fields[0]) if fields else 0
+
+    fillers = [_field(values) for values in fields]
+    total_width = sum(len(lit) for lit in literals) + sum(width for width, _ in fillers)
+    chars = np.empty((total_width, n_rows), dtype=np.uint8)
+    valid = np.empty((total_width, n_rows), dtype=bool)
+    col = 0
+    for i, literal in enumerate(literals):
+        for char in literal:
+            chars[col] = char
+            valid[col] = True
+            col += 1
+        if i < len(fillers):
+            width, fill = fillers[i]
+            fill(chars[col:col + width], valid[col:col + width])
+            col += width
+    return chars.T, valid.T
+
+def format_rows(row_format, columns):
+    """
+    Format rows of a "%s" template (one row, including its newline) in a single
+    vectorized pass. columns is a list of equal-length 1D arrays; a 2D array stands
+    for all of its columns. Integers are printed like str() and floats like repr(),
+    so the text matches what str.format would produce for the same values.
+
+    Every field is laid out in a fixed-width slot of an (n_rows, width) byte table
+    along with a mask of the characters in use; the rows are the masked bytes in order.
+    Returns the uint8 text of all rows.
+    """
+    chars, valid = _row_table(row_format, columns)
+    return chars[valid]
+
+def format_mixed_rows(parts, n_rows):
+    """
+    Format rows that use different templates, e.g. elements with and without an orientation.
+    parts is a list of (positions, row_format, columns), positions giving the final row
+    index of each row of that part. Returns the uint8 text of all n_rows rows in order.
+    """
+    tables = [(positions, *_row_table(row_format, columns)) for positions, row_format, columns in parts]
+    width = max(chars.shape[1] for _, chars, _ in tables)
+    all_chars = np.zeros((n_rows, width), dtype=np.uint8)
+    all_valid = np.zeros((n_rows, width), dtype=bool)
+    for positions, chars, valid in tables:
+        all_chars[positions, :chars.shape[1]] = chars
+        all_valid[positions, :valid.shape[1]] = valid
+    return all_chars[all_valid]
+
+def write_rows(f, row_format, columns, chunk_rows=CHUNK_ROWS):
+    """Format rows with format_rows and write them to the text file f in large chunks."""
+    arrays = [np.asarray(column) for column in columns]
+    n_rows = len(arrays[0]) if arrays else 0
+    for start in range(0, n_rows, chunk_rows):
+        buf = format_rows(row_format, [a[start:start + chunk_rows] for a in arrays])
+        f.write(buf.tobytes().decode("ascii"))
@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+import tempfile
+
+
+class SolverCache:
+    """
+    Content-addressed on-disk cache of SwiftComp results.
+
+    Entries are keyed by a SHA-256 hash of the generated solver input (the file
+    that would be handed to the solver plus the material constants) and hold the
+    parsed 3x3 effective conductivity matrix as a small JSON file:
+
+        cache_dir/ab/abcdef0123....json
+
+    The modification time of an entry is bumped on every hit, so when the total
+    size of the cache goes over max_bytes the least recently used entries are
+    removed first. Entries are written to a temporary file and renamed into place,
+    which keeps the cache safe to share between the workers of a process pool.
+
+    Each process keeps a running total of the cache size (scanned once, then grown by
+    its own puts) and only scans the directory to evict when that total is over the
+    cap, or every rescan_every puts to account for what the other workers wrote. An
+    eviction goes down to 90% of max_bytes, so a full cache is not rescanned on every put.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, rescan_every=256):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.rescan_every = rescan_every
+        self._size = None  # running total in bytes, None until the first scan
+        self._puts = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash the given strings (or bytes) into a cache key."""
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode()
+            h.update(part)
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        """Return the cached matrix for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                matrix = json.load(f)["matrix"]
+            os.utime(path)  # mark as recently used
+            return matrix
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, matrix):
+        """Store matrix under key and evict old entries if the cache is over its cap."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"matrix": [list(map(float, row)) for row in matrix]}, f)
+        size = os.path.getsize(tmp_path)
+        try:
+            size -= os.path.getsize(path)  # overwriting an entry
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+
+        self._puts += 1
+        if self._size is None or self._puts % self.rescan_every == 0:
+            self.evict()
+        else:
+            self._size += size
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in 90% of max_bytes (scans the whole cache)."""
+        entries = []
+        total = 0
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue  # removed by another worker
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        self._size = total
+        if total <= self.max_bytes:
+            return
+        target = 0.9 * self.max_bytes
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            if total <= target:
+                break
+        self._size = total
@@ -0,0 +1,315 @@
+"""
+Per-sample telemetry of the homogenization pipeline.
+
+process_row fills a SampleMetrics for every sample and appends it as one JSON line to
+a metrics file, e.g.
+
+    {"index": 12, "pid": 4711, "status": "failed", "failed_stage": "gmsh",
+     "reason": "gmsh exited with status 1: Error   : Unknown entity",
+     "wall": 3.91, "stages": {"geo_write": 0.0004, "gmsh": 3.9},
+     "peak_rss_kb": {"gmsh": 81234}, "files": {"Trial.geo": 2310}, "process_peak_rss_kb": 201344}
+
+External tools are started through run_tool, which keeps their stderr for the failure
+reason and records their peak RSS. On Linux it polls the high-water mark (VmHWM) of
+/proc/<pid>/status while the tool runs, with a backoff of up to 0.1 s, so a tool that
+peaks and exits between two reads is under-reported. Elsewhere the kernel's ru_maxrss
+at reaping is used (os.wait4), when there is no timeout; otherwise it is not measured.
+
+    python telemetry.py Vf_data_updated.metrics.jsonl     # p50/p95 per stage and outliers
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_RSS_DIVISOR = 1024 if sys.platform == "darwin" else 1
+
+
+class SampleMetrics:
+    """Stage timings, child peak RSS, file sizes and failure reason of one sample."""
+
+    def __init__(self, index=None, **fields):
+        self.record = {"index": index, "pid": os.getpid(), "status": "ok"}
+        self.record.update(fields)
+        self.record.update({"stages": {}, "peak_rss_kb": {}, "files": {}})
+        self._start = time.perf_counter()
+        self._failed_stage = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage name (repeated stages add up)."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            if self._failed_stage is None:
+                self._failed_stage = name  # innermost stage that raised
+            raise
+        finally:
+            stages = self.record["stages"]
+            stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+    def mark(self, key, value):
+        """Record a plain value, e.g. whether the micro step came from the cache."""
+        self.record[key] = value
+
+    def file_size(self, path):
+        try:
+            self.record["files"][os.path.basename(path)] = os.path.getsize(path)
+        except OSError:
+            pass
+
+    def fail(self, exc):
+        self.record["status"] = "failed"
+        self.record["failed_stage"] = self._failed_stage
+        if isinstance(exc, subprocess.TimeoutExpired):
+            reason = f"{os.path.basename(exc.cmd[0])} timed out after {exc.timeout}s"
+        elif isinstance(exc, subprocess.CalledProcessError):
+            # The command line holds per-sample paths, keep the tool name so failures group
+            reason = f"{os.path.basename(exc.cmd[0])} exited with status {exc.returncode}"
+            if exc.stderr:
+                reason += ": " + exc.stderr
+        else:
+            reason = f"{type(exc).__name__}: {exc}"
+        self.record["reason"] = reason
+
+    def finish(self):
+        self.record["wall"] = time.perf_counter() - self._start
+        if resource is not None:
+            self.record["process_peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // _RSS_DIVISOR
+        return self.record
+
+
+class MetricsLog:
+    """Append-only JSONL file of SampleMetrics records, shared by all worker processes."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, record):
+        # One short write per record in append mode, so lines from several workers do not interleave
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def records(self):
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # partial line left by an interrupted run
+        return records
+
+
+def _stderr_tail(path, n_lines=5):
+    try:
+        with open(path, "r", errors="replace") as f:
+            lines = [line.strip() for line in f.read().splitlines() if line.strip()]
+    except OSError:
+        return ""
+    return " | ".join(lines[-n_lines:])
+
+
+def run_tool(cmd, cwd=None, metrics=None, stage=None, timeout=None, retries=0):
+    """
+    Run an external tool with its stdout discarded, like subprocess.run(..., check=True).
+    The stage is timed in metrics along with the peak RSS of the child. A non-zero exit
+    raises CalledProcessError carrying the last lines of the tool's stderr.
+    A run still going after timeout seconds is killed (with any children it started) and
+    started again, up to retries times; then subprocess.TimeoutExpired is raised.
+    """
+    stage = stage or os.path.basename(cmd[0])
+    with (metrics.stage(stage) if metrics is not None else _no_stage()):
+        for attempt in range(retries + 1):
+            try:
+                peak_rss_kb = _run_once(cmd, cwd, stage, timeout)
+                break
+            except subprocess.TimeoutExpired:
+                if metrics is not None:
+                    timeouts = metrics.record.setdefault("timeouts", {})
+                    timeouts[stage] = timeouts.get(stage, 0) + 1
+                if attempt == retries:
+                    raise
+                print(f"{stage} ran over its {timeout}s budget, killed it (retry {attempt + 1} of {retries})")
+    if metrics is not None and peak_rss_kb is not None:
+        metrics.record["peak_rss_kb"][stage] = peak_rss_kb
+
+
+def _run_once(cmd, cwd, stage, timeout):
+    """One run of a tool, returns its peak RSS in kB (None if it cannot be measured)."""
+    stderr_file = os.path.join(cwd or ".", f".{stage}.stderr")
+    try:
+        with open(stderr_file, "wb") as err:
+            # In its own session, so that a timeout also kills the processes the tool started
+            proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=err,
+                                    start_new_session=(os.name == "posix"))
+            peak_rss_kb = None
+            try:
+                if os.path.exists(f"/proc/{proc.pid}/status"):
+                    peak_rss_kb = _poll_peak_rss(proc, timeout)
+                elif hasattr(os, "wait4") and timeout is None:
+                    _, status, usage = os.wait4(proc.pid, 0)
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                    peak_rss_kb = usage.ru_maxrss // _RSS_DIVISOR
+                else:
+                    proc.wait(timeout)
+            except BaseException:  # timeout or interrupt: do not leave the tool running
+                _kill(proc)
+                raise
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=_stderr_tail(stderr_file))
+        return peak_rss_kb
+    finally:
+        if os.path.exists(stderr_file):
+            os.remove(stderr_file)
+
+
+def _kill(proc):
+    if os.name == "posix":
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    else:
+        proc.kill()
+    proc.wait()
+
+
+def _poll_peak_rss(proc, timeout=None, max_interval=0.1):
+    """
+    Wait for proc while reading its high-water RSS (VmHWM) from /proc. On Linux the
+    ru_maxrss of a reaped child also counts the memory of the forking Python process,
+    so it would report the worker's size rather than the tool's.
+    Raises subprocess.TimeoutExpired if proc is still running after timeout seconds.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    peak_kb = None
+    interval = 0.001
+    while proc.poll() is None:
+        if deadline is not None and time.monotonic() > deadline:
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        try:
+            with open(f"/proc/{proc.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peak_kb = max(peak_kb or 0, int(line.split()[1]))
+                        break
+        except (OSError, ValueError):
+            pass
+        time.sleep(interval)
+        interval = min(2 * interval, max_interval)
+    return peak_kb
+
+
+@contextmanager
+def _no_stage():
+    yield
+
+
+# ---------------------------------------------------------------------------
+# Summary
+# ---------------------------------------------------------------------------
+
+def _quantiles(values):
+    values = np.asarray(values, dtype=float)
+    return np.percentile(values, 50), np.percentile(values, 95), values.max()
+
+def outliers(values, indices, floor=0.0):
+    """
+    Indices whose value is beyond Q3 + 3 IQR (Tukey's far-out fence), largest first.
+    The IQR is taken as at least 10% of Q3 and values below floor are never flagged,
+    so that near-constant or negligible stages do not flag jitter.
+    """
+    values = np.asarray(values, dtype=float)
+    q1, q3 = np.percentile(values, [25, 75])
+    fence = max(q3 + 3 * max(q3 - q1, 0.1 * q3), floor)
+    flagged = [(v, i) for v, i in zip(values.tolist(), indices) if v > fence]
+    return sorted(flagged, reverse=True), fence
+
+def summarize(records, top=5):
+    n_failed = sum(r.get("status") != "ok" for r in records)
+    n_speculative = sum(bool(r.get("speculative")) for r in records)
+    print(f"{len(records)} samples, {n_failed} failed"
+          + (f", {n_speculative} of them speculative copies" if n_speculative else ""))
+    if not records:
+        return
+
+    stages = {}
+    for r in records:
+        for name, seconds in r.get("stages", {}).items():
+            stages.setdefault(name, []).append((seconds, r.get("index")))
+    walls = [(r["wall"], r.get("index")) for r in records if "wall" in r]
+    if walls:
+        stages["total"] = walls
+    grand_total = sum(s for name, v in stages.items() if name != "total" for s, _ in v)
+
+    print(f"\n{'stage':<16} {'n':>6} {'p50':>9} {'p95':>9} {'max':>9} {'share':>6}  outliers (index: seconds)")
+    for name, entries in stages.items():
+        values = [v for v, _ in entries]
+        p50, p95, vmax = _quantiles(values)
+        flagged, _ = outliers(values, [i for _, i in entries], floor=0.01)
+        share = "" if name == "total" else f"{100 * sum(values) / grand_total:5.1f}%"
+        shown = ", ".join(f"{i}: {v:.2f}" for v, i in flagged[:top])
+        more = f" (+{len(flagged) - top} more)" if len(flagged) > top else ""
+        print(f"{name:<16} {len(values):>6} {p50:>8.3f}s {p95:>8.3f}s {vmax:>8.3f}s {share:>6}  {shown}{more}")
+
+    rss = {}
+    for r in records:
+        for name, kb in r.get("peak_rss_kb", {}).items():
+            rss.setdefault(name, []).append(kb / 1024)
+        if "process_peak_rss_kb" in r:
+            rss.setdefault("worker process", []).append(r["process_peak_rss_kb"] / 1024)
+    if rss:
+        print(f"\n{'peak RSS':<16} {'n':>6} {'p50':>8} {'p95':>8} {'max':>8}")
+        for name, values in rss.items():
+            p50, p95, vmax = _quantiles(values)
+            print(f"{name:<16} {len(values):>6} {p50:>6.0f}MB {p95:>6.0f}MB {vmax:>6.0f}MB")
+
+    sizes = {}
+    for r in records:
+        for name, size in r.get("files", {}).items():
+            sizes.setdefault(name, []).append(size / 1e6)
+    if sizes:
+        print(f"\n{'file':<16} {'n':>6} {'p50':>8} {'p95':>8} {'max':>8}")
+        for name, values in sizes.items():
+            p50, p95, vmax = _quantiles(values)
+            print(f"{name:<16} {len(values):>6} {p50:>6.2f}MB {p95:>6.2f}MB {vmax:>6.2f}MB")
+
+    timeouts = {}
+    for r in records:
+        for name, count in r.get("timeouts", {}).items():
+            timeouts[name] = timeouts.get(name, 0) + count
+    if timeouts:
+        print("\nKilled on timeout: " + ", ".join(f"{name} {count}x" for name, count in timeouts.items()))
+
+    reasons = {}
+    for r in records:
+        if r.get("status") != "ok":
+            key = (r.get("failed_stage"), r.get("reason", "")[:120])
+            reasons.setdefault(key, []).append(r.get("index"))
+    if reasons:
+        print("\nFailures")
+        for (stage, reason), indices in sorted(reasons.items(), key=lambda item: -len(item[1])):
+            print(f"  {len(indices):>5} x [{stage}] {reason}  (e.g. rows {', '.join(map(str, indices[:top]))})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the per-sample metrics of a homogenization run")
+    parser.add_argument("metrics", help="Metrics file written by Fullscript.py (<input>.metrics.jsonl)")
+    parser.add_argument("--top", type=int, default=5, help="Outliers / example rows listed per entry (default: 5)")
+    args = parser.parse_args()
+    summarize(MetricsLog(args.metrics).records(), args.top)
@@ -1,63 +1,76 @@
+import numpy as np
 from TexGen.Core import *
 from TexGen.Export import *
 # Instead of importing the octree mesh, import the rectangular voxel mesh:
 from TexGen.Core import CRectangularVoxelMesh
 
-def create_weave_voxel_mesh(width_to_spacing, thickness_to_spacing, output_prefix="PlainWeave"):
+def create_plain_weave(width_to_spacing, thickness_to_spacing):
+    """
+    Create the plain weave textile for the given parameters (spacing = 1 mm).
+
+    Args:
+        width_to_spacing (float): Ratio of yarn width to spacing.
+        thickness_to_spacing (float): Ratio of textile thickness to spacing.
+
+    Returns:
+        CTextileWeave2D with its default domain assigned.
+    """
+    spacing = 1.0
+    yarnWidth = width_to_spacing * spacing
+    thickness = thickness_to_spacing * spacing
+
+    m = 2  # Number of warp yarns
+    n = 2  # Number of weft yarns
+    weave = CTextileWeave2D(m, n, spacing, thickness, False)
+    weave.SetGapSize(0)
+
+    # Set weave pattern (swapping positions for alternate yarns)
+    for i in range(m):
+        for j in range(n):
+            if (i + j) % 2 == 0:
+                weave.SwapPosition(i, j)
+
+    # Set yarn properties so that separate yarn regions are defined
+    yarnHeight = thickness / 2.0
+    weave.SetYarnWidths(yarnWidth)
+    weave.SetYarnHeights(yarnHeight)
+
+    # Assign a default domain
+    weave.AssignDefaultDomain()
+    return weave
+
+def create_weave_voxel_mesh(width_to_spacing, thickness_to_spacing, output_prefix="PlainWeave", voxels=(40, 40, 20)):
     """
     Create a plain weave textile and voxel mesh with given parameters.
-    
+
     Args:
         width_to_spacing (float): Ratio of yarn width to spacing.
         thickness_to_spacing (float): Ratio of textile thickness to spacing.
         output_prefix (str): Prefix for output files.
+        voxels (tuple): Number of voxels (nX, nY, nZ) of the mesh.
     """
     try:
-        # Calculate dimensions (assuming spacing = 1 mm)
-        spacing = 1.0
-        yarnWidth = width_to_spacing * spacing
-        thickness = thickness_to_spacing * spacing
-        
         print(f"\nCreating weave with:")
         print(f"- Width/Spacing: {width_to_spacing:.3f}")
         print(f"- Thickness/Spacing: {thickness_to_spacing:.3f}")
-        
+
         #----------------------------------------------------------
         # Create textile
         #----------------------------------------------------------
-        m = 2  # Number of warp yarns
-        n = 2  # Number of weft yarns
-        weave = CTextileWeave2D(m, n, spacing, thickness, False)
-        weave.SetGapSize(0)
-        
-        # Set weave pattern (swapping positions for alternate yarns)
-        for i in range(m):
-            for j in range(n):
-                if (i + j) % 2 == 0:
-                    weave.SwapPosition(i, j)
-        
-        # Set yarn properties so that separate yarn regions are defined
-        yarnHeight = thickness / 2.0
-        weave.SetYarnWidths(yarnWidth)
-        weave.SetYarnHeights(yarnHeight)
-        
-        # Assign a default domain and add textile to TexGen
-        weave.AssignDefaultDomain()
+        weave = create_plain_weave(width_to_spacing, thickness_to_spacing)
         AddTextile(output_prefix, weave)
-        
+
         # Save textile to XML format (for reference)
         SaveToXML(f"{output_prefix}.tg3")
-        
+
         #----------------------------------------------------------
         # Create and export voxel mesh using rectangular voxels
         #----------------------------------------------------------
-        nXvoxel = 40
-        nYvoxel = 40
-        nZvoxel = 20
-        
+        nXvoxel, nYvoxel, nZvoxel = voxels
+
         # Instantiate the rectangular voxel mesh instead of the octree one.
         voxelMesh = CRectangularVoxelMesh()
-        
+
         # Use the 10-parameter SaveVoxelMesh overload:
         #   SaveVoxelMesh(Textile, OutputFilename, nX, nY, nZ,
         #                 bOutputMatrix, bOutputYarns, iBoundaryConditions, iElementType, FileType)
@@ -65,11 +78,41 @@ def create_weave_voxel_mesh(width_to_spacing, thickness_to_spacing, output_prefi
         # Setting both bOutputMatrix and bOutputYarns to True tells TexGen to export separate element sets
         # for the matrix and for the yarns. iBoundaryConditions is set to 0 to avoid periodic BCs that might blend
         # yarn detail. iElementType is set to 0 (often corresponding to C3D8R elements) and INP_EXPORT is a constant.
-        voxelMesh.SaveVoxelMesh(weave, f"{output_prefix}.inp", nXvoxel, nYvoxel, nZvoxel, 
+        voxelMesh.SaveVoxelMesh(weave, f"{output_prefix}.inp", nXvoxel, nYvoxel, nZvoxel,
                                   True, True, 0, 0, INP_EXPORT)
-        
+
         return True
-        
+
     except Exception as e:
         print(f"\nError creating weave: {e}")
         return False
+
+def weave_domain_box(weave):
+    """Lower and upper corner of the textile domain, i.e. the box the voxel grid spans."""
+    box_min, box_max = weave.GetDomain().GetMesh().GetAABB()
+    return (np.array([box_min.x, box_min.y, box_min.z]),
+            np.array([box_max.x, box_max.y, box_max.z]))
+
+def voxel_point_information(weave, points):
+    """
+    Query TexGen for the yarn at each of the given (n, 3) points, the way the voxel
+    mesh export classifies voxel centres, without writing any file.
+
+    Returns:
+        yarn_index (n,) int array, -1 for points in the matrix.
+        orientations (n, 6) array of [a1, a2, a3, b1, b2, b3]: the yarn tangent and
+        up vector, as written to the .ori file. Matrix points get NaN rows.
+    """
+    xyz_points = XYZVector()
+    for x, y, z in points.tolist():
+        xyz_points.push_back(XYZ(x, y, z))
+    info = PointInfoVector()
+    weave.GetPointInformation(xyz_points, info)
+
+    yarn_index = np.array([point.iYarnIndex for point in info], dtype=np.int64)
+    orientations = np.full((len(yarn_index), 6), np.nan)
+    for row, point in enumerate(info):
+        if point.iYarnIndex >= 0:
+            tangent, up = point.YarnTangent, point.Up
+            orientations[row] = (tangent.x, tangent.y, tangent.z, up.x, up.y, up.z)
+    return yarn_index, orientations
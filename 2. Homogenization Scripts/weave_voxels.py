@@ -0,0 +1,118 @@
+"""
+Analytic voxelizer of 2D woven unit cells (plain, 2/2 twill, 5-harness satin) in NumPy.
+
+It stands in for TexGen in the mesoscale step: for every voxel centre it returns the
+yarn found there and the yarn orientation, in the layout of
+texgen_utils.voxel_point_information, so the result goes to Meso.voxel_materials and
+Meso.voxel_mesh like the TexGen query did, without the TexGen API or any file.
+
+Geometry (spacing = 1, as in texgen_utils.create_plain_weave), for an n x n repeat:
+    - warp yarn i runs along x at y = i + 1/2, weft yarn j along y at x = j + 1/2,
+      i, j = 0 .. n - 1, over the domain [0, n] x [0, n] x [-thickness / 2, thickness / 2];
+    - yarn cross-sections are ellipses of width width_to_spacing and height thickness / 2;
+    - at the crossing of warp i and weft j the yarn on top has its centre line at
+      +thickness / 4 and the other one at -thickness / 4 (WEAVES gives which one);
+      between two crossings the centre line follows a half cosine, and stays flat
+      along a float (a yarn passing over or under several crossings in a row).
+For the plain weave this is the cosine crimp of TexGen's CTextileWeave2D with the
+SwapPosition pattern of create_plain_weave. A point inside two yarns (where they
+interpenetrate at the crossings) goes to the yarn whose centre is closer.
+"""
+import numpy as np
+
+
+def _plain(i, j):
+    return (i + j) % 2 == 0
+
+def _twill(i, j):
+    return (j - i) % 4 < 2
+
+def _satin(i, j):
+    return (j - 2 * i) % 5 == 0
+
+# Weave pattern -> (repeat n, warp_over(i, j)): True where warp i passes over weft j
+WEAVES = {
+    "plain": (2, _plain),
+    "twill": (4, _twill),  # 2/2 twill
+    "5hs": (5, _satin),    # 5-harness satin, step 2
+}
+
+
+def weave_pattern(weave):
+    """Repeat n and the (n, n) boolean array of warp-over crossings of a weave name (case-insensitive)."""
+    name = str(weave).lower()
+    if name not in WEAVES:
+        raise ValueError(f"Unknown weave pattern '{weave}', expected one of {', '.join(WEAVES)}")
+    n, warp_over = WEAVES[name]
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    return n, warp_over(i, j)
+
+
+def domain_box(weave, thickness_to_spacing):
+    """Lower and upper corner of the unit cell of the weave, i.e. the box the voxel grid spans."""
+    n, _ = weave_pattern(weave)
+    half = thickness_to_spacing / 2
+    return np.array([0.0, 0.0, -half]), np.array([float(n), float(n), half])
+
+
+def _centre_line(levels, yarn, s):
+    """
+    Height and slope of the centre line of yarn (per point) at positions s along it.
+    levels (n_yarns, n) holds the centre heights at the n crossings of every yarn (at k + 1/2).
+    Between crossings the height follows a half cosine, which is flat where both crossings
+    have the same level; s wraps around the repeat.
+    """
+    n = levels.shape[1]
+    k = np.floor(s - 0.5).astype(np.int64)
+    frac = s - 0.5 - k
+    z0 = levels[yarn, k % n]
+    z1 = levels[yarn, (k + 1) % n]
+    return z0 + (z1 - z0) * (1 - np.cos(np.pi * frac)) / 2, (z1 - z0) * np.pi / 2 * np.sin(np.pi * frac)
+
+
+def voxel_yarns(weave, width_to_spacing, thickness_to_spacing, points):
+    """
+    Yarn at each of the (m, 3) points of the unit cell of weave.
+
+    Returns:
+        yarn_index (m,) int array: warp yarn i is i, weft yarn j is n + j, -1 for matrix.
+        orientations (m, 6) array of [a1, a2, a3, b1, b2, b3], the yarn tangent and up
+        vector; matrix points get NaN rows.
+    """
+    n, warp_over = weave_pattern(weave)
+    points = np.asarray(points, dtype=np.float64)
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    half_width = width_to_spacing / 2
+    half_height = thickness_to_spacing / 4
+    level = thickness_to_spacing / 4
+
+    # The only yarns that can hold a point are the warp of its y strip and the weft of its x strip
+    warp = np.clip(np.floor(y).astype(np.int64), 0, n - 1)
+    weft = np.clip(np.floor(x).astype(np.int64), 0, n - 1)
+
+    # Centre heights at the crossings: warp i over weft j -> warp up, weft down
+    warp_levels = np.where(warp_over, level, -level)      # [warp i, crossing j]
+    weft_levels = np.where(warp_over.T, -level, level)    # [weft j, crossing i]
+    z_warp, slope_warp = _centre_line(warp_levels, warp, x)
+    z_weft, slope_weft = _centre_line(weft_levels, weft, y)
+
+    # Squared normalized distance to each yarn centre (<= 1 inside the elliptic cross-section)
+    d_warp = ((y - (warp + 0.5)) / half_width) ** 2 + ((z - z_warp) / half_height) ** 2
+    d_weft = ((x - (weft + 0.5)) / half_width) ** 2 + ((z - z_weft) / half_height) ** 2
+    in_warp = (d_warp <= 1) & (d_warp <= d_weft)
+    in_weft = (d_weft <= 1) & ~in_warp
+
+    yarn_index = np.full(len(points), -1, dtype=np.int64)
+    yarn_index[in_warp] = warp[in_warp]
+    yarn_index[in_weft] = n + weft[in_weft]
+
+    orientations = np.full((len(points), 6), np.nan)
+    norm = np.sqrt(1 + slope_warp[in_warp] ** 2)
+    zero = np.zeros_like(norm)
+    orientations[in_warp] = np.column_stack([1 / norm, zero, slope_warp[in_warp] / norm,
+                                             -slope_warp[in_warp] / norm, zero, 1 / norm])
+    norm = np.sqrt(1 + slope_weft[in_weft] ** 2)
+    zero = np.zeros_like(norm)
+    orientations[in_weft] = np.column_stack([zero, 1 / norm, slope_weft[in_weft] / norm,
+                                             zero, -slope_weft[in_weft] / norm, 1 / norm])
+    return yarn_index, orientations
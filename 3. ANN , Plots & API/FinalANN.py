@@ -4,19 +4,11 @@ import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import r2_score
 import os
+import time
+import argparse
+import numpy_model
 
 
-# Load Data
-df = pd.read_csv("data.csv")
-print("Data columns:", df.columns)
-
-# Extract input features
-X = df[['vf', 'width', 'thickness', 'p', 't', 'h']].values
-
-# Extract Targets labels for k11 and k33
-y_k11 = df['k11'].values
-y_k33 = df['k33'].values
-
 # Here a custom scaling feature is defined to scale the geometries in the physical range given in the paper
 def custom_scale(X):
     X_scaled = X.copy()
@@ -28,116 +20,355 @@ def custom_scale(X):
     X_scaled[:, 2] = 0.008 + X[:, 2] * (0.5 - 0.008)
     return X_scaled
 
-# Create a common train-test split - (train/validate) and test split
-indices = np.arange(len(X))
-train_val_indices, test_indices = train_test_split(indices, test_size=0.2, random_state=42)
-train_indices, val_indices = train_test_split(train_val_indices, test_size=0.2, random_state=42)
-
-
-X_train_common = X[train_indices]
-X_val_common = X[val_indices]
-X_test_common = X[test_indices]
-
-# Targets
-y_k11_train = y_k11[train_indices]
-y_k11_val = y_k11[val_indices]
-y_k11_test = y_k11[test_indices]
+# Input columns of data.csv, in the order the models expect them
+FEATURES = ['vf', 'width', 'thickness', 'p', 't', 'h']
+# Predicted conductivities, in the output order of the joint model
+TARGETS = ['k11', 'k33']
 
-y_k33_train = y_k33[train_indices]
-y_k33_val = y_k33[val_indices]
-y_k33_test = y_k33[test_indices]
-
-X_train_scaled = custom_scale(X_train_common)
-X_val_scaled = custom_scale(X_val_common)
-X_test_scaled = custom_scale(X_test_common)
+# Learning rate and batch size of the original training; the fast mode scales the rate from these
+BASE_LEARNING_RATE = 0.0005
+BASE_BATCH_SIZE = 64
+FAST_BATCH_SIZE = 512
 
 # Callbacks
-callback = tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=30, restore_best_weights=True)
-lr_scheduler = tf.keras.callbacks.ReduceLROnPlateau(
-    monitor='val_loss',
-    factor=0.5,
-    patience=15,
-    verbose=1,
-    min_lr=1e-6
-)
+def training_callbacks(patience=30, lr_patience=15, verbose=1):
+    callback = tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=patience, restore_best_weights=True)
+    lr_scheduler = tf.keras.callbacks.ReduceLROnPlateau(
+        monitor='val_loss',
+        factor=0.5,
+        patience=lr_patience,
+        verbose=verbose,
+        min_lr=1e-6
+    )
+    return callback, lr_scheduler
+
+# Learning rate for a batch size, scaled from BASE_LEARNING_RATE at BASE_BATCH_SIZE:
+# "sqrt" (rate grows with the square root of the batch), "linear" or "none"
+def scaled_learning_rate(batch_size, rule="sqrt", base_rate=BASE_LEARNING_RATE, base_batch=BASE_BATCH_SIZE):
+    ratio = batch_size / base_batch
+    if rule == "linear":
+        return base_rate * ratio
+    if rule == "sqrt":
+        return base_rate * np.sqrt(ratio)
+    if rule == "none":
+        return base_rate
+    raise ValueError(f"Unknown learning rate scaling rule '{rule}', expected sqrt, linear or none")
+
+# Thread pools of TensorFlow (None keeps its default). Must run before the first TensorFlow op.
+def configure_threads(intra_op=None, inter_op=None):
+    if intra_op is not None:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    if inter_op is not None:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+# tf.data pipeline of the fast mode: the arrays are converted to float32 and cached once,
+# then (for training) reshuffled every epoch, batched and prefetched while the previous step runs
+# (y may be a dict of targets, as for the joint model)
+def make_dataset(X, y, batch_size, shuffle=False, seed=42):
+    if isinstance(y, dict):
+        y = {target: values.astype(np.float32) for target, values in y.items()}
+    else:
+        y = y.astype(np.float32)
+    dataset = tf.data.Dataset.from_tensor_slices((X.astype(np.float32), y)).cache()
+    if shuffle:
+        dataset = dataset.shuffle(len(X), seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+# Training throughput: samples per second of every epoch after the first one
+# (the first epoch also traces and, with jit_compile, compiles the train step)
+class Throughput(tf.keras.callbacks.Callback):
+    def __init__(self, n_samples):
+        super().__init__()
+        self.n_samples = n_samples
+        self.epoch_seconds = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_seconds.append(time.perf_counter() - self._start)
+
+    def samples_per_second(self):
+        steady = self.epoch_seconds[1:] or self.epoch_seconds
+        return self.n_samples * len(steady) / sum(steady)
+
+    def report(self, name):
+        print(f"{name}: {len(self.epoch_seconds)} epochs in {sum(self.epoch_seconds):.1f}s, "
+              f"{self.samples_per_second():,.0f} samples/s (first epoch {self.epoch_seconds[0]:.2f}s)")
 
 #Model for k11
-model_k11 = tf.keras.Sequential([
-    tf.keras.layers.Dense(64, activation='relu', input_shape=(6,)),
-    tf.keras.layers.Dense(64, activation='relu'),
-    tf.keras.layers.Dense(1)  # Output layer for regression
-])
-model_k11.compile(
-    optimizer=tf.keras.optimizers.Adam(learning_rate=0.0005),
-    loss='mse',
-    metrics=['mae']
-)
-print("Training model for k11...")
-history_k11 = model_k11.fit(
-    X_train_scaled, y_k11_train,
-    epochs=180, batch_size=64,
-    validation_data=(X_val_scaled, y_k11_val),callbacks=[callback,lr_scheduler]
-)
-
-np.save("history_k11.npy", history_k11.history)
-test_loss, test_mae = model_k11.evaluate(X_test_scaled, y_k11_test)
-print(f"k11 Test MAE: {test_mae:.4f}")
-
-# Save the k11 model
-save_dir = os.path.join(os.path.dirname(__file__), "saved_model")
-os.makedirs(save_dir, exist_ok=True)
-model_k11.save(os.path.join(save_dir, "my_model_k11.keras"))
-
-
-
+def build_k11_model(learning_rate=BASE_LEARNING_RATE, jit_compile=False, steps_per_execution=1):
+    model_k11 = tf.keras.Sequential([
+        tf.keras.layers.Dense(64, activation='relu', input_shape=(6,)),
+        tf.keras.layers.Dense(64, activation='relu'),
+        tf.keras.layers.Dense(1)  # Output layer for regression
+    ])
+    model_k11.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='mse',
+        metrics=['mae'],
+        jit_compile=jit_compile,
+        steps_per_execution=steps_per_execution
+    )
+    return model_k11
 
 # k33 model
-model_k33 = tf.keras.Sequential([
-    tf.keras.layers.Dense(64, activation='relu', input_shape=(6,)),
-    tf.keras.layers.Dense(32, activation='relu'),
-    tf.keras.layers.Dense(1)
-])
-model_k33.compile(
-    optimizer=tf.keras.optimizers.Adam(learning_rate=0.0005),
-    loss='mse',
-    metrics=['mae']
-)
-
-
-history_k33 = model_k33.fit(
-    X_train_scaled, y_k33_train,
-    epochs=150,
-    batch_size=64,
-    validation_data=(X_val_scaled, y_k33_val),
-    callbacks=[callback, lr_scheduler]
-)
-
-
-np.save("history_k33.npy", history_k33.history)
-test_loss, test_mae = model_k33.evaluate(X_test_scaled, y_k33_test)
-print(f"k33 Test MAE: {test_mae:.4f}")
-
-# Save the k33 model
-model_k33.save(os.path.join(save_dir, "my_model_k33.keras"))
-
-
-
-y_k11_pred = model_k11.predict(X_test_scaled)
-y_k33_pred = model_k33.predict(X_test_scaled)
-
-np.save("y_k11_test.npy", y_k11_test)
-np.save("y_k11_pred.npy", y_k11_pred)
-
-np.save("y_k33_test.npy", y_k33_test)
-np.save("y_k33_pred.npy", y_k33_pred)
-
-
-# For R^2 Values
-y_k11_pred_r2 = y_k11_pred.flatten()
-y_k33_pred_r2 = y_k33_pred.flatten()
-
-r2_k11 = r2_score(y_k11_test, y_k11_pred_r2)
-print(f"R² score for k11: {r2_k11:.4f}")
-
-r2_k33 = r2_score(y_k33_test, y_k33_pred_r2)
-print(f"R² score for k33: {r2_k33:.4f}")
+def build_k33_model(learning_rate=BASE_LEARNING_RATE, jit_compile=False, steps_per_execution=1):
+    model_k33 = tf.keras.Sequential([
+        tf.keras.layers.Dense(64, activation='relu', input_shape=(6,)),
+        tf.keras.layers.Dense(32, activation='relu'),
+        tf.keras.layers.Dense(1)
+    ])
+    model_k33.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='mse',
+        metrics=['mae'],
+        jit_compile=jit_compile,
+        steps_per_execution=steps_per_execution
+    )
+    return model_k33
+# MLP with the given hidden layer sizes and one output, e.g. (64, 64) is the k11 model
+# (used by sweep.py to try other architectures)
+def build_model(hidden_layers, learning_rate=BASE_LEARNING_RATE, jit_compile=False, steps_per_execution=1):
+    model = tf.keras.Sequential([tf.keras.Input(shape=(6,))]
+                                + [tf.keras.layers.Dense(units, activation='relu') for units in hidden_layers]
+                                + [tf.keras.layers.Dense(1)])
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='mse',
+        metrics=['mae'],
+        jit_compile=jit_compile,
+        steps_per_execution=steps_per_execution
+    )
+    return model
+
+# Joint model: a shared trunk and one head per conductivity (outputs named after TARGETS),
+# for standardized targets; loss_weights weights the k11 and k33 losses
+def build_joint_model(loss_weights=(1.0, 1.0), learning_rate=BASE_LEARNING_RATE, jit_compile=False,
+                      steps_per_execution=1):
+    inputs = tf.keras.Input(shape=(6,))
+    # Layer names are what numpy_model.py reads the trunk and the heads by
+    trunk = tf.keras.layers.Dense(64, activation='relu', name='trunk_0')(inputs)
+    trunk = tf.keras.layers.Dense(64, activation='relu', name='trunk_1')(trunk)
+    outputs = {target: tf.keras.layers.Dense(1, name=target)(
+                   tf.keras.layers.Dense(32, activation='relu', name=f'{target}_hidden_0')(trunk))
+               for target in TARGETS}
+    model_joint = tf.keras.Model(inputs, outputs)
+    model_joint.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss={target: 'mse' for target in TARGETS},
+        loss_weights=dict(zip(TARGETS, loss_weights)),
+        metrics={target: ['mae'] for target in TARGETS},
+        jit_compile=jit_compile,
+        steps_per_execution=steps_per_execution
+    )
+    return model_joint
+
+# Serving form of a trained joint model: the heads are scaled back to physical units
+# (k = head * std + mean) and concatenated, so predict returns an (n, 2) array of [k11, k33]
+def joint_inference_model(model_joint, target_mean, target_std):
+    heads = [tf.keras.layers.Rescaling(target_std[target], offset=target_mean[target], name=f"{target}_physical")(
+                 model_joint.get_layer(target).output) for target in TARGETS]
+    return tf.keras.Model(model_joint.inputs, tf.keras.layers.Concatenate(name="k")(heads))
+
+
+# Train a model on NumPy arrays (batch_size 64, as in the paper) or, with fast=True,
+# on the tf.data pipeline; returns the Keras history and the throughput measurement
+def fit_model(model, X_train, y_train, X_val, y_val, epochs, callbacks, fast=False, batch_size=BASE_BATCH_SIZE,
+              seed=42):
+    throughput = Throughput(len(X_train))
+    callbacks = list(callbacks) + [throughput]
+    if fast:
+        history = model.fit(
+            make_dataset(X_train, y_train, batch_size, shuffle=True, seed=seed),
+            epochs=epochs,
+            validation_data=make_dataset(X_val, y_val, batch_size),
+            callbacks=callbacks, verbose=2
+        )
+    else:
+        history = model.fit(
+            X_train, y_train,
+            epochs=epochs, batch_size=batch_size,
+            validation_data=(X_val, y_val), callbacks=callbacks
+        )
+    return history, throughput
+
+
+# Load data.csv and make the common train / validation / test split.
+# Returns the scaled inputs (train, val, test) and {target: (train, val, test)}.
+def load_splits():
+    # Load Data
+    df = pd.read_csv("data.csv")
+    print("Data columns:", df.columns)
+
+    # Extract input features
+    X = df[FEATURES].values
+
+    # Create a common train-test split - (train/validate) and test split
+    indices = np.arange(len(X))
+    train_val_indices, test_indices = train_test_split(indices, test_size=0.2, random_state=42)
+    train_indices, val_indices = train_test_split(train_val_indices, test_size=0.2, random_state=42)
+
+    X_scaled = tuple(custom_scale(X[rows]) for rows in (train_indices, val_indices, test_indices))
+    # Targets
+    targets = {target: tuple(df[target].values[rows] for rows in (train_indices, val_indices, test_indices))
+               for target in TARGETS}
+    return X_scaled, targets
+
+
+# The two models of the paper, trained one after the other.
+# Saves the models, histories and test predictions; returns {target: test prediction} and the training time.
+def train_separate(X_scaled, targets, save_dir, fast=False, batch_size=BASE_BATCH_SIZE, model_options=None,
+                   prefix=""):
+    model_options = model_options or {}
+    X_train_scaled, X_val_scaled, X_test_scaled = X_scaled
+    callback, lr_scheduler = training_callbacks()
+    predictions = {}
+    seconds = 0.0
+    for target, build, epochs in (("k11", build_k11_model, 180), ("k33", build_k33_model, 150)):
+        y_train, y_val, y_test = targets[target]
+        model = build(**model_options)
+        print(f"Training model for {target}...")
+        start = time.perf_counter()
+        history, throughput = fit_model(model, X_train_scaled, y_train, X_val_scaled, y_val,
+                                        epochs, [callback, lr_scheduler], fast, batch_size)
+        seconds += time.perf_counter() - start
+        throughput.report(target)
+
+        np.save(f"{prefix}history_{target}.npy", history.history)
+        test_loss, test_mae = model.evaluate(X_test_scaled, y_test)
+        print(f"{target} Test MAE: {test_mae:.4f}")
+
+        # Save the model
+        model.save(os.path.join(save_dir, f"my_model_{target}.keras"))
+
+        predictions[target] = model.predict(X_test_scaled)
+        np.save(f"{prefix}y_{target}_test.npy", y_test)
+        np.save(f"{prefix}y_{target}_pred.npy", predictions[target])
+    return predictions, seconds
+
+
+# One network for both conductivities (build_joint_model), trained on standardized targets.
+# The saved my_model_joint.keras maps the inputs to [k11, k33] in physical units in one pass.
+# Histories are written per target in physical units, so Plots.py reads them as before.
+def train_joint(X_scaled, targets, save_dir, fast=False, batch_size=BASE_BATCH_SIZE, model_options=None,
+                loss_weights=(1.0, 1.0), prefix=""):
+    model_options = model_options or {}
+    X_train_scaled, X_val_scaled, X_test_scaled = X_scaled
+    mean = {target: float(np.mean(targets[target][0])) for target in TARGETS}
+    std = {target: float(np.std(targets[target][0])) for target in TARGETS}
+
+    def normalized(split):
+        return {target: (targets[target][split] - mean[target]) / std[target] for target in TARGETS}
+
+    model = build_joint_model(loss_weights, **model_options)
+    print("Training joint model for k11 and k33...")
+    start = time.perf_counter()
+    history, throughput = fit_model(model, X_train_scaled, normalized(0), X_val_scaled, normalized(1),
+                                    180, training_callbacks(), fast, batch_size)
+    seconds = time.perf_counter() - start
+    throughput.report("joint")
+
+    inference = joint_inference_model(model, mean, std)
+    inference.save(os.path.join(save_dir, "my_model_joint.keras"))
+
+    k_pred = inference.predict(X_test_scaled)
+    predictions = {}
+    for column, target in enumerate(TARGETS):
+        scale = std[target] ** 2  # normalized MSE -> MSE in physical units
+        np.save(f"{prefix}history_{target}.npy",
+                {"loss": [v * scale for v in history.history[f"{target}_loss"]],
+                 "val_loss": [v * scale for v in history.history[f"val_{target}_loss"]]})
+        y_test = targets[target][2]
+        predictions[target] = k_pred[:, column:column + 1]
+        print(f"{target} Test MAE: {np.mean(np.abs(predictions[target].ravel() - y_test)):.4f}")
+        np.save(f"{prefix}y_{target}_test.npy", y_test)
+        np.save(f"{prefix}y_{target}_pred.npy", predictions[target])
+    return predictions, seconds
+
+
+# Test R² and MAE of both approaches side by side
+def print_comparison(targets, results):
+    print(f"\n{'model':<10} {'target':<7} {'R²':>8} {'MAE':>10} {'train':>9}")
+    for name, (predictions, seconds) in results.items():
+        for target in TARGETS:
+            y_test = targets[target][2]
+            y_pred = predictions[target].ravel()
+            print(f"{name:<10} {target:<7} {r2_score(y_test, y_pred):>8.4f} "
+                  f"{np.mean(np.abs(y_pred - y_test)):>10.4E} {seconds:>8.1f}s")
+
+
+# fast=True trains on a cached, shuffled and prefetched tf.data pipeline with XLA-compiled
+# (jit_compile) train steps, several steps per call (steps_per_execution) and a larger batch,
+# the learning rate being scaled by lr_scaling (see scaled_learning_rate).
+# model is "separate" (the k11 and k33 networks of the paper), "joint" (one network, see
+# train_joint) or "compare" (both, then their test accuracy side by side; the joint outputs get a joint_ prefix).
+# The trained network is recorded as the one to serve (numpy_model.select_served_model); after
+# "compare" it is serve, the separate networks by default.
+def main(fast=False, batch_size=None, lr_scaling="sqrt", intra_op_threads=None, inter_op_threads=None,
+         steps_per_execution=16, model="separate", loss_weights=(1.0, 1.0), serve="separate"):
+    configure_threads(intra_op_threads, inter_op_threads)
+    if batch_size is None:
+        batch_size = FAST_BATCH_SIZE if fast else BASE_BATCH_SIZE
+    model_options = {}
+    if fast:
+        model_options = {"learning_rate": scaled_learning_rate(batch_size, lr_scaling), "jit_compile": True,
+                         "steps_per_execution": steps_per_execution}
+        print(f"Fast mode: batch size {batch_size}, learning rate {model_options['learning_rate']:.2e}")
+
+    X_scaled, targets = load_splits()
+    save_dir = os.path.join(os.path.dirname(__file__), "saved_model")
+    os.makedirs(save_dir, exist_ok=True)
+
+    results = {}
+    if model in ("separate", "compare"):
+        results["separate"] = train_separate(X_scaled, targets, save_dir, fast, batch_size, model_options)
+    if model in ("joint", "compare"):
+        results["joint"] = train_joint(X_scaled, targets, save_dir, fast, batch_size, model_options, loss_weights,
+                                       prefix="joint_" if model == "compare" else "")
+
+    # Serve what was just trained, not whichever network happens to be in saved_model/
+    numpy_model.select_served_model(serve if model == "compare" else model, save_dir)
+
+    # NumPy copy of the saved models for TensorFlow-free serving (api.py, Prediction.py).
+    # A bundle that does not match the Keras models is removed, so they serve the Keras models.
+    numpy_model.export()
+    if not numpy_model.check():
+        os.remove(os.path.join(numpy_model.BUNDLE_DIR, "manifest.json"))
+        print("Removed the NumPy bundle: api.py and Prediction.py will use the Keras models")
+
+    if model == "compare":
+        print_comparison(targets, results)
+    else:
+        # For R^2 Values
+        predictions, _ = results[model]
+        for target in TARGETS:
+            r2 = r2_score(targets[target][2], predictions[target].flatten())
+            print(f"R² score for {target}: {r2:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the k11 and k33 networks on data.csv")
+    parser.add_argument("--model", choices=["separate", "joint", "compare"], default="separate",
+                        help="separate k11 and k33 networks (default), one joint network, "
+                             "or both with a comparison of their test accuracy")
+    parser.add_argument("--serve", choices=["separate", "joint"], default="separate",
+                        help="Network api.py and Prediction.py serve after --model compare (default: separate)")
+    parser.add_argument("--loss-weights", type=float, nargs=2, default=(1.0, 1.0), metavar=("K11", "K33"),
+                        help="Weights of the k11 and k33 losses of the joint network (default: 1 1)")
+    parser.add_argument("--fast", action="store_true",
+                        help="High-throughput training: tf.data pipeline, XLA-compiled steps and a larger batch")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help=f"Batch size (default: {BASE_BATCH_SIZE}, {FAST_BATCH_SIZE} with --fast)")
+    parser.add_argument("--lr-scaling", choices=["sqrt", "linear", "none"], default="sqrt",
+                        help=f"Learning rate rule of --fast, from {BASE_LEARNING_RATE} at batch size "
+                             f"{BASE_BATCH_SIZE} (default: sqrt)")
+    parser.add_argument("--steps-per-execution", type=int, default=16,
+                        help="Train steps run per call into TensorFlow with --fast (default: 16)")
+    parser.add_argument("--intra-op-threads", type=int, default=None,
+                        help="Threads used inside one op (default: TensorFlow's choice, all cores)")
+    parser.add_argument("--inter-op-threads", type=int, default=None,
+                        help="Ops run concurrently (default: TensorFlow's choice)")
+    args = parser.parse_args()
+    main(args.fast, args.batch_size, args.lr_scaling, args.intra_op_threads, args.inter_op_threads,
+         args.steps_per_execution, args.model, tuple(args.loss_weights), args.serve)
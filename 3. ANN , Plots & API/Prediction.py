@@ -1,9 +1,19 @@
-import tensorflow as tf
+import os
 import numpy as np
+from numpy_model import NumpyModel, served_model
 
-# Load the saved model
-loaded_modelk11 = tf.keras.models.load_model('saved_model/my_model_k11.keras')
-loaded_modelk33 = tf.keras.models.load_model('saved_model/my_model_k33.keras')
+# Load the saved model: the NumPy bundle when it was exported (no TensorFlow needed), else
+# the network FinalANN.py selected for serving: the joint k11/k33 network or both networks
+joint_model = None
+if os.path.exists('saved_model/numpy_bundle/manifest.json'):
+    joint_model = NumpyModel('saved_model/numpy_bundle')
+elif served_model('saved_model') == 'joint':
+    import tensorflow as tf
+    joint_model = tf.keras.models.load_model('saved_model/my_model_joint.keras')
+else:
+    import tensorflow as tf
+    loaded_modelk11 = tf.keras.models.load_model('saved_model/my_model_k11.keras')
+    loaded_modelk33 = tf.keras.models.load_model('saved_model/my_model_k33.keras')
 
 # Prepare new input data
 new_inputs = np.array([
@@ -12,8 +22,13 @@ new_inputs = np.array([
 ])
 
 # Make predictions
-predictionsk11 = loaded_modelk11.predict(new_inputs)
+if joint_model is not None:
+    # One forward pass, columns k11 and k33
+    predictions = joint_model.predict(new_inputs)
+    predictionsk11 = predictions[:, :1]
+    predictionsk33 = predictions[:, 1:]
+else:
+    predictionsk11 = loaded_modelk11.predict(new_inputs)
+    predictionsk33 = loaded_modelk33.predict(new_inputs)
 print("Predictions:", predictionsk11)
-
-predictionsk33 = loaded_modelk33.predict(new_inputs)
 print("Predictions:", predictionsk33)
@@ -1,49 +1,194 @@
 import os
+import time
+import threading
+from concurrent.futures import TimeoutError as PredictionTimeout
 import numpy as np
-import tensorflow as tf
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+from numpy_model import NumpyModel, BUNDLE_DIR, served_model
+from batcher import MicroBatcher
+from prediction_cache import PredictionCache
 
 app = Flask(__name__)
+# Largest number of geometries accepted by /predict_batch
+app.config["MAX_BATCH_SIZE"] = int(os.environ.get("PREDICT_MAX_BATCH_SIZE", 10000))
+# Rows per chunk of the streamed /predict_batch response
+app.config["STREAM_CHUNK_ROWS"] = 1000
+# Micro-batching of concurrent /predict calls: rows per forward pass and longest wait for more rows
+app.config["MICRO_BATCH_SIZE"] = int(os.environ.get("PREDICT_MICRO_BATCH_SIZE", 64))
+app.config["MICRO_BATCH_LATENCY_MS"] = float(os.environ.get("PREDICT_MICRO_BATCH_LATENCY_MS", 2.0))
+# Longest wait of a /predict call for its batched result before it is answered with 503
+app.config["PREDICT_TIMEOUT_S"] = float(os.environ.get("PREDICT_TIMEOUT_S", 10.0))
+# LRU cache of /predict results: entries (0 disables it) and decimals the scaled inputs are rounded to
+app.config["CACHE_SIZE"] = int(os.environ.get("PREDICT_CACHE_SIZE", 4096))
+app.config["CACHE_DECIMALS"] = int(os.environ.get("PREDICT_CACHE_DECIMALS", 6))
+# Seconds between checks of the model files for a newer version
+app.config["MODEL_CHECK_INTERVAL"] = float(os.environ.get("PREDICT_MODEL_CHECK_INTERVAL", 5.0))
 
 # Automatically get absolute path to saved models
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 model_k11_path = os.path.join(BASE_DIR, "saved_model", "my_model_k11.keras")
 model_k33_path = os.path.join(BASE_DIR, "saved_model", "my_model_k33.keras")
+model_joint_path = os.path.join(BASE_DIR, "saved_model", "my_model_joint.keras")
 
-# Load models
-model_k11 = tf.keras.models.load_model(model_k11_path)
-model_k33 = tf.keras.models.load_model(model_k33_path)
+cache = PredictionCache(app.config["CACHE_SIZE"], app.config["CACHE_DECIMALS"])
 
-# Custom scaling function
+# Model files the API serves: the NumPy bundle (numpy_model.py, written by FinalANN.py), which runs
+# without TensorFlow, else the network FinalANN.py selected (numpy_model.served_model): the joint
+# network or the k11 and k33 networks
+def model_artifacts():
+    bundle_manifest = os.path.join(BUNDLE_DIR, "manifest.json")
+    if os.path.exists(bundle_manifest):
+        return [bundle_manifest]
+    if served_model(os.path.dirname(model_joint_path)) == "joint":
+        return [model_joint_path]
+    return [model_k11_path, model_k33_path]
+
+# Version of the model files: their names and modification times
+def artifact_version():
+    return ";".join(f"{os.path.basename(path)}@{os.path.getmtime(path):.6f}" for path in model_artifacts())
+
+engine = model_joint = model_k11 = model_k33 = None
+model_version = None
+_model_lock = threading.Lock()
+_last_check = time.monotonic()
+
+# Load models (again) and empty the prediction cache
+def load_models():
+    global engine, model_joint, model_k11, model_k33, model_version
+    version = artifact_version()
+    artifacts = model_artifacts()
+    if artifacts[0].endswith("manifest.json"):
+        engine = NumpyModel(BUNDLE_DIR)
+    else:
+        import tensorflow as tf
+        if artifacts == [model_joint_path]:
+            model_joint = tf.keras.models.load_model(model_joint_path)
+        else:
+            model_k11 = tf.keras.models.load_model(model_k11_path)
+            model_k33 = tf.keras.models.load_model(model_k33_path)
+            model_joint = None
+        engine = None
+    model_version = version
+    cache.clear(version)
+
+# Reload the models when their files changed, checked at most every MODEL_CHECK_INTERVAL seconds.
+# A file still being written fails to load and is tried again at the next check.
+def check_models():
+    global _last_check
+    if time.monotonic() - _last_check < app.config["MODEL_CHECK_INTERVAL"]:
+        return
+    with _model_lock:
+        if time.monotonic() - _last_check < app.config["MODEL_CHECK_INTERVAL"]:
+            return
+        _last_check = time.monotonic()
+        try:
+            if artifact_version() != model_version:
+                load_models()
+                app.logger.info(f"Loaded models {model_version}")
+        except Exception as e:
+            app.logger.warning(f"Keeping the current models, reloading failed: {e}")
+
+load_models()
+
+# k11 and k33 of the scaled input rows, in one forward pass with the bundle or the joint network
+def predict_k(X_scaled):
+    if engine is not None:
+        k = engine.predict(X_scaled)
+        return k[:, 0], k[:, 1]
+    if model_joint is not None:
+        k = model_joint.predict(X_scaled, verbose=0)
+        return k[:, 0], k[:, 1]
+    return model_k11.predict(X_scaled, verbose=0)[:, 0], model_k33.predict(X_scaled, verbose=0)[:, 0]
+
+# Concurrent /predict requests share forward passes (see batcher.py); each result row is [k11, k33]
+batcher = MicroBatcher(lambda X_scaled: np.column_stack(predict_k(X_scaled)),
+                       app.config["MICRO_BATCH_SIZE"], app.config["MICRO_BATCH_LATENCY_MS"] / 1000)
+
+# Custom scaling function (one input row, or an (n, 6) array of rows)
 def custom_scale(X):
     X_scaled = X.copy()
-    X_scaled[0] = 0.2 + X[0] * (0.8 - 0.2)       # vf
-    X_scaled[1] = 0.2 + X[1] * (0.95 - 0.2)      # width (Wy/Sy)
-    X_scaled[2] = 0.008 + X[2] * (0.5 - 0.008)   # thickness (Ty/Sy)
+    X_scaled[..., 0] = 0.2 + X[..., 0] * (0.8 - 0.2)       # vf
+    X_scaled[..., 1] = 0.2 + X[..., 1] * (0.95 - 0.2)      # width (Wy/Sy)
+    X_scaled[..., 2] = 0.008 + X[..., 2] * (0.5 - 0.008)   # thickness (Ty/Sy)
     return X_scaled
 
+# Input columns of the models: accepted names (first one found is used) and default value
+BATCH_FIELDS = [
+    (("vf", "fiber_volume_fraction"), None),
+    (("yarn_width", "width"), None),
+    (("yarn_thickness", "thickness"), None),
+    (("p", "spacing"), 1.0),
+    (("t", "textile_thickness"), 1.0),
+    (("h", "height"), 1.0),
+]
+
+# Function to turn a /predict_batch body into an (n, 6) float array of unscaled inputs.
+# The body is columnar ({"vf": [...], "width": [...], ...}) or a list of records, given as is
+# or as {"records": [...]}; a /predict body is a list of one record. Raises ValueError with a
+# message for the client.
+def batch_inputs(data):
+    if isinstance(data, dict) and "records" in data:
+        data = data["records"]
+    if isinstance(data, list):
+        n = len(data)
+        columns = []
+        for names, default in BATCH_FIELDS:
+            column = []
+            for row, record in enumerate(data):
+                if not isinstance(record, dict):
+                    raise ValueError(f"record {row} is not a JSON object")
+                name = next((name for name in names if name in record), None)
+                if name is None and default is None:
+                    raise ValueError(f"record {row}: missing field '{names[0]}'")
+                column.append(default if name is None else record[name])
+            columns.append(column)
+    elif isinstance(data, dict):
+        n = None
+        found = []
+        for names, default in BATCH_FIELDS:
+            name = next((name for name in names if name in data), None)
+            if name is None and default is None:
+                raise ValueError(f"missing field '{names[0]}'")
+            if name is not None:
+                if not isinstance(data[name], list):
+                    raise ValueError(f"field '{name}' must be an array")
+                if n is not None and len(data[name]) != n:
+                    raise ValueError(f"field '{name}' has {len(data[name])} values, expected {n}")
+                n = len(data[name])
+            found.append(name)
+        columns = [data[name] if name is not None else [default] * n
+                   for name, (_, default) in zip(found, BATCH_FIELDS)]
+    else:
+        raise ValueError("expected a JSON object of arrays or a list of records")
+
+    try:
+        X = np.array(columns, dtype=np.float64).T.reshape(n, len(BATCH_FIELDS))
+    except (TypeError, ValueError):
+        raise ValueError("all fields must be numbers")
+    bad = ~np.isfinite(X).all(axis=1)
+    if bad.any():
+        raise ValueError(f"non-finite input in row {int(np.argmax(bad))}")
+    return X
+
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
-        data = request.get_json()
-
-        # Extract input features
-        vf = float(data.get('vf', data['fiber_volume_fraction']))
-        width = float(data.get('yarn_width', data['width']))
-        thickness = float(data.get('yarn_thickness', data['thickness']))
-        thickness = float(data['thickness'])
-        p = float(data.get('p', data.get('spacing', 1.0)))
-        t = float(data.get('t', data.get('textile_thickness', 1.0)))
-        h = float(data.get('h', data.get('height', 1.0)))
-
-        # Create input array and scale
-        X_input = np.array([vf, width, thickness, p, t, h])
+        # Extract input features (same fields and defaults as a /predict_batch record) and scale
+        X_input = batch_inputs([request.get_json()])[0]
         X_scaled = custom_scale(X_input)
-        X_scaled = X_scaled.reshape(1, -1)
 
-        # Predict k11 and k33
-        k11_pred = float(model_k11.predict(X_scaled)[0][0])
-        k33_pred = float(model_k33.predict(X_scaled)[0][0])
+        # Predict k11 and k33 (from the cache, else batched with the other requests in flight)
+        check_models()
+        version = model_version
+        key = cache.key(X_scaled)
+        k = cache.get(key=key)
+        if k is None:
+            try:
+                k = batcher.predict(X_scaled, timeout=app.config["PREDICT_TIMEOUT_S"])
+            except PredictionTimeout:
+                return jsonify({"error": "prediction timed out, the server is overloaded or stalled"}), 503
+            cache.put(value=k, version=version, key=key)
+        k11_pred, k33_pred = (float(value) for value in k)
 
         return jsonify({
             "k11": round(k11_pred, 6),
@@ -53,5 +198,59 @@ def predict():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+# Predictions for many geometries at once: the inputs are checked and scaled as one array and both
+# conductivities come from one batched forward pass. The response {"n": ..., "k11": [...], "k33": [...]}
+# is streamed in chunks of STREAM_CHUNK_ROWS rows.
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    try:
+        X_input = batch_inputs(request.get_json())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    if len(X_input) > app.config["MAX_BATCH_SIZE"]:
+        return jsonify({"error": f"batch of {len(X_input)} rows is above the limit of "
+                                 f"{app.config['MAX_BATCH_SIZE']}"}), 413
+
+    check_models()
+    if len(X_input):
+        k11, k33 = predict_k(custom_scale(X_input))
+    else:
+        k11 = k33 = np.empty(0)
+    chunk = app.config["STREAM_CHUNK_ROWS"]
+
+    def generate():
+        yield f'{{"n": {len(X_input)}'
+        for name, values in (("k11", k11), ("k33", k33)):
+            values = np.round(values.astype(np.float64), 6).tolist()
+            yield f', "{name}": ['
+            for start in range(0, len(values), chunk):
+                yield ("," if start else "") + ",".join(map(repr, values[start:start + chunk]))
+            yield "]"
+        yield "}"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+# Liveness probe: the process answers requests
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "alive", "pid": os.getpid()})
+
+# Readiness probe: the models are loaded and predict a probe geometry
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    try:
+        k11, k33 = predict_k(custom_scale(np.array([[0.5, 0.5, 0.5, 1.0, 0.0, 0.0]])))
+        if not (np.isfinite(k11).all() and np.isfinite(k33).all()):
+            raise ValueError("the probe prediction is not finite")
+    except Exception as e:
+        return jsonify({"status": "not ready", "error": str(e)}), 503
+    return jsonify({"status": "ready", "model_version": model_version})
+
+# Serving counters of this process
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({"batcher": batcher.stats(), "cache": cache.stats(), "model_version": model_version})
+
+# Development server (see serve.py for production); FLASK_DEBUG=1 turns on the debugger and reloader
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1")
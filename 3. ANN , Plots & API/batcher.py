@@ -0,0 +1,114 @@
+"""
+Dynamic micro-batching of concurrent single-row predictions.
+
+Every request thread hands its input row to MicroBatcher.predict and blocks on the result.
+One background thread takes the first waiting row, keeps collecting rows until max_batch
+are queued or max_latency has passed since that first row arrived, runs them as one
+batched forward pass, and fans the result rows back out to the waiting callers. Under
+light load a request waits at most max_latency; under heavy load the model sees full batches.
+
+    batcher = MicroBatcher(lambda X: np.column_stack(predict_k(X)), max_batch=64, max_latency=0.002)
+    k11, k33 = batcher.predict(X_scaled_row)
+
+The thread is started on first use in each process, so a batcher created before a server
+forks its workers works in every worker, and started again if it died. predict takes a timeout
+so a caller is not left waiting on a stalled batch.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+
+
+class MicroBatcher:
+    """Coalesces concurrent predict calls into batched calls of predict_fn (rows -> one result row each)."""
+
+    def __init__(self, predict_fn, max_batch=64, max_latency=0.002):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._queue = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._stats = {"requests": 0, "batches": 0, "errors": 0, "max_queue_depth": 0,
+                       "queue_wait_s": 0.0, "batch_sizes": {}}
+
+    def _ensure_thread(self):
+        # After a fork the queue may hold the parent's state and the thread is gone
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._reset_stats()
+                self._pid = os.getpid()
+            elif self._thread.is_alive():
+                return
+            # Rows queued for a thread that died are picked up by the new one
+            self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, row):
+        """Queue one input row; returns a Future of its result row."""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((np.asarray(row), future, time.perf_counter()))
+        depth = self._queue.qsize()
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], depth)
+        return future
+
+    def predict(self, row, timeout=None):
+        """Result row of row; raises concurrent.futures.TimeoutError after timeout seconds."""
+        return self.submit(row).result(timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.max_latency
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the deadline, still take the rows that are already waiting
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            try:
+                results = self.predict_fn(np.stack([row for row, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                results = None
+            with self._lock:
+                stats = self._stats
+                stats["batches"] += 1
+                stats["errors"] += results is None
+                stats["queue_wait_s"] += sum(start - queued for _, _, queued in batch)
+                stats["batch_sizes"][len(batch)] = stats["batch_sizes"].get(len(batch), 0) + 1
+            if results is not None:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+
+    def stats(self):
+        """Counters of this process: requests, batches, queue depth now and at most, mean batch size and wait."""
+        with self._lock:
+            stats = dict(self._stats, batch_sizes=dict(sorted(self._stats["batch_sizes"].items())))
+        queued = sum(size * count for size, count in stats["batch_sizes"].items())
+        stats["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        stats["mean_batch_size"] = queued / stats["batches"] if stats["batches"] else 0.0
+        stats["mean_queue_wait_ms"] = 1e3 * stats.pop("queue_wait_s") / queued if queued else 0.0
+        stats.update(max_batch=self.max_batch, max_latency_ms=1e3 * self.max_latency)
+        return stats
@@ -0,0 +1,170 @@
+"""
+Load test of the prediction API: latency percentiles and throughput per concurrency level.
+
+Each level runs `concurrency` client threads, each with its own keep-alive connection,
+posting requests back to back for --duration seconds (after a short warm-up). The report
+gives requests/s, p50/p95/p99 latency and errors per level; /stats of the server is printed
+at the end (micro-batch sizes, cache hit rate of the worker that answers it).
+
+    python serve.py --workers 4 &
+    python bench_api.py --url http://127.0.0.1:8000 --concurrency 1 8 32 64
+    python bench_api.py --spawn --workers 4 --threads 16     # start serve.py for the run
+    python bench_api.py --endpoint /predict_batch --rows 256 # batch requests of 256 geometries
+    python bench_api.py --distinct 20                        # 20 geometries repeated (cache hits)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+import http.client
+import urllib.request
+from urllib.parse import urlparse
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# Function to make the request bodies: n_payloads random geometries (unit-cube inputs, one weave
+# column set), each a /predict record or, with rows > 1, a columnar /predict_batch body
+def make_payloads(n_payloads, rows=1, seed=0):
+    rng = np.random.default_rng(seed)
+    bodies = []
+    for _ in range(n_payloads):
+        X = rng.uniform(size=(rows, 3))
+        weave = np.eye(3)[rng.integers(0, 3, rows)]
+        if rows == 1:
+            record = dict(zip(["vf", "width", "thickness", "p", "t", "h"], map(float, np.r_[X[0], weave[0]])))
+            bodies.append(json.dumps(record).encode())
+        else:
+            columns = {"vf": X[:, 0], "width": X[:, 1], "thickness": X[:, 2],
+                       "p": weave[:, 0], "t": weave[:, 1], "h": weave[:, 2]}
+            bodies.append(json.dumps({name: values.tolist() for name, values in columns.items()}).encode())
+    return bodies
+
+
+def _client(url, endpoint, bodies, offset, start_at, stop_at, latencies, errors):
+    """One client thread: posts bodies back to back on a keep-alive connection until stop_at."""
+    target = urlparse(url)
+    conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+    headers = {"Content-Type": "application/json"}
+    i = offset
+    while True:
+        now = time.perf_counter()
+        if now >= stop_at:
+            break
+        body = bodies[i % len(bodies)]
+        i += 1
+        try:
+            conn.request("POST", endpoint, body, headers)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        if now >= start_at:  # requests of the warm-up are not counted
+            if ok:
+                latencies.append(time.perf_counter() - now)
+            else:
+                errors.append(now)
+    conn.close()
+
+
+def run_level(url, endpoint, bodies, concurrency, duration, warmup=1.0):
+    """Load the API with concurrency clients; returns the measurements of the level."""
+    latencies, errors = [], []
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+    threads = [threading.Thread(target=_client, daemon=True,
+                                args=(url, endpoint, bodies, n * 7919, start_at, stop_at, latencies, errors))
+               for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = {"concurrency": concurrency, "requests": len(latencies), "errors": len(errors),
+              "requests_per_s": len(latencies) / duration}
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+        result.update(p50_ms=p50, p95_ms=p95, p99_ms=p99, max_ms=1e3 * max(latencies))
+    return result
+
+
+def wait_ready(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + "/readyz", timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the conductivity prediction API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server to test (default: :8000)")
+    parser.add_argument("--spawn", action="store_true", help="Start serve.py on the --url port for the run")
+    parser.add_argument("--workers", type=int, default=None, help="Workers of the spawned serve.py")
+    parser.add_argument("--threads", type=int, default=None, help="Threads per worker of the spawned serve.py")
+    parser.add_argument("--endpoint", default="/predict", choices=["/predict", "/predict_batch"],
+                        help="Endpoint to load (default: /predict)")
+    parser.add_argument("--rows", type=int, default=None,
+                        help="Geometries per /predict_batch request (default: 100)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64],
+                        help="Concurrent clients per level (default: 1 4 16 64)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per level (default: 10)")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Unmeasured seconds per level (default: 1)")
+    parser.add_argument("--distinct", type=int, default=10000,
+                        help="Different request bodies cycled through; few means many cache hits (default: 10000)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the geometries")
+    parser.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    rows = 1 if args.endpoint == "/predict" else (args.rows or 100)
+    bodies = make_payloads(args.distinct, rows, args.seed)
+
+    server = None
+    if args.spawn:
+        command = [sys.executable, os.path.join(HERE, "serve.py"), "--port", str(urlparse(args.url).port or 80)]
+        if args.workers:
+            command += ["--workers", str(args.workers)]
+        if args.threads:
+            command += ["--threads", str(args.threads)]
+        server = subprocess.Popen(command, cwd=HERE)
+    try:
+        if not wait_ready(args.url):
+            sys.exit(f"{args.url}/readyz did not answer")
+        print(f"{args.endpoint}, {rows} geometr{'y' if rows == 1 else 'ies'} per request, "
+              f"{len(bodies)} distinct bodies, {args.duration:g}s per level")
+        print(f"{'clients':>7} {'req/s':>9} {'rows/s':>10} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'errors':>7}")
+        results = []
+        for concurrency in args.concurrency:
+            result = run_level(args.url, args.endpoint, bodies, concurrency, args.duration, args.warmup)
+            result["rows_per_s"] = result["requests_per_s"] * rows
+            results.append(result)
+            if result["requests"]:
+                print(f"{concurrency:>7} {result['requests_per_s']:>9.1f} {result['rows_per_s']:>10.1f} "
+                      f"{result['p50_ms']:>7.2f}ms {result['p95_ms']:>7.2f}ms {result['p99_ms']:>7.2f}ms "
+                      f"{result['max_ms']:>7.1f}ms {result['errors']:>7}")
+            else:
+                print(f"{concurrency:>7} {'no successful requests':>50} {result['errors']:>7}")
+        with urllib.request.urlopen(args.url + "/stats", timeout=5) as response:
+            stats = json.loads(response.read())
+        print("\nServer /stats (one worker):", json.dumps(stats))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"options": vars(args), "results": results, "stats": stats}, f, indent=1)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
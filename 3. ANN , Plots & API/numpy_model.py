@@ -0,0 +1,270 @@
+"""
+NumPy inference of the FinalANN networks, so predictions can be served without TensorFlow.
+
+export() writes a bundle directory from the Keras models in saved_model/:
+    manifest.json        format version, feature and target names, the custom_scale constants,
+                         and the layer graph with the position of every kernel and bias
+    weights-<hash>.npy   all kernels and biases as one flat float32 array
+NumpyModel memory-maps the weights file, so loading a bundle is a file open and processes
+serving the same bundle share its pages. The manifest is replaced last, so a reader never
+sees a half-written bundle.
+
+The graph is a trunk of Dense layers shared by all targets, then one chain of Dense layers per
+target, optionally followed by an affine rescale. The separate k11 / k33 networks have an
+empty trunk; the joint network of FinalANN.build_joint_model has its trunk_* layers, shared.
+Like api.py, the export takes the network FinalANN.py selected for serving (served_model).
+
+    python numpy_model.py export                 # saved_model/ -> saved_model/numpy_bundle, then check
+    python numpy_model.py check --tol 1e-4       # parity of the bundle against the Keras models
+    python numpy_model.py predict 0.4 0.8 0.1 1 0 0
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+
+FORMAT = "woven-ann-mlp"
+VERSION = 1
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SAVED_MODEL_DIR = os.path.join(BASE_DIR, "saved_model")
+BUNDLE_DIR = os.path.join(SAVED_MODEL_DIR, "numpy_bundle")
+# Which of the saved networks is served, written by FinalANN.py
+SERVED_FILE = "served_model.json"
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+ACTIVATIONS = {"linear": lambda x: x, "relu": _relu, "tanh": np.tanh, "sigmoid": _sigmoid}
+
+
+class NumpyModel:
+    """Forward pass of an exported bundle; predict returns (n, len(targets)) like the joint Keras model."""
+
+    def __init__(self, bundle_dir=BUNDLE_DIR):
+        self.bundle_dir = bundle_dir
+        with open(os.path.join(bundle_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT:
+            raise ValueError(f"{bundle_dir} is not a {FORMAT} bundle")
+        if manifest.get("version", 0) > VERSION:
+            raise ValueError(f"Bundle version {manifest['version']} is newer than this reader ({VERSION})")
+        self.manifest = manifest
+        self.features = manifest["features"]
+        self.targets = manifest["targets"]
+        self.scale_offset = np.asarray(manifest["scale"]["offset"], dtype=np.float32)
+        self.scale_factor = np.asarray(manifest["scale"]["factor"], dtype=np.float32)
+
+        weights = np.load(os.path.join(bundle_dir, manifest["weights"]), mmap_mode="r")
+        self.trunk = [self._layer(spec, weights) for spec in manifest["trunk"]]
+        self.heads = []
+        for target in self.targets:
+            head = manifest["heads"][target]
+            self.heads.append(([self._layer(spec, weights) for spec in head["layers"]], head.get("rescale")))
+
+    @staticmethod
+    def _layer(spec, weights):
+        start, rows, cols = spec["kernel"]
+        kernel = weights[start:start + rows * cols].reshape(rows, cols)
+        start, n = spec["bias"]
+        if spec["activation"] not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation '{spec['activation']}'")
+        return kernel, weights[start:start + n], ACTIVATIONS[spec["activation"]]
+
+    def scale(self, X):
+        """Inputs in the unit cube (data.csv columns) -> physical ranges, as FinalANN.custom_scale."""
+        return np.asarray(X, dtype=np.float32) * self.scale_factor + self.scale_offset
+
+    def predict(self, X_scaled):
+        """Conductivities of the (n, 6) scaled inputs, one column per target."""
+        x = np.asarray(X_scaled, dtype=np.float32).reshape(-1, len(self.features))
+        for kernel, bias, activation in self.trunk:
+            x = activation(x @ kernel + bias)
+        columns = []
+        for layers, rescale in self.heads:
+            y = x
+            for kernel, bias, activation in layers:
+                y = activation(y @ kernel + bias)
+            if rescale is not None:
+                y = y * rescale[0] + rescale[1]
+            columns.append(y)
+        return np.concatenate(columns, axis=1)
+
+
+def served_model(saved_model_dir=SAVED_MODEL_DIR):
+    """
+    "separate" or "joint": the network of saved_model_dir that is served, as recorded by
+    select_served_model. Without a record, the separate networks unless only the joint one was saved.
+    """
+    try:
+        with open(os.path.join(saved_model_dir, SERVED_FILE)) as f:
+            kind = json.load(f).get("model")
+    except (OSError, ValueError, AttributeError):
+        kind = None
+    if kind in ("separate", "joint"):
+        return kind
+    if (not os.path.exists(os.path.join(saved_model_dir, "my_model_k11.keras"))
+            and os.path.exists(os.path.join(saved_model_dir, "my_model_joint.keras"))):
+        return "joint"
+    return "separate"
+
+
+def select_served_model(kind, saved_model_dir=SAVED_MODEL_DIR):
+    """Record that the kind ("separate" or "joint") network of saved_model_dir is the one to serve."""
+    if kind not in ("separate", "joint"):
+        raise ValueError(f"Unknown model kind '{kind}'")
+    tmp = os.path.join(saved_model_dir, SERVED_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"model": kind}, f)
+    os.replace(tmp, os.path.join(saved_model_dir, SERVED_FILE))
+
+
+# ---------------------------------------------------------------------------
+# Export and parity check (these need TensorFlow)
+# ---------------------------------------------------------------------------
+
+def _keras_models(saved_model_dir):
+    """("joint", model) or ("separate", {target: model}) of saved_model_dir, whichever is served."""
+    import tensorflow as tf
+    from FinalANN import TARGETS
+    if served_model(saved_model_dir) == "joint":
+        return "joint", tf.keras.models.load_model(os.path.join(saved_model_dir, "my_model_joint.keras"))
+    return "separate", {target: tf.keras.models.load_model(os.path.join(saved_model_dir, f"my_model_{target}.keras"))
+                        for target in TARGETS}
+
+
+def _numbered(model, prefix):
+    """Layers named prefix0, prefix1, ... of model, in order."""
+    layers = [layer for layer in model.layers
+              if layer.name.startswith(prefix) and layer.name[len(prefix):].isdigit()]
+    return sorted(layers, key=lambda layer: int(layer.name[len(prefix):]))
+
+
+def export(bundle_dir=BUNDLE_DIR, saved_model_dir=SAVED_MODEL_DIR):
+    """Write the bundle of the Keras models in saved_model_dir; returns the manifest."""
+    from FinalANN import FEATURES, TARGETS, custom_scale
+    kind, models = _keras_models(saved_model_dir)
+
+    arrays, offset = [], 0
+
+    def add(array):
+        nonlocal offset
+        array = np.asarray(array, dtype=np.float32)
+        arrays.append(array.ravel())
+        offset += array.size
+        return offset - array.size
+
+    def dense(layer):
+        if type(layer).__name__ != "Dense":
+            raise ValueError(f"Layer {layer.name} ({type(layer).__name__}) cannot be exported, only Dense layers")
+        kernel, bias = layer.get_weights()
+        return {"name": layer.name, "kernel": [add(kernel), *kernel.shape], "bias": [add(bias), len(bias)],
+                "activation": layer.activation.__name__}
+
+    if kind == "joint":
+        trunk = [dense(layer) for layer in _numbered(models, "trunk_")]
+        heads = {}
+        for target in TARGETS:
+            layers = _numbered(models, f"{target}_hidden_") + [models.get_layer(target)]
+            rescale = models.get_layer(f"{target}_physical").get_config()
+            heads[target] = {"layers": [dense(layer) for layer in layers],
+                             "rescale": [float(rescale["scale"]), float(rescale["offset"])]}
+    else:
+        trunk = []
+        heads = {target: {"layers": [dense(layer) for layer in models[target].layers]} for target in TARGETS}
+
+    # custom_scale is affine per column: its constants are its values at 0 and 1
+    zero = custom_scale(np.zeros((1, len(FEATURES))))[0]
+    one = custom_scale(np.ones((1, len(FEATURES))))[0]
+
+    weights = np.concatenate(arrays)
+    digest = hashlib.sha256(weights.tobytes()).hexdigest()[:16]
+    manifest = {"format": FORMAT, "version": VERSION, "source": kind, "created": time.time(),
+                "features": FEATURES, "targets": TARGETS, "weights": f"weights-{digest}.npy",
+                "scale": {"offset": zero.tolist(), "factor": (one - zero).tolist()},
+                "trunk": trunk, "heads": heads}
+
+    os.makedirs(bundle_dir, exist_ok=True)
+    np.save(os.path.join(bundle_dir, manifest["weights"]), weights)
+    tmp = os.path.join(bundle_dir, "manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(bundle_dir, "manifest.json"))
+    # Weights of earlier exports (a process still mapping one keeps reading it). Windows refuses to
+    # delete a mapped file: it is left for a later export to remove.
+    for name in os.listdir(bundle_dir):
+        if name.startswith("weights-") and name != manifest["weights"]:
+            try:
+                os.remove(os.path.join(bundle_dir, name))
+            except OSError:
+                pass
+    print(f"Exported the {kind} model{'s' if kind == 'separate' else ''} to {bundle_dir} "
+          f"({weights.nbytes / 1024:.1f} kB of weights)")
+    return manifest
+
+
+def check(bundle_dir=BUNDLE_DIR, saved_model_dir=SAVED_MODEL_DIR, n_samples=2000, tol=1e-4, seed=0):
+    """Compare the bundle with the Keras models on random inputs; True if every relative difference is within tol."""
+    engine = NumpyModel(bundle_dir)
+    kind, models = _keras_models(saved_model_dir)
+
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(size=(n_samples, len(engine.features)))
+    X[:, 3:] = np.eye(3)[rng.integers(0, 3, n_samples)]  # one weave column set
+    X_scaled = engine.scale(X)
+
+    def keras_predict(inputs):
+        if kind == "joint":
+            return models.predict(inputs, verbose=0)
+        return np.column_stack([models[target].predict(inputs, verbose=0).ravel() for target in engine.targets])
+
+    reference = keras_predict(X_scaled)
+    result = engine.predict(X_scaled)
+    diff = np.abs(result - reference) / np.maximum(np.abs(reference), 1e-6)
+    for column, target in enumerate(engine.targets):
+        print(f"{target}: largest relative difference {diff[:, column].max():.2E} over {n_samples} inputs")
+
+    timings = {}
+    for name, predict in (("keras", keras_predict), ("numpy", engine.predict)):
+        for rows in (1, n_samples):
+            start = time.perf_counter()
+            predict(X_scaled[:rows])
+            timings[name, rows] = time.perf_counter() - start
+    print(f"1 row: keras {1e3 * timings['keras', 1]:.2f}ms, numpy {1e3 * timings['numpy', 1]:.3f}ms; "
+          f"{n_samples} rows: keras {1e3 * timings['keras', n_samples]:.2f}ms, "
+          f"numpy {1e3 * timings['numpy', n_samples]:.2f}ms")
+    ok = bool(diff.max() <= tol)
+    print("Parity OK" if ok else f"Parity FAILED (tolerance {tol:.0E})")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and run the FinalANN networks with NumPy only")
+    parser.add_argument("command", choices=["export", "check", "predict"],
+                        help="export: write the bundle and check it; check: parity with Keras; "
+                             "predict: k of one input row")
+    parser.add_argument("inputs", type=float, nargs="*",
+                        help="predict: vf width thickness p t h, in the unit-cube scale of data.csv")
+    parser.add_argument("--bundle", default=BUNDLE_DIR, help="Bundle directory (default: saved_model/numpy_bundle)")
+    parser.add_argument("--models", default=SAVED_MODEL_DIR, help="Keras model directory (default: saved_model)")
+    parser.add_argument("--tol", type=float, default=1e-4,
+                        help="Largest accepted relative difference to Keras (default: 1e-4)")
+    args = parser.parse_args()
+
+    if args.command == "predict":
+        engine = NumpyModel(args.bundle)
+        if len(args.inputs) != len(engine.features):
+            parser.error(f"predict takes {len(engine.features)} inputs: {' '.join(engine.features)}")
+        k = engine.predict(engine.scale(args.inputs))[0]
+        print(", ".join(f"{target}={value:.6f}" for target, value in zip(engine.targets, k)))
+    else:
+        if args.command == "export":
+            export(args.bundle, args.models)
+        sys.exit(0 if check(args.bundle, args.models, tol=args.tol) else 1)
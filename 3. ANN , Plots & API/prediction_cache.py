@@ -0,0 +1,76 @@
+"""
+Bounded LRU cache of model predictions, keyed on the scaled input row.
+
+The key is the row after custom_scale rounded to `decimals` places, so requests for the same
+geometry hit the cache even when the client formats the numbers differently. Every entry
+belongs to a model version: clear(version) empties the cache when a new model is loaded, and
+a result computed by the previous model (a request in flight during the reload) is not stored.
+
+    cache = PredictionCache(max_entries=4096, decimals=6)
+    k = cache.get(row)
+    if k is None:
+        k = model(row)
+        cache.put(row, k, version)
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class PredictionCache:
+    """Thread-safe LRU map from quantized input rows to result rows, with hit/miss counters."""
+
+    def __init__(self, max_entries=4096, decimals=6, version=None):
+        self.max_entries = max_entries
+        self.decimals = decimals
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def key(self, row):
+        # + 0.0 turns -0.0 into 0.0
+        return (np.round(np.asarray(row, dtype=np.float64), self.decimals) + 0.0).tobytes()
+
+    def get(self, row=None, key=None):
+        """Cached result of row (or of a precomputed key), None on a miss."""
+        if self.max_entries <= 0:
+            return None
+        key = self.key(row) if key is None else key
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, row=None, value=None, version=None, key=None):
+        """Store the result of row, unless it was computed by another model version than the current one."""
+        if self.max_entries <= 0:
+            return
+        key = self.key(row) if key is None else key
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, version=None):
+        """Drop every entry; the cache then belongs to model version."""
+        with self._lock:
+            self._entries.clear()
+            self.version = version
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "decimals": self.decimals,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "invalidations": self.invalidations, "version": self.version}
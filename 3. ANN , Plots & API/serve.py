@@ -0,0 +1,85 @@
+"""
+Production serving of api.py: gunicorn managing threaded (gthread) WSGI workers.
+
+Every worker process runs --threads request threads, so the concurrent /predict calls of a
+worker are in flight together and are micro-batched into one forward pass (batcher.py).
+
+When the NumPy bundle (numpy_model.py) exists, the app is imported once in the gunicorn master
+before it forks the workers: the workers then share the memory-mapped weights instead of each
+loading its own copy. The Keras models are never loaded before the fork, since TensorFlow is not
+fork-safe: without a bundle every worker imports the app, and so loads the models, itself.
+
+    pip install gunicorn
+    python serve.py --workers 4 --threads 16 --port 8000
+    curl localhost:8000/readyz
+
+Probes: GET /healthz (liveness) and GET /readyz (models loaded and predicting).
+Without gunicorn (e.g. on Windows) one waitress process with --threads threads is started
+instead (pip install waitress).
+"""
+import os
+import argparse
+
+from numpy_model import BUNDLE_DIR
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # gunicorn is POSIX only
+    BaseApplication = None
+
+
+if BaseApplication is not None:
+    class PreforkServer(BaseApplication):
+        """gunicorn serving api.app with options given in code; the app is imported by load()."""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # In the master with preload_app, else in every worker after the fork
+            from api import app
+            return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the conductivity prediction API with threaded workers")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8000, help="Port (default: 8000)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes (default: one per core)")
+    parser.add_argument("--threads", type=int, default=16,
+                        help="Request threads per worker, i.e. concurrent requests it batches (default: 16)")
+    parser.add_argument("--timeout", type=int, default=30,
+                        help="Seconds before a silent worker is restarted (default: 30)")
+    parser.add_argument("--keepalive", type=int, default=5,
+                        help="Seconds an idle keep-alive connection is held (default: 5)")
+    args = parser.parse_args()
+
+    if BaseApplication is None:
+        import waitress
+        from api import app
+        print("gunicorn is not available, serving from one waitress process")
+        waitress.serve(app, host=args.host, port=args.port, threads=args.threads,
+                       channel_timeout=args.keepalive)
+        return
+    preload = os.path.exists(os.path.join(BUNDLE_DIR, "manifest.json"))
+    if not preload:
+        print("No NumPy bundle: every worker loads the Keras models itself (TensorFlow is not fork-safe)")
+    PreforkServer({
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        "preload_app": preload,
+        "timeout": args.timeout,
+        "keepalive": args.keepalive,
+        "loglevel": "warning",
+    }).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from sklearn.metrics import r2_score
+
+import FinalANN
+from FinalANN import TARGETS, load_splits, configure_threads, training_callbacks, build_model
+
+
+# Hyperparameter sweep of the FinalANN networks
+# --------------------------------------------
+# Every combination of the search space (or --trials random ones) is trained for each target
+# in a process pool. The training and validation data are put once in shared memory and the
+# workers read them from there instead of receiving a copy with every trial. Each worker gets
+# an equal share of the cores for its TensorFlow thread pools.
+#
+# Trials report their best validation loss every few epochs to a progress file shared by the
+# workers; a trial whose loss is worse than the median of the other trials of its target at the
+# same epoch is pruned (stopped). The test split of FinalANN is not used, so the leaderboard can
+# be checked against it afterwards.
+#
+# Output in --out: leaderboard.csv (all trials, best first), trials/ with the model of every
+# completed trial and best_k11.keras / best_k33.keras.
+
+# Search space of the sweep (a JSON file with the same keys replaces it)
+DEFAULT_SPACE = {
+    "hidden_layers": [[32, 32], [64, 32], [64, 64], [128, 64], [128, 128], [64, 64, 32]],
+    "learning_rate": [1e-3, 5e-4, 2.5e-4],
+    "batch_size": [64, 256],
+    "patience": [15, 30],
+    "epochs": [180],
+}
+
+# Pruning: first check after PRUNE_WARMUP epochs, then every PRUNE_EVERY epochs, once at least
+# PRUNE_MIN_TRIALS other trials have reached the same epoch
+PRUNE_WARMUP = 20
+PRUNE_EVERY = 10
+PRUNE_MIN_TRIALS = 4
+
+LEADERBOARD_COLUMNS = ["trial", "target", "status", "val_loss", "val_mae", "val_r2", "epochs_run", "seconds",
+                       "hidden_layers", "learning_rate", "batch_size", "patience", "epochs"]
+
+
+# Function to list the trials of a search space: every combination, or n_trials drawn at random
+def make_trials(space, targets=TARGETS, n_trials=None, seed=0):
+    keys = list(space)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+    if n_trials is not None and n_trials < len(combos):
+        rng = np.random.default_rng(seed)
+        combos = [combos[i] for i in sorted(rng.choice(len(combos), n_trials, replace=False))]
+    return [dict(config, trial=number, target=target)
+            for number, (target, config) in enumerate(itertools.product(targets, combos))]
+
+
+# Function to put the train and validation splits in one shared memory block:
+# rows are the training then the validation samples, columns the scaled features then TARGETS
+def share_data(X_scaled, targets):
+    block = np.column_stack([np.vstack(X_scaled[:2])]
+                            + [np.concatenate(targets[target][:2]) for target in TARGETS])
+    shm = shared_memory.SharedMemory(create=True, size=block.nbytes)
+    np.ndarray(block.shape, block.dtype, buffer=shm.buf)[:] = block
+    return shm, block.shape, len(X_scaled[0])
+
+
+# Worker state: the shared data block and the progress file
+_shared = {}
+
+def _init_worker(shm_name, shape, n_train, n_threads, progress_file):
+    # Threads must be set before the first TensorFlow op of the process
+    configure_threads(n_threads, 1)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared.update(shm=shm, data=np.ndarray(shape, np.float64, buffer=shm.buf), n_train=n_train,
+                   progress_file=progress_file)
+
+
+# Median pruning of a trial from the best validation losses the trials append to progress_file
+class MedianPruner(FinalANN.tf.keras.callbacks.Callback):
+    def __init__(self, trial, target, progress_file, warmup=PRUNE_WARMUP, every=PRUNE_EVERY,
+                 min_trials=PRUNE_MIN_TRIALS):
+        super().__init__()
+        self.trial, self.target, self.progress_file = trial, target, progress_file
+        self.warmup, self.every, self.min_trials = warmup, every, min_trials
+        self.best = np.inf
+        self.pruned = False
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.best = min(self.best, (logs or {}).get("val_loss", np.inf))
+        epoch += 1
+        if epoch < self.warmup or (epoch - self.warmup) % self.every:
+            return
+        with open(self.progress_file, "a") as f:
+            f.write(json.dumps({"trial": self.trial, "target": self.target, "epoch": epoch,
+                                "best": float(self.best)}) + "\n")
+        others = []
+        with open(self.progress_file) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # line still being written by another worker
+                if record["target"] == self.target and record["epoch"] == epoch and record["trial"] != self.trial:
+                    others.append(record["best"])
+        if len(others) >= self.min_trials and self.best > np.median(others):
+            self.pruned = True
+            self.model.stop_training = True
+
+
+# Function to train one trial in a worker; returns its leaderboard row
+def run_trial(trial, out_dir, seed=0):
+    data, n_train = _shared["data"], _shared["n_train"]
+    n_features = len(FinalANN.FEATURES)
+    column = n_features + TARGETS.index(trial["target"])
+    X_train, y_train = data[:n_train, :n_features], data[:n_train, column]
+    X_val, y_val = data[n_train:, :n_features], data[n_train:, column]
+
+    FinalANN.tf.keras.utils.set_random_seed(seed + trial["trial"])
+    model = build_model(trial["hidden_layers"], trial["learning_rate"])
+    pruner = MedianPruner(trial["trial"], trial["target"], _shared["progress_file"])
+    start = time.perf_counter()
+    history = model.fit(X_train, y_train, epochs=trial["epochs"], batch_size=trial["batch_size"],
+                        validation_data=(X_val, y_val), verbose=0,
+                        callbacks=list(training_callbacks(trial["patience"], trial["patience"] // 2, verbose=0))
+                        + [pruner])
+    seconds = time.perf_counter() - start
+
+    row = dict(trial, status="pruned" if pruner.pruned else "complete", val_loss=pruner.best,
+               epochs_run=len(history.history["loss"]), seconds=seconds)
+    if not pruner.pruned:
+        y_pred = model.predict(X_val, verbose=0).ravel()
+        row.update(val_mae=float(np.mean(np.abs(y_pred - y_val))), val_r2=float(r2_score(y_val, y_pred)))
+        model.save(os.path.join(out_dir, "trials", f"{trial['trial']:04d}_{trial['target']}.keras"))
+    return row
+
+
+# Function to write the leaderboard: completed trials first, then by validation loss, per target
+def write_leaderboard(rows, path):
+    board = pd.DataFrame(rows, columns=LEADERBOARD_COLUMNS)
+    board["pruned"] = board["status"] != "complete"
+    board = board.sort_values(["target", "pruned", "val_loss"]).drop(columns="pruned")
+    board.to_csv(path, index=False)
+    return board
+
+
+def run(space, out_dir="sweep", targets=TARGETS, n_trials=None, n_workers=None, seed=0):
+    n_workers = n_workers or os.cpu_count()
+    trials = make_trials(space, targets, n_trials, seed)
+    os.makedirs(os.path.join(out_dir, "trials"), exist_ok=True)
+    progress_file = os.path.join(out_dir, "progress.jsonl")
+    if os.path.exists(progress_file):
+        os.remove(progress_file)
+    print(f"{len(trials)} trials on {n_workers} workers")
+
+    X_scaled, target_splits = load_splits()
+    shm, shape, n_train = share_data(X_scaled, target_splits)
+    rows = []
+    try:
+        # spawn: TensorFlow is not safe to use in a forked child
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker,
+                                 initargs=(shm.name, shape, n_train, max(1, os.cpu_count() // n_workers),
+                                           progress_file)) as pool:
+            futures = {pool.submit(run_trial, trial, out_dir, seed): trial for trial in trials}
+            for future in as_completed(futures):
+                trial = futures[future]
+                try:
+                    row = future.result()
+                except Exception as e:
+                    print(f"Trial {trial['trial']} ({trial['target']}) failed: {e}")
+                    continue
+                rows.append(row)
+                print(f"[{len(rows)}/{len(trials)}] trial {row['trial']} {row['target']} "
+                      f"{row['hidden_layers']} lr={row['learning_rate']} batch={row['batch_size']}: "
+                      f"{row['status']}, val_loss={row['val_loss']:.3E} after {row['epochs_run']} epochs")
+                write_leaderboard(rows, os.path.join(out_dir, "leaderboard.csv"))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    board = write_leaderboard(rows, os.path.join(out_dir, "leaderboard.csv"))
+    for target in targets:
+        complete = board[(board["target"] == target) & (board["status"] == "complete")]
+        if complete.empty:
+            continue
+        best = complete.iloc[0]
+        shutil.copy(os.path.join(out_dir, "trials", f"{best['trial']:04d}_{target}.keras"),
+                    os.path.join(out_dir, f"best_{target}.keras"))
+        print(f"\nBest {target}: {best['hidden_layers']} lr={best['learning_rate']} batch={best['batch_size']} "
+              f"patience={best['patience']}: val_loss={best['val_loss']:.3E}, val R²={best['val_r2']:.4f}")
+        print(complete.head(5)[["trial", "hidden_layers", "learning_rate", "batch_size", "val_loss",
+                                "val_r2"]].to_string(index=False))
+    print(f"\nLeaderboard in {os.path.join(out_dir, 'leaderboard.csv')}")
+    return board
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep of the FinalANN networks")
+    parser.add_argument("--space", default=None,
+                        help="JSON search space with lists for hidden_layers, learning_rate, batch_size, "
+                             "patience and epochs (default: DEFAULT_SPACE)")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS,
+                        help="Conductivities to tune a network for (default: k11 k33)")
+    parser.add_argument("--trials", type=int, default=None,
+                        help="Random combinations to try per target (default: the whole grid)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Trials trained in parallel (default: one per core)")
+    parser.add_argument("--out", default="sweep", help="Output directory (default: sweep)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the trial draw and the weights")
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = dict(DEFAULT_SPACE, **json.load(f))
+    run(space, args.out, args.targets, args.trials, args.workers, args.seed)